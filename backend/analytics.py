@@ -0,0 +1,230 @@
+"""Widget analytics ingestion: a bounded ring buffer flushed in batches.
+
+Events are kept in a fixed-size deque, so memory stays flat however many
+storefront events arrive; when the flusher falls behind, the oldest
+buffered events are overwritten and counted. Each flush inserts the raw
+events into ``analytics_events`` and adds them to the per-merchant,
+per-type hourly counters in ``analytics_hourly`` in the same transaction.
+Raw events are pruned after ``ANALYTICS_RETENTION_DAYS``; the counters are
+kept and back the dashboard queries.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import AnalyticsEvent, AnalyticsHourly, SessionLocal
+
+MAX_TYPE_CHARS = 64
+MAX_DETAILS_CHARS = 2000
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class AnalyticsPipeline:
+    """Buffer widget events in memory and write them with their hourly rollups."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        capacity: int = 50000,
+        batch_size: int = 1000,
+        interval: float = 2.0,
+        retention_days: float = 30.0,
+        store_events: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retention = timedelta(days=retention_days)
+        self.store_events = store_events
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.buffer = deque(maxlen=self.capacity)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pruned_at = 0.0
+        self.recorded = 0
+        self.overwritten = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _after_fork(self):
+        # Events buffered in the parent are flushed by the parent.
+        running = self.thread is not None
+        self._reset()
+        if running:
+            self.start()
+
+    def _event(self, merchant_id, event_type, details, timestamp):
+        """Validated event tuple, or None."""
+        if not isinstance(event_type, str) or not event_type or len(event_type) > MAX_TYPE_CHARS:
+            return None
+        if details is not None and not isinstance(details, str):
+            try:
+                details = json.dumps(details, separators=(",", ":"), default=str)
+            except (TypeError, ValueError):
+                return None
+        return (
+            str(merchant_id or ""),
+            event_type,
+            details[:MAX_DETAILS_CHARS] if details else None,
+            timestamp or datetime.utcnow(),
+        )
+
+    def _append(self, events):
+        with self.lock:
+            room = self.capacity - len(self.buffer)
+            if len(events) > room:
+                self.overwritten += len(events) - room
+            self.buffer.extend(events)
+            self.recorded += len(events)
+
+    def record(self, merchant_id: str, event_type: str, details=None, timestamp: datetime = None) -> bool:
+        """Buffer one event; returns False for an event that fails validation."""
+        event = self._event(merchant_id, event_type, details, timestamp)
+        if event is None:
+            return False
+        self._append([event])
+        return True
+
+    def record_many(self, merchant_id: str, events) -> int:
+        """Buffer (type, details, timestamp) triples; returns how many were valid."""
+        valid = [e for e in (self._event(merchant_id, *event) for event in events) if e is not None]
+        if valid:
+            self._append(valid)
+        return len(valid)
+
+    def flush(self):
+        """Write buffered events, one transaction per batch."""
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                if not batch:
+                    return
+                try:
+                    self._write(batch)
+                except Exception:
+                    traceback.print_exc()
+                    self.failed += len(batch)
+                    return
+                self.written += len(batch)
+                self.batches += 1
+
+    def _write(self, batch):
+        counts = defaultdict(int)
+        for merchant_id, event_type, _, ts in batch:
+            counts[(merchant_id, event_type, hour_bucket(ts))] += 1
+        rollups = [
+            {"merchant_id": mid, "type": event_type, "hour": hour, "count": n}
+            for (mid, event_type, hour), n in counts.items()
+        ]
+        stmt = insert(AnalyticsHourly)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["merchant_id", "type", "hour"],
+            set_={"count": AnalyticsHourly.count + stmt.excluded.count},
+        )
+        with self.session_factory() as db:
+            if self.store_events:
+                db.execute(
+                    AnalyticsEvent.__table__.insert(),
+                    [
+                        {"merchant_id": mid, "type": event_type, "details": details, "timestamp": ts}
+                        for mid, event_type, details, ts in batch
+                    ],
+                )
+            db.execute(stmt, rollups)
+            db.commit()
+
+    def prune(self):
+        """Delete raw events older than the retention period (rollups are kept)."""
+        cutoff = datetime.utcnow() - self.retention
+        with self.session_factory() as db:
+            db.execute(delete(AnalyticsEvent).where(AnalyticsEvent.timestamp < cutoff))
+            db.commit()
+
+    def counts(self, merchant_id: str, since: datetime, until: datetime = None, types=None, bucket: str = "hour"):
+        """Event counts per ``bucket`` ("hour" or "day") and type, oldest first."""
+        until = until or datetime.utcnow()
+        with self.session_factory() as db:
+            q = db.query(AnalyticsHourly.hour, AnalyticsHourly.type, AnalyticsHourly.count).filter(
+                AnalyticsHourly.merchant_id == merchant_id,
+                AnalyticsHourly.hour >= hour_bucket(since),
+                AnalyticsHourly.hour <= until,
+            )
+            if types:
+                q = q.filter(AnalyticsHourly.type.in_(list(types)))
+            rows = q.order_by(AnalyticsHourly.hour).all()
+        series = defaultdict(int)
+        for hour, event_type, n in rows:
+            key = hour.replace(hour=0) if bucket == "day" else hour
+            series[(key, event_type)] += n
+        return [
+            {"bucket": key.isoformat(), "type": event_type, "count": n}
+            for (key, event_type), n in series.items()
+        ]
+
+    def recent(self, merchant_id: str, limit: int = 50):
+        """Latest raw events still within the retention period."""
+        with self.session_factory() as db:
+            rows = (
+                db.query(AnalyticsEvent)
+                .filter_by(merchant_id=merchant_id)
+                .order_by(AnalyticsEvent.timestamp.desc())
+                .limit(limit)
+                .all()
+            )
+            return [
+                {"timestamp": e.timestamp.isoformat(), "type": e.type, "details": e.details}
+                for e in rows
+            ]
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+            if time.monotonic() - self.pruned_at > 3600:
+                self.pruned_at = time.monotonic()
+                try:
+                    self.prune()
+                except Exception:
+                    traceback.print_exc()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            buffered = len(self.buffer)
+        return {
+            "buffered": buffered,
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "overwritten": self.overwritten,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
@@ -0,0 +1,96 @@
+"""LRU + TTL cache of complete LLM answers for repeated shopper questions."""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+from search import normalize_question
+
+CachedAnswer = namedtuple("CachedAnswer", ["answer", "expires", "size", "elapsed", "tokens"])
+
+
+class AnswerCache:
+    """Per-merchant answer cache bounded by entry count and approximate bytes."""
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 5000, max_bytes: int = 8 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.generations = defaultdict(int)
+        self.epoch = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+        self.lock = threading.Lock()
+
+    def key(self, merchant_id: str, message: str, context: str):
+        """Build a cache key from the merchant, normalized message and context."""
+        digest = hashlib.sha1(context.encode("utf-8")).hexdigest()
+        with self.lock:
+            generation = (self.epoch, self.generations[merchant_id])
+        return (merchant_id, generation, normalize_question(message), digest)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.expires < now:
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.elapsed
+            self.saved_tokens += entry.tokens
+            return entry
+
+    def put(self, key, answer: str, elapsed: float = 0.0):
+        size = len(answer.encode("utf-8")) + len(key[2]) + 64
+        if size > self.max_bytes:
+            return
+        entry = CachedAnswer(answer, time.monotonic() + self.ttl, size, elapsed, len(answer.split()))
+        with self.lock:
+            if key[1] != (self.epoch, self.generations[key[0]]):
+                return
+            self._pop(key)
+            self.entries[key] = entry
+            self.bytes += size
+            while self.entries and (
+                len(self.entries) > self.max_entries or self.bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self.entries)))
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def invalidate(self, merchant_id: str):
+        """Drop every cached answer for ``merchant_id``."""
+        with self.lock:
+            self.generations[merchant_id] += 1
+            for key in [k for k in self.entries if k[0] == merchant_id]:
+                self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0,
+                "savedSeconds": round(self.saved_seconds, 3),
+                "savedTokens": self.saved_tokens,
+            }
@@ -1,6 +1,8 @@
 import os
+import threading
+import time
 import traceback
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from flask import (
     Flask,
     request,
@@ -12,7 +14,6 @@ from flask import (
     redirect,
     session,
 )
-import sqlite3
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -20,8 +21,6 @@ import openai
 from dotenv import load_dotenv
 import requests
 import json
-from bs4 import BeautifulSoup
-import difflib
 from datetime import datetime, timedelta
 import stripe
 from models import (
@@ -30,7 +29,6 @@ from models import (
     SessionLocal,
     init_db as init_sqlalchemy_db,
     Merchant,
-    Product,
     ErrorLog,
     Plan,
     Subscription,
@@ -41,6 +39,25 @@ from models import (
     DiscountCode,
     MerchantCredit,
 )
+from analytics import AnalyticsPipeline
+from answer_cache import AnswerCache
+from bot_content import BotContentCache, SHARED_FAQS
+from chatlog import ConversationLogWriter
+from catalog_sync import sync_catalog
+from crawler import Crawler
+from entitlements import EntitlementCache
+from jobs import JobError, JobQueue
+from llm_client import ClientManager
+from metering import UsageMeter
+from product_extract import extract_page
+from quota import QuotaEngine
+from sharding import merchant_session, router as shard_router
+from shopify_sync import ShopifyClient
+from woocommerce_sync import WooCommerceClient
+from widget_assets import BootstrapBundles, WidgetAssets, negotiate
+from widget_config import WidgetConfigCache
+from usage_report import PERIODS, current_usage, merchant_history, since_bucket, totals_by_bucket
+from search import catalog, catalog_version, get_index, refresh_index, snapshot_stats
 from sqlalchemy import func
 import uuid
 import re
@@ -103,22 +120,6 @@ def index():
     """Public landing page with navigation."""
     return render_template("landing.html")
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'bots.db')
-
-
-def init_sqlite_tables():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "CREATE TABLE IF NOT EXISTS bots (name TEXT PRIMARY KEY, welcome_message TEXT)"
-    )
-    conn.execute(
-        "CREATE TABLE IF NOT EXISTS faqs (id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT UNIQUE, answer TEXT)"
-    )
-    conn.commit()
-    conn.close()
-
-
-init_sqlite_tables()
 init_sqlalchemy_db()
 
 
@@ -202,94 +203,107 @@ def get_subscription(merchant_id: str):
         return sub, plan
 
 
-def usage_record(db, merchant_id: str):
+UsageTotals = namedtuple("UsageTotals", ["tokens", "requests", "month"])
+
+
+def usage_totals(merchant_id: str) -> UsageTotals:
+    """Current-month usage including deltas still buffered in the meter."""
     month = current_month()
-    rec = (
-        db.query(MerchantUsage)
-        .filter_by(merchant_id=merchant_id, month=month)
-        .first()
-    )
-    if not rec:
-        rec = MerchantUsage(merchant_id=merchant_id, month=month)
-        db.add(rec)
-        db.commit()
-    return rec
+    with merchant_session(merchant_id) as db:
+        rec = (
+            db.query(MerchantUsage)
+            .filter_by(merchant_id=merchant_id, month=month)
+            .first()
+        )
+    tokens, requests = usage_meter.pending(merchant_id, month)
+    if rec:
+        tokens += rec.tokens or 0
+        requests += rec.requests or 0
+    return UsageTotals(tokens, requests, month)
 
 
-def total_credit_tokens(db, merchant_id: str) -> int:
-    credits = db.query(MerchantCredit).filter_by(merchant_id=merchant_id).all()
-    return sum(c.tokens - c.used_tokens for c in credits)
+# Other workers pick up welcome and FAQ writes after at most this many seconds.
+FAQ_RELOAD_SECONDS = int(os.getenv("FAQ_RELOAD_SECONDS", "60"))
+bot_content = BotContentCache(ttl=FAQ_RELOAD_SECONDS, faq_threshold=0.6)
 
 
-def consume_credits(db, merchant_id: str, tokens: int):
-    credits = (
-        db.query(MerchantCredit)
-        .filter_by(merchant_id=merchant_id)
-        .order_by(MerchantCredit.id)
-        .all()
-    )
-    remaining = tokens
-    for c in credits:
-        available = c.tokens - c.used_tokens
-        if available <= 0:
-            continue
-        take = min(available, remaining)
-        c.used_tokens += take
-        remaining -= take
-        if remaining <= 0:
-            break
-    db.commit()
+def get_welcome(merchant_id: str) -> str:
+    return bot_content.welcome(merchant_id)
 
-def get_welcome(bot_name: str) -> str:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.execute(
-        "SELECT welcome_message FROM bots WHERE name=?",
-        (bot_name,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row[0] if row else ""
 
+def save_welcome(merchant_id: str, message: str):
+    bot_content.save_welcome(merchant_id, message)
+    widget_config.invalidate(merchant_id)
 
-def save_welcome(bot_name: str, message: str):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "INSERT INTO bots (name, welcome_message) VALUES (?, ?)"
-        " ON CONFLICT(name) DO UPDATE SET welcome_message=excluded.welcome_message",
-        (bot_name, message),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_faqs():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.execute("SELECT id, question, answer FROM faqs")
-    rows = cur.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "question": r[1], "answer": r[2]}
-        for r in rows
-    ]
 
+def get_faqs(merchant_id: str = SHARED_FAQS):
+    return bot_content.faqs(merchant_id)
 
-def add_faq(question: str, answer: str):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "INSERT OR REPLACE INTO faqs (question, answer) VALUES (?, ?)",
-        (question, answer),
-    )
-    conn.commit()
-    conn.close()
 
+def add_faq(merchant_id: str, question: str, answer: str):
+    bot_content.add_faq(merchant_id, question, answer)
+    if merchant_id:
+        answer_cache.invalidate(merchant_id)
+    else:
+        answer_cache.clear()
 
 
-# Track session level stats
+answer_cache = AnswerCache(
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+)
+REPLAY_CHUNK_CHARS = 64
+
+
+def catalog_changed(merchant_id: str):
+    """Rebuild the product index and drop cached answers after a sync."""
+    refresh_index(merchant_id)
+    answer_cache.invalidate(merchant_id)
+    entitlements.invalidate(merchant_id)
+
+
+def match_faq(merchant_id: str, message: str):
+    """Return the stored FAQ closest to ``message`` or None."""
+    return bot_content.match_faq(merchant_id, message)
+
+
+
+entitlements = EntitlementCache(ttl=float(os.getenv("ENTITLEMENT_TTL", "30")))
+usage_meter = UsageMeter(
+    interval=float(os.getenv("USAGE_FLUSH_SECONDS", "2")),
+    on_flush=lambda merchant_ids: [entitlements.invalidate(mid) for mid in merchant_ids],
+)
+usage_meter.start()
+chat_log = ConversationLogWriter(
+    max_queue=int(os.getenv("CHAT_LOG_QUEUE", "10000")),
+    batch_size=int(os.getenv("CHAT_LOG_BATCH", "500")),
+)
+chat_log.start()
+job_queue = JobQueue()
+analytics_pipeline = AnalyticsPipeline(
+    capacity=int(os.getenv("ANALYTICS_BUFFER", "50000")),
+    batch_size=int(os.getenv("ANALYTICS_BATCH", "1000")),
+    interval=float(os.getenv("ANALYTICS_FLUSH_SECONDS", "2")),
+    retention_days=float(os.getenv("ANALYTICS_RETENTION_DAYS", "30")),
+    store_events=os.getenv("ANALYTICS_STORE_EVENTS", "1") == "1",
+)
+analytics_pipeline.start()
+quota = QuotaEngine(usage_meter, default_estimate=int(os.getenv("QUOTA_ESTIMATE_TOKENS", "300")))
+
 # Track session level stats
 session_usage = defaultdict(lambda: {"requests": 0, "tokens": 0})
 # Track sessions that mentioned the cart but didn't checkout
 abandoned_cart_flags = defaultdict(bool)
 
+def record_exchange(merchant_id: str, session_id: str, user_message: str, answer: str, faq: bool = False):
+    """Charge usage and log a chat answered without a live LLM stream."""
+    token_count = len(answer.split())
+    session_usage[session_id]["tokens"] += token_count
+    usage_meter.record(merchant_id, current_month(), tokens=token_count, requests=1, faq_hits=int(faq))
+    chat_log.append(merchant_id, session_id, user_message, answer)
+
+
 def current_month():
     return datetime.utcnow().strftime("%Y-%m")
 # In-memory store for configuration and extended stats
@@ -316,8 +330,6 @@ merchant_configs = {
     }
 }
 
-# In-memory analytics store
-analytics_events = defaultdict(list)
 templates = {"welcome": "", "abandoned_cart": "", "faq": ""}
 SHOPIFY_STOREFRONT_TOKEN = os.getenv("SHOPIFY_STOREFRONT_TOKEN")
 SHOPIFY_STORE_DOMAIN = os.getenv("SHOPIFY_STORE_DOMAIN")
@@ -329,51 +341,60 @@ stats = {
 }
 
 
-def sync_custom_html_products(merchant_id: str):
-    """Fetch product data from a custom HTML store."""
+# Crawl budget and politeness limits for custom HTML stores.
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "0.1"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "3000"))
+CRAWL_MAX_SECONDS = float(os.getenv("CRAWL_MAX_SECONDS", "600"))
+
+
+def set_sync_status(merchant_id: str, status: str):
+    with SessionLocal() as db:
+        m = db.query(Merchant).get(merchant_id)
+        if m:
+            m.product_sync_status = status
+            db.commit()
+
+
+def crawl_html_store(merchant_id: str):
+    """Crawl a custom HTML store for products (run from the job queue)."""
     with SessionLocal() as db:
         m = db.query(Merchant).get(merchant_id)
         if not m or not (m.store_domain or m.store_url or m.cart_url):
             return
+        start = m.store_url or m.cart_url or m.store_domain
         m.product_sync_status = "syncing"
         db.commit()
-        products = []
-        base = m.store_url or m.cart_url
-        if not base and m.store_domain:
-            base = f"https://{m.store_domain}"
-        try:
-            resp = requests.get(base, timeout=10)
-            soup = BeautifulSoup(resp.text, "html.parser")
-            products.extend(_extract_products(soup, base))
-
-            links = [a["href"] for a in soup.find_all("a", href=True) if "product" in a["href"]]
-            for link in links[:3]:
-                url = link if link.startswith("http") else base.rstrip("/") + "/" + link.lstrip("/")
-                try:
-                    r = requests.get(url, timeout=10)
-                    soup2 = BeautifulSoup(r.text, "html.parser")
-                    products.extend(_extract_products(soup2, url))
-                except Exception:
-                    pass
-
-            db.query(Product).filter_by(merchant_id=merchant_id).delete()
-            for p in products:
-                db.add(
-                    Product(
-                        merchant_id=merchant_id,
-                        title=p.get("title"),
-                        description=p.get("description"),
-                        price=p.get("price"),
-                        image_url=p.get("image"),
-                        url=p.get("url"),
-                    )
-                )
-            m.product_sync_status = "success"
-            m.product_last_synced = datetime.utcnow()
-        except Exception:
-            m.product_sync_status = "error"
-        finally:
-            db.commit()
+    crawler = Crawler(
+        extract_page,
+        workers=CRAWL_WORKERS,
+        per_host=CRAWL_PER_HOST,
+        delay=CRAWL_DELAY,
+        max_pages=CRAWL_MAX_PAGES,
+        max_seconds=CRAWL_MAX_SECONDS,
+        on_progress=lambda pages, found: set_sync_status(
+            merchant_id, f"syncing ({pages} pages, {found} products)"
+        ),
+    )
+    try:
+        result = crawler.crawl(start)
+    except Exception as exc:
+        capture_exception(exc)
+        set_sync_status(merchant_id, "error")
+        return
+    if not result.products and result.errors:
+        # Keep the old catalog when the store could not be reached.
+        set_sync_status(merchant_id, "error")
+        return
+    with merchant_session(merchant_id) as db:
+        summary = sync_catalog(db, merchant_id, result.products)
+        m = db.query(Merchant).get(merchant_id)
+        m.product_sync_status = "success"
+        m.product_last_synced = datetime.utcnow()
+        db.commit()
+    catalog_changed(merchant_id)
+    return summary
 
 
 def sync_api_products(merchant_id: str):
@@ -382,55 +403,59 @@ def sync_api_products(merchant_id: str):
         m = db.query(Merchant).get(merchant_id)
         if not m or not m.store_url or not m.api_key:
             return
-        m.product_sync_status = "syncing"
+        store, api_type, api_key, api_secret = m.store_url, m.api_type, m.api_key, m.api_secret
+    if api_type == "woocommerce":
+        return sync_woocommerce_catalog(merchant_id, store, api_key, api_secret)
+    with merchant_session(merchant_id) as db:
+        summary = sync_catalog(db, merchant_id, [])
+        m = db.query(Merchant).get(merchant_id)
+        m.product_sync_status = "success"
+        m.product_last_synced = datetime.utcnow()
         db.commit()
-        products = []
+    catalog_changed(merchant_id)
+    return summary
+
+
+# Between full syncs WooCommerce stores are only asked for recent changes.
+WOO_FULL_SYNC_HOURS = float(os.getenv("WOO_FULL_SYNC_HOURS", "24"))
+WOO_SYNC_OVERLAP = timedelta(minutes=5)
+woo_syncs = {}
+woo_syncs_lock = threading.Lock()
+
+
+def sync_woocommerce_catalog(merchant_id: str, store: str, api_key: str = None, api_secret: str = None):
+    """Sync a WooCommerce catalog; incremental (modified_after) between full syncs."""
+    set_sync_status(merchant_id, "syncing")
+    started = datetime.utcnow()
+    with woo_syncs_lock:
+        last = woo_syncs.get(merchant_id)
+    since = None
+    if last and last["store"] == store and started - last["full_at"] < timedelta(hours=WOO_FULL_SYNC_HOURS):
+        since = (last["started_at"] - WOO_SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S")
+    client = WooCommerceClient(store, api_key, api_secret)
+    summary = None
+    with merchant_session(merchant_id) as db:
         try:
-            if m.api_type == "woocommerce":
-                params = {}
-                if m.api_secret:
-                    params = {"consumer_key": m.api_key, "consumer_secret": m.api_secret}
-                    resp = requests.get(
-                        f"https://{m.store_url}/wp-json/wc/v3/products",
-                        params=params,
-                        timeout=10,
-                    )
-                else:
-                    resp = requests.get(
-                        f"https://{m.store_url}/wp-json/wc/v3/products",
-                        headers={"Authorization": f"Bearer {m.api_key}"},
-                        timeout=10,
-                    )
-                for p in resp.json()[:10]:
-                    img = p.get("images")
-                    products.append(
-                        {
-                            "title": p.get("name"),
-                            "description": p.get("description"),
-                            "price": p.get("price"),
-                            "link": p.get("permalink"),
-                            "image_url": img[0].get("src") if img else None,
-                        }
-                    )
-
-            db.query(Product).filter_by(merchant_id=merchant_id).delete()
-            for p in products:
-                db.add(
-                    Product(
-                        merchant_id=merchant_id,
-                        title=p.get("title"),
-                        description=p.get("description"),
-                        price=p.get("price"),
-                        image_url=p.get("image_url"),
-                        url=p.get("link"),
-                    )
-                )
+            summary = sync_catalog(db, merchant_id, client.iter_products(since), prune=since is None)
+        except Exception as exc:
+            capture_exception(exc)
+            db.rollback()
+        m = db.query(Merchant).get(merchant_id)
+        if summary is None:
+            m.product_sync_status = "error"
+        else:
             m.product_sync_status = "success"
             m.product_last_synced = datetime.utcnow()
-        except Exception:
-            m.product_sync_status = "error"
-        finally:
-            db.commit()
+        db.commit()
+    if summary is not None:
+        with woo_syncs_lock:
+            woo_syncs[merchant_id] = {
+                "store": store,
+                "started_at": started,
+                "full_at": last["full_at"] if since else started,
+            }
+    catalog_changed(merchant_id)
+    return summary
 
 
 def sync_products_for_merchant(merchant_id: str):
@@ -440,12 +465,80 @@ def sync_products_for_merchant(merchant_id: str):
         method = m.product_method if m else None
         api_type = m.api_type if m else None
     if method == "html":
-        sync_custom_html_products(merchant_id)
+        return crawl_html_store(merchant_id)
     elif method == "api":
         if api_type == "shopify":
-            sync_shopify_products(merchant_id)
-        else:
-            sync_api_products(merchant_id)
+            return sync_shopify_products(merchant_id)
+        return sync_api_products(merchant_id)
+
+
+# A queued sync is only replaced by a request for one at least as thorough,
+# so a stale-catalog check never downgrades a pending Sync Products or crawl.
+PRODUCT_SYNC_RANK = {"settings": 0, "store": 1, "crawl": 2}
+
+
+def more_complete_sync(queued: dict, requested: dict) -> bool:
+    rank = PRODUCT_SYNC_RANK.get
+    return rank(requested.get("source"), 0) >= rank(queued.get("source"), 0)
+
+
+def enqueue_product_sync(merchant_id: str, source: str = "store"):
+    """Queue a catalog sync; requests made while one is pending coalesce into it.
+
+    ``source`` picks the sync: "store" (store_type settings), "settings"
+    (product awareness settings) or "crawl" (custom HTML crawl). One sync
+    per merchant is queued or running at a time.
+    """
+    return job_queue.enqueue(
+        "product_sync",
+        merchant_id,
+        {"source": source},
+        dedupe_key=f"product_sync:{merchant_id}",
+        replace=more_complete_sync,
+    )
+
+
+def run_product_sync(merchant_id: str, payload: dict):
+    source = payload.get("source")
+    if source == "settings":
+        summary = sync_products_for_merchant(merchant_id)
+    elif source == "crawl":
+        summary = crawl_html_store(merchant_id)
+    else:
+        summary = sync_products_by_type(merchant_id)
+    with SessionLocal() as db:
+        m = db.query(Merchant).get(merchant_id)
+        if m and m.product_sync_status == "error":
+            raise JobError("product sync failed")
+    return summary._asdict() if summary else None
+
+
+job_queue.register("product_sync", run_product_sync)
+
+# Widget traffic only queues a sync when the catalog has gone stale, and
+# checks each merchant at most once per STALE_CHECK_SECONDS.
+PRODUCT_SYNC_MAX_AGE = timedelta(hours=float(os.getenv("PRODUCT_SYNC_MAX_AGE_HOURS", "24")))
+STALE_CHECK_SECONDS = 600
+stale_checks = {}
+stale_checks_lock = threading.Lock()
+
+
+def schedule_stale_sync(merchant_id: str):
+    now = time.monotonic()
+    with stale_checks_lock:
+        if now - stale_checks.get(merchant_id, -STALE_CHECK_SECONDS) < STALE_CHECK_SECONDS:
+            return
+        if len(stale_checks) > 10000:
+            stale_checks.clear()
+        stale_checks[merchant_id] = now
+    with SessionLocal() as db:
+        m = db.query(Merchant).get(merchant_id)
+        if not m or m.product_method not in ("html", "api"):
+            return
+        if m.product_last_synced and datetime.utcnow() - m.product_last_synced < PRODUCT_SYNC_MAX_AGE:
+            return
+    enqueue_product_sync(merchant_id, "settings")
+
 
 def sync_products_by_type(merchant_id: str):
     """Synchronize products based on store_type field."""
@@ -460,156 +553,13 @@ def sync_products_by_type(merchant_id: str):
         token = m.store_api_key or m.shopify_token
         if not (domain and token):
             return
-        m.product_sync_status = "syncing"
-        with SessionLocal() as db:
-            db.merge(m)
-            db.commit()
-        products = []
-        query = """
-        { products(first:10) { edges { node { title description onlineStoreUrl images(first:1){edges{node{url}}} variants(first:1){edges{node{price{amount}}}} } } } }
-        """
-        try:
-            resp = requests.post(
-                f"https://{domain}/api/2023-10/graphql.json",
-                json={"query": query},
-                headers={
-                    "X-Shopify-Storefront-Access-Token": token,
-                    "Content-Type": "application/json",
-                },
-                timeout=10,
-            )
-            data = resp.json()
-            for edge in data.get("data", {}).get("products", {}).get("edges", []):
-                node = edge.get("node", {})
-                price = None
-                var = node.get("variants", {}).get("edges", [])
-                if var:
-                    price = var[0].get("node", {}).get("price", {}).get("amount")
-                img = node.get("images", {}).get("edges", [])
-                img_url = img[0].get("node", {}).get("url") if img else None
-                products.append(
-                    {
-                        "title": node.get("title"),
-                        "description": node.get("description"),
-                        "price": price,
-                        "link": node.get("onlineStoreUrl"),
-                        "image_url": img_url,
-                    }
-                )
-        except Exception:
-            with SessionLocal() as db:
-                m = db.query(Merchant).get(merchant_id)
-                m.product_sync_status = "error"
-                db.commit()
-            return
+        return sync_shopify_catalog(merchant_id, domain, token)
     elif m.store_type == "WooCommerce":
         if not m.store_domain:
             return
-        m.product_sync_status = "syncing"
-        with SessionLocal() as db:
-            db.merge(m)
-            db.commit()
-        products = []
-        try:
-            headers = {}
-            if m.store_api_key:
-                headers = {"Authorization": f"Bearer {m.store_api_key}"}
-            resp = requests.get(
-                f"https://{m.store_domain}/wp-json/wc/v3/products",
-                headers=headers,
-                timeout=10,
-            )
-            for p in resp.json()[:10]:
-                img = p.get("images")
-                products.append(
-                    {
-                        "title": p.get("name"),
-                        "description": p.get("description"),
-                        "price": p.get("price"),
-                        "link": p.get("permalink"),
-                        "image_url": img[0].get("src") if img else None,
-                    }
-                )
-        except Exception:
-            with SessionLocal() as db:
-                m = db.query(Merchant).get(merchant_id)
-                m.product_sync_status = "error"
-                db.commit()
-            return
-    else:
-        # Custom store HTML scraping
-        base = m.store_domain or m.store_url
-        if not base:
-            return
-        if not base.startswith("http"):
-            base = f"https://{base}"
-        with SessionLocal() as db:
-            m.product_sync_status = "syncing"
-            db.merge(m)
-            db.commit()
-        products = []
-        try:
-            resp = requests.get(base, timeout=10)
-            soup = BeautifulSoup(resp.text, "html.parser")
-            products.extend(_extract_products(soup, base))
-        except Exception:
-            with SessionLocal() as db:
-                m = db.query(Merchant).get(merchant_id)
-                m.product_sync_status = "error"
-                db.commit()
-            return
-
-    with SessionLocal() as db:
-        db.query(Product).filter_by(merchant_id=merchant_id).delete()
-        for p in products:
-            db.add(
-                Product(
-                    merchant_id=merchant_id,
-                    title=p.get("title"),
-                    description=p.get("description"),
-                    price=p.get("price"),
-                    image_url=p.get("image_url") or p.get("image"),
-                    url=p.get("link") or p.get("url"),
-                )
-            )
-        m = db.query(Merchant).get(merchant_id)
-        m.product_sync_status = "success"
-        m.product_last_synced = datetime.utcnow()
-        db.commit()
-
-def _extract_products(soup: BeautifulSoup, base_url: str):
-    items = []
-    for script in soup.find_all("script", {"type": "application/ld+json"}):
-        try:
-            data = json.loads(script.string)
-        except Exception:
-            continue
-        entries = data if isinstance(data, list) else [data]
-        for d in entries:
-            if isinstance(d, dict) and d.get("@type") == "Product":
-                items.append(
-                    {
-                        "title": d.get("name"),
-                        "description": d.get("description"),
-                        "price": (d.get("offers") or {}).get("price"),
-                        "url": d.get("url") or base_url,
-                        "image": d.get("image", ""),
-                    }
-                )
-    if not items:
-        og_title = soup.find("meta", property="og:title")
-        if og_title:
-            items.append(
-                {
-                    "title": og_title.get("content"),
-                    "description": (soup.find("meta", property="og:description") or {}).get("content"),
-                    "price": (soup.find("meta", property="product:price:amount") or {}).get("content"),
-                    "url": base_url,
-                    "image": (soup.find("meta", property="og:image") or {}).get("content"),
-                }
-            )
-    return items
-
+        return sync_woocommerce_catalog(merchant_id, m.store_domain, m.store_api_key)
+    # Custom HTML stores are crawled, the same as a "crawl" sync.
+    return crawl_html_store(merchant_id)
 
 def merchant_config_data(merchant_id: str):
     links = merchant_configs.get(merchant_id, merchant_configs.get("test-merchant", {}))
@@ -641,17 +591,21 @@ def merchant_config_data(merchant_id: str):
     return cfg
 
 
+def widget_entitlements(merchant_id: str):
+    """Return the merchant's Entitlements if the referer may use the widget."""
+    ent = entitlements.get(merchant_id, current_month())
+    if not ent:
+        return None
+    ref = request.headers.get("Referer", "")
+    if ref and ent.allowed_domain and ent.allowed_domain not in ref:
+        return None
+    return ent
+
+
 def verify_widget_access(merchant_id: str):
     """Return Merchant if allowed for widget usage, else None."""
-    with SessionLocal() as db:
-        m = db.query(Merchant).get(merchant_id)
-        if not m:
-            return None
-        ref = request.headers.get("Referer", "")
-        allowed = m.store_domain or m.store_url
-        if ref and allowed and allowed not in ref:
-            return None
-        return m
+    ent = widget_entitlements(merchant_id)
+    return ent.merchant if ent else None
 
 
 @app.route("/auth/register", methods=["POST"])
@@ -738,7 +692,7 @@ def login():
             session["merchant_id"] = m.id
             sub, plan = get_subscription(m.id)
             if request.is_json:
-                usage = usage_record(db, m.id)
+                usage = usage_totals(m.id)
                 data_usage = {"requests": usage.requests, "tokens": usage.tokens, "month": usage.month}
                 return jsonify({"merchantId": m.id, "config": merchant_config_data(m.id), "usage": data_usage, "plan": plan.name if plan else None})
         if not sub:
@@ -764,7 +718,7 @@ def me():
         if not m:
             return jsonify({"error": "not_found"}), 404
         sub, plan = get_subscription(merchant_id)
-        usage = usage_record(db, merchant_id)
+        usage = usage_totals(merchant_id)
         return jsonify(
             {
                 "id": m.id,
@@ -787,34 +741,47 @@ def logout():
     return jsonify({"status": "ok"})
 
 
+llm_clients = ClientManager(API_KEY)
+llm_clients.start()
+
+
 def get_client():
-    return openai.OpenAI(api_key=API_KEY, base_url="https://openrouter.ai/api/v1")
+    return llm_clients.get_client()
 
 
-@app.route("/chat", methods=["POST"])
-def chat():
+def get_async_client():
+    return llm_clients.get_async_client()
+
+
+ChatPlan = namedtuple(
+    "ChatPlan",
+    [
+        "merchant_id",
+        "session_id",
+        "user_message",
+        "messages",
+        "preview_text",
+        "cache_key",
+        "reservation",
+    ],
+)
+
+
+def prepare_chat():
+    """Run the /chat pre-flight checks for the current request.
+
+    Returns a ready Flask response for anything answered without the LLM
+    (errors, quick replies, FAQs, cached answers), otherwise a ChatPlan
+    describing the completion to stream.
+    """
     merchant_id = current_mid()
     if not merchant_id:
         return jsonify({"error": "merchant_id", "message": "Authentication required"}), 400
-    if not verify_widget_access(merchant_id):
+    ent = widget_entitlements(merchant_id)
+    if not ent:
         return jsonify({"error": "unauthorized", "message": "Unauthorized use of widget"}), 403
 
-    with SessionLocal() as db:
-        usage_rec = usage_record(db, merchant_id)
-        if usage_rec.month != current_month():
-            usage_rec.month = current_month()
-            usage_rec.tokens = 0
-            usage_rec.requests = 0
-            db.commit()
-        current_tokens = usage_rec.tokens
-        extra_tokens = total_credit_tokens(db, merchant_id)
-
-    sub, plan = get_subscription(merchant_id)
-    limit = float("inf")
-    if plan and plan.token_limit >= 0:
-        limit = plan.token_limit
-    limit += extra_tokens
-    if current_tokens >= limit:
+    if not quota.has_headroom(ent):
         stats["failure"] += 1
         return jsonify({"error": "limit", "message": "Token limit exceeded"}), 402
 
@@ -830,9 +797,17 @@ def chat():
     user_message = data.get("message", "")
     sess["requests"] += 1
 
-    with SessionLocal() as db:
-        m = db.query(Merchant).filter_by(id=merchant_id).first()
-        prods = db.query(Product).filter_by(merchant_id=merchant_id).all()
+    index = get_index(merchant_id, catalog_version(ent.merchant, ent.product_count))
+    if index is None:
+        # A sync in another worker replaces the snapshot before this worker's
+        # cached entitlements expire; reload them before rebuilding.
+        entitlements.invalidate(merchant_id)
+        ent = entitlements.get(merchant_id, current_month()) or ent
+        index = get_index(merchant_id, catalog_version(ent.merchant, ent.product_count))
+    if index is None:
+        index = refresh_index(merchant_id)
+    m = ent.merchant
+    prods = index.products()
 
     product_info = ""
     outdated = not prods or (
@@ -850,15 +825,7 @@ def chat():
 
     top_matches = []
     if m and m.suggest_products and prods:
-        scored = [
-            (
-                difflib.SequenceMatcher(None, lower, f"{p.title} {p.description}").ratio(),
-                p,
-            )
-            for p in prods
-        ]
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top_matches = [p for score, p in scored[:3] if score > 0.2]
+        top_matches = index.search(lower, k=3)
 
     preview_text = ""
     if top_matches:
@@ -883,102 +850,107 @@ def chat():
                 return Response(f"The price of {p.title} is {p.price}", mimetype="text/plain")
 
     # Check stored FAQs before calling the LLM
-    for faq in get_faqs():
-        ratio = difflib.SequenceMatcher(None, lower, faq["question"].lower()).ratio()
-        if ratio > 0.6:
-            token_count = len(faq["answer"].split())
-            sess["tokens"] += token_count
-            with SessionLocal() as db:
-                u = usage_record(db, merchant_id)
-                u.tokens += token_count
-                u.requests += 1
-                consume_credits(db, merchant_id, token_count)
-                db.add(
-                    MerchantLog(
-                        merchant_id=merchant_id,
-                        session=session_id,
-                        user=user_message,
-                        assistant=faq["answer"],
-                    )
-                )
-                db.commit()
+    faq = match_faq(merchant_id, lower)
+    if faq:
+        record_exchange(merchant_id, session_id, user_message, faq["answer"], faq=True)
+        stats["success"] += 1
+        return Response(faq["answer"], mimetype="text/plain")
+
+    context = ""
+    if product_info:
+        context = "Available products:\n" + product_info
+    elif outdated:
+        context = "Product data is missing or outdated. Suggest updating store configuration when asked."
+    cache_key = answer_cache.key(merchant_id, user_message, f"{MODEL}\n{context}\n{preview_text}")
+    cached = answer_cache.get(cache_key)
+    if cached:
+
+        def replay():
+            for i in range(0, len(cached.answer), REPLAY_CHUNK_CHARS):
+                yield cached.answer[i:i + REPLAY_CHUNK_CHARS]
+            record_exchange(merchant_id, session_id, user_message, cached.answer)
             stats["success"] += 1
-            return Response(faq["answer"], mimetype="text/plain")
 
-    def generate():
-        success = True
-        full = ""
-        try:
-            client = get_client()
-            context = ""
-            if product_info:
-                context = "Available products:\n" + product_info
-            elif outdated:
-                context = "Product data is missing or outdated. Suggest updating store configuration when asked."
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": "You are Seep, a smart and helpful assistant."},
-                    {"role": "system", "content": context},
-                    {"role": "user", "content": user_message},
-                ],
-                stream=True,
-            )
-            for chunk in response:
-                token = chunk.choices[0].delta.content or ""
-                token = token.replace("*", "")
-                full += token
-                yield token
-            if preview_text:
-                clean_preview = preview_text.replace("*", "")
-                yield clean_preview
-                full += clean_preview
-            token_count = len(full.split())
-            sess["tokens"] += token_count
-            with SessionLocal() as db:
-                u = usage_record(db, merchant_id)
-                u.tokens += token_count
-                consume_credits(db, merchant_id, token_count)
-                db.add(u)
-                db.add(
-                    MerchantLog(
-                        merchant_id=merchant_id,
-                        session=session_id,
-                        user=user_message,
-                        assistant=full,
-                    )
-                )
-                db.commit()
-        except openai.AuthenticationError:
-            success = False
-            yield "[Invalid API key]"
-        except openai.RateLimitError:
-            success = False
-            yield "[Rate limit exceeded]"
-        except Exception:
-            success = False
-            traceback.print_exc()
-            yield "[Error fetching response]"
-        finally:
-            with SessionLocal() as db:
-                u = usage_record(db, merchant_id)
-                u.requests += 1
-                db.add(u)
-                db.add(
-                    MerchantLog(
-                        merchant_id=merchant_id,
-                        session=session_id,
-                        user=user_message,
-                        assistant=full,
-                    )
-                )
-                db.commit()
-            if success:
-                stats["success"] += 1
-            else:
-                stats["failure"] += 1
+        return Response(stream_with_context(replay()), mimetype="text/plain")
+
+    messages = [
+        {"role": "system", "content": "You are Seep, a smart and helpful assistant."},
+        {"role": "system", "content": context},
+        {"role": "user", "content": user_message},
+    ]
+    reservation = quota.reserve(ent)
+    if reservation is None:
+        stats["failure"] += 1
+        return jsonify({"error": "limit", "message": "Token limit exceeded"}), 402
+    return ChatPlan(
+        merchant_id, session_id, user_message, messages, preview_text, cache_key, reservation
+    )
+
+
+def complete_chat(plan: ChatPlan, full: str, elapsed: float):
+    """Cache and charge a successfully streamed answer."""
+    answer_cache.put(plan.cache_key, full, elapsed)
+    token_count = len(full.split())
+    session_usage[plan.session_id]["tokens"] += token_count
+    usage_meter.record(plan.merchant_id, current_month(), tokens=token_count)
+
+
+def finalize_chat(plan: ChatPlan, full: str, success: bool):
+    """Count the request, record the transcript and settle the reservation."""
+    usage_meter.record(plan.merchant_id, current_month(), requests=1, llm_calls=1)
+    quota.release(plan.reservation, len(full.split()) if success else None)
+    chat_log.append(plan.merchant_id, plan.session_id, plan.user_message, full)
+    if success:
+        stats["success"] += 1
+    else:
+        stats["failure"] += 1
 
-    return Response(stream_with_context(generate()), mimetype="text/plain")
+
+def clean_token(token) -> str:
+    return (token or "").replace("*", "")
+
+
+def stream_chat(plan: ChatPlan):
+    """Stream a completion for ``plan`` using the synchronous client."""
+    success = True
+    full = ""
+    started = time.monotonic()
+    try:
+        client = get_client()
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=plan.messages,
+            stream=True,
+        )
+        for chunk in response:
+            token = clean_token(chunk.choices[0].delta.content)
+            full += token
+            yield token
+        if plan.preview_text:
+            clean_preview = clean_token(plan.preview_text)
+            yield clean_preview
+            full += clean_preview
+        complete_chat(plan, full, time.monotonic() - started)
+    except openai.AuthenticationError:
+        success = False
+        yield "[Invalid API key]"
+    except openai.RateLimitError:
+        success = False
+        yield "[Rate limit exceeded]"
+    except Exception:
+        success = False
+        traceback.print_exc()
+        yield "[Error fetching response]"
+    finally:
+        finalize_chat(plan, full, success)
+
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    plan = prepare_chat()
+    if not isinstance(plan, ChatPlan):
+        return plan
+    return Response(stream_with_context(stream_chat(plan)), mimetype="text/plain")
 
 
 @app.route("/usage")
@@ -989,22 +961,7 @@ def usage_stats():
     avg_messages = monthly_messages / max(total_chats, 1)
     success_rate = stats["success"] / max(stats["success"] + stats["failure"], 1)
 
-    merchants = {}
-    with SessionLocal() as db:
-        for usage in db.query(MerchantUsage).all():
-            sub, plan = get_subscription(usage.merchant_id)
-            limit = float("inf")
-            plan_name = "start"
-            if plan:
-                plan_name = plan.name
-                if plan.token_limit >= 0:
-                    limit = plan.token_limit
-            merchants[usage.merchant_id] = {
-                "plan": plan_name,
-                "tokensUsed": usage.tokens,
-                "tokenLimit": None if limit == float("inf") else limit,
-                "month": usage.month,
-            }
+    merchants = current_usage(current_month())
 
     return jsonify({
         "totalChats": total_chats,
@@ -1013,6 +970,17 @@ def usage_stats():
         "uniqueVisitors": len(stats["unique_visitors"]),
         "successRate": success_rate,
         "conversions": stats["conversions"],
+        "answerCache": answer_cache.stats(),
+        "llmPool": llm_clients.stats(),
+        "quota": quota.stats(),
+        "chatLog": chat_log.stats(),
+        "botContent": bot_content.stats(),
+        "widgetConfig": widget_config.stats(),
+        "widgetBootstrap": bootstrap_bundles.stats(),
+        "jobs": job_queue.stats(),
+        "catalogSnapshots": snapshot_stats(),
+        "analytics": analytics_pipeline.stats(),
+        "storage": shard_router.stats(),
         "merchants": merchants,
     })
 
@@ -1040,7 +1008,7 @@ def bot_route(bot_name):
         save_welcome(bot_name, welcome)
         return jsonify({"status": "ok"})
     session_id = request.remote_addr
-    sync_products_for_merchant(bot_name)
+    schedule_stale_sync(bot_name)
     suggestion = None
     if abandoned_cart_flags.get(session_id):
         suggestion = templates["abandoned_cart"] or "Did you forget something in your cart?"
@@ -1066,9 +1034,9 @@ def faq_route():
         q = data.get("question", "").strip()
         a = data.get("answer", "").strip()
         if q and a:
-            add_faq(q, a)
+            add_faq(current_mid() or SHARED_FAQS, q, a)
         return jsonify({"status": "ok"})
-    return jsonify(get_faqs())
+    return jsonify(get_faqs(current_mid() or SHARED_FAQS))
 
 
 @app.route("/conversion", methods=["POST"])
@@ -1130,13 +1098,8 @@ def analytics():
     event = data.get("event")
     if not merchant_id or not event:
         return jsonify({"error": "invalid"}), 400
-    analytics_events[merchant_id].append(
-        {
-            "timestamp": datetime.utcnow().isoformat(),
-            "type": event,
-            "details": data.get("details"),
-        }
-    )
+    if not analytics_pipeline.record(merchant_id, event, data.get("details")):
+        return jsonify({"error": "invalid"}), 400
     return jsonify({"status": "ok"})
 
 
@@ -1146,13 +1109,105 @@ def log_event():
     event = request.args.get("event")
     if not event:
         return jsonify({"error": "event required"}), 400
-    analytics_events[event].append(
+    merchant_id = request.headers.get("x-merchant-id") or request.args.get("merchant_id")
+    if not analytics_pipeline.record(merchant_id, event, {"ip": request.remote_addr}):
+        return jsonify({"error": "invalid"}), 400
+    return jsonify({"status": "ok"})
+
+
+MAX_BEACON_BYTES = 64 * 1024
+MAX_BEACON_EVENTS = 100
+# Client timestamps outside this window are replaced by the arrival time.
+BEACON_MAX_AGE = timedelta(hours=24)
+
+
+def beacon_time(value, now: datetime):
+    """Event time from the widget's epoch milliseconds, if plausible."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return now
+    try:
+        ts = datetime.utcfromtimestamp(value / 1000)
+    except (OverflowError, OSError, ValueError):
+        return now
+    return ts if now - BEACON_MAX_AGE <= ts <= now + timedelta(minutes=1) else now
+
+
+def read_capped(stream, limit: int) -> bytes:
+    """Read up to ``limit`` bytes from ``stream`` (reads may return short)."""
+    chunks, size = [], 0
+    while size < limit:
+        chunk = stream.read(limit - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+
+@app.route("/events", methods=["POST"])
+def analytics_beacon():
+    """Batched widget telemetry, sent with navigator.sendBeacon or fetch.
+
+    Body: ``{"merchantId": ..., "events": [{"event": ..., "details": ...,
+    "t": epoch_ms}, ...]}``. The body is parsed whatever the content type,
+    since beacons are sent as text/plain to avoid a CORS preflight.
+    """
+    # Read at most one byte past the cap: chunked bodies have no Content-Length.
+    body = read_capped(request.stream, MAX_BEACON_BYTES + 1)
+    if len(body) > MAX_BEACON_BYTES:
+        return jsonify({"error": "too large"}), 413
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        return jsonify({"error": "invalid"}), 400
+    merchant_id = data.get("merchantId") if isinstance(data, dict) else None
+    events = data.get("events") if merchant_id else None
+    if not isinstance(merchant_id, str) or not isinstance(events, list) or len(events) > MAX_BEACON_EVENTS:
+        return jsonify({"error": "invalid"}), 400
+    if not widget_entitlements(merchant_id):
+        return jsonify({"error": "unauthorized"}), 403
+    now = datetime.utcnow()
+    accepted = analytics_pipeline.record_many(
+        merchant_id,
+        [
+            (e.get("event"), e.get("details"), beacon_time(e.get("t"), now))
+            for e in events
+            if isinstance(e, dict)
+        ],
+    )
+    return jsonify({"accepted": accepted, "rejected": len(events) - accepted})
+
+
+@app.route("/merchant/analytics")
+@login_required
+def merchant_analytics():
+    """Widget event counts for the dashboard.
+
+    Query args: ``days`` (default 7, max 90), ``bucket`` ("hour" or "day")
+    and ``type`` (repeatable) to restrict the event types.
+    """
+    mid = current_mid()
+    try:
+        days = min(max(int(request.args.get("days", 7)), 1), 90)
+    except ValueError:
+        return jsonify({"error": "invalid days"}), 400
+    bucket = request.args.get("bucket", "day")
+    if bucket not in ("hour", "day"):
+        return jsonify({"error": "invalid bucket"}), 400
+    since = datetime.utcnow() - timedelta(days=days)
+    series = analytics_pipeline.counts(mid, since, types=request.args.getlist("type"), bucket=bucket)
+    totals = defaultdict(int)
+    for row in series:
+        totals[row["type"]] += row["count"]
+    return jsonify(
         {
-            "timestamp": datetime.utcnow().isoformat(),
-            "ip": request.remote_addr,
+            "since": since.isoformat(),
+            "bucket": bucket,
+            "series": series,
+            "totals": totals,
+            "recent": analytics_pipeline.recent(mid, limit=20),
         }
     )
-    return jsonify({"status": "ok"})
 
 
 @app.route("/errors", methods=["POST"])
@@ -1160,7 +1215,7 @@ def log_error():
     """Record frontend error reports."""
     data = request.get_json(force=True) or {}
     mid = current_mid()
-    with SessionLocal() as db:
+    with merchant_session(mid) as db:
         db.add(
             ErrorLog(
                 merchant_id=mid,
@@ -1175,7 +1230,7 @@ def log_error():
 @app.route("/errors", methods=["GET"])
 @login_required
 def get_errors():
-    with SessionLocal() as db:
+    with merchant_session(current_mid()) as db:
         logs = (
             db.query(ErrorLog)
             .filter_by(merchant_id=current_mid())
@@ -1200,9 +1255,8 @@ def get_errors():
 @login_required
 def get_merchant_usage():
     merchant_id = current_mid()
-    with SessionLocal() as db:
-        usage = usage_record(db, merchant_id)
-        avg = usage.tokens / usage.requests if usage.requests else 0
+    usage = usage_totals(merchant_id)
+    avg = usage.tokens / usage.requests if usage.requests else 0
     sub, plan = get_subscription(merchant_id)
     limit = float("inf")
     if plan and plan.token_limit >= 0:
@@ -1215,6 +1269,30 @@ def get_merchant_usage():
     })
 
 
+def history_args(default_days: int = 30, default_months: int = 12):
+    """(period, since bucket) from ?period=day|month&count=N, or None."""
+    period = request.args.get("period", "day")
+    if period not in PERIODS:
+        return None
+    default = default_days if period == "day" else default_months
+    try:
+        count = min(max(int(request.args.get("count", default)), 1), 366 if period == "day" else 120)
+    except ValueError:
+        return None
+    return period, since_bucket(period, count)
+
+
+@app.route("/merchant/usage/history")
+@login_required
+def merchant_usage_history():
+    """Daily or monthly tokens, requests, FAQ hits and LLM calls."""
+    args = history_args()
+    if args is None:
+        return jsonify({"error": "invalid period"}), 400
+    period, since = args
+    return jsonify({"period": period, "since": since, "usage": merchant_history(current_mid(), period, since)})
+
+
 @app.route("/merchant/subscription")
 @login_required
 def merchant_subscription():
@@ -1243,6 +1321,7 @@ def create_checkout_session():
             success_url=data.get("successUrl", "https://example.com/success"),
             cancel_url=data.get("cancelUrl", "https://example.com/cancel"),
         )
+        entitlements.invalidate(current_mid())
         return jsonify({"url": session.url})
     except Exception as exc:
         capture_exception(exc)
@@ -1266,6 +1345,7 @@ def cancel_subscription():
         s.status = "cancelled"
         s.cancelled_at = datetime.utcnow()
         db.commit()
+    entitlements.invalidate(mid)
     return jsonify({"status": "cancelled"})
 
 
@@ -1276,12 +1356,13 @@ def redeem_code():
     code = (data.get("code") or "").strip()
     if not code:
         return jsonify({"error": "code_required"}), 400
-    with SessionLocal() as db:
+    with merchant_session(current_mid()) as db:
         d = db.query(DiscountCode).filter(func.lower(DiscountCode.code) == code.lower()).first()
         if not d:
             return jsonify({"error": "invalid"}), 404
         db.add(MerchantCredit(merchant_id=current_mid(), tokens=d.tokens))
         db.commit()
+    entitlements.invalidate(current_mid())
     return jsonify({"status": "ok", "tokens": d.tokens})
 
 
@@ -1289,7 +1370,7 @@ def redeem_code():
 @login_required
 def get_merchant_logs():
     merchant_id = current_mid()
-    with SessionLocal() as db:
+    with merchant_session(merchant_id) as db:
         logs = (
             db.query(MerchantLog)
             .filter_by(merchant_id=merchant_id)
@@ -1350,12 +1431,28 @@ def merchant_config():
     return jsonify(merchant_config_data(merchant_id))
 
 
+# Storefronts refetch after max-age; CDNs may serve stale while revalidating.
+WIDGET_CONFIG_MAX_AGE = int(os.getenv("WIDGET_CONFIG_MAX_AGE", "60"))
+WIDGET_CONFIG_SWR = int(os.getenv("WIDGET_CONFIG_SWR", "600"))
+widget_config = WidgetConfigCache(
+    merchant_config_data, ttl=float(os.getenv("WIDGET_CONFIG_TTL", "60"))
+)
+
+
 @app.route("/merchant/config/<merchant_id>")
 def merchant_config_public(merchant_id):
     """Public endpoint for the widget to fetch configuration."""
     if not verify_widget_access(merchant_id):
-        return jsonify({"error": "unauthorized", "message": "Unauthorized use of widget"}), 403
-    return jsonify(merchant_config_data(merchant_id))
+        resp = jsonify({"error": "unauthorized", "message": "Unauthorized use of widget"})
+        resp.headers["Cache-Control"] = "no-store"
+        return resp, 403
+    payload = widget_config.get(merchant_id)
+    resp = Response(payload.body, mimetype="application/json")
+    resp.set_etag(payload.etag)
+    resp.headers["Cache-Control"] = (
+        f"public, max-age={WIDGET_CONFIG_MAX_AGE}, stale-while-revalidate={WIDGET_CONFIG_SWR}"
+    )
+    return resp.make_conditional(request)
 
 
 @app.route("/merchant/config", methods=["POST"])
@@ -1383,74 +1480,43 @@ def merchant_config_save():
             m.product_endpoint = data.get("productEndpoint")
             m.product_sync_status = None
             db.commit()
+            entitlements.invalidate(merchant_id)
+            widget_config.invalidate(merchant_id)
             if m.store_type == "Custom HTML" and m.store_domain:
-                sync_custom_html_products(merchant_id)
+                enqueue_product_sync(merchant_id, "crawl")
     return jsonify({"status": "ok"})
 
 
 def sync_shopify_products(merchant_id: str):
-    """Fetch product data from Shopify Storefront API."""
+    """Fetch product data from the Shopify API configured in product settings."""
     with SessionLocal() as db:
         m = db.query(Merchant).get(merchant_id)
         if not m or not m.shopify_domain or not m.shopify_token:
             return
-        m.product_sync_status = "syncing"
-        db.commit()
-        products = []
-        query = """
-        { products(first:10) { edges { node { title description onlineStoreUrl images(first:1){edges{node{url}}} variants(first:1){edges{node{price{amount}}}} } } } }
-        """
+        domain, token = m.shopify_domain, m.shopify_token
+    return sync_shopify_catalog(merchant_id, domain, token)
+
+
+def sync_shopify_catalog(merchant_id: str, domain: str, token: str):
+    """Sync every Shopify product; bulk exports stream straight into the diff."""
+    set_sync_status(merchant_id, "syncing")
+    client = ShopifyClient(domain, token)
+    summary = None
+    with merchant_session(merchant_id) as db:
         try:
-            resp = requests.post(
-                f"https://{m.shopify_domain}/api/2023-10/graphql.json",
-                json={"query": query},
-                headers={
-                    "X-Shopify-Storefront-Access-Token": m.shopify_token,
-                    "Content-Type": "application/json",
-                },
-                timeout=10,
-            )
-            data = resp.json()
-            for edge in data.get("data", {}).get("products", {}).get("edges", []):
-                node = edge.get("node", {})
-                price = None
-                var = node.get("variants", {}).get("edges", [])
-                if var:
-                    price = var[0].get("node", {}).get("price", {}).get("amount")
-                img = node.get("images", {}).get("edges", [])
-                img_url = None
-                if img:
-                    img_url = img[0].get("node", {}).get("url")
-                products.append(
-                    {
-                        "title": node.get("title"),
-                        "description": node.get("description"),
-                        "price": price,
-                        "link": node.get("onlineStoreUrl"),
-                        "image_url": img_url,
-                    }
-                )
-            db.query(Product).filter_by(merchant_id=merchant_id).delete()
-            for p in products:
-                db.add(
-                    Product(
-                        merchant_id=merchant_id,
-                        title=p.get("title"),
-                        description=p.get("description"),
-                        price=p.get("price"),
-                        image_url=p.get("image_url"),
-                        url=p.get("link"),
-                    )
-                )
+            summary = sync_catalog(db, merchant_id, client.iter_products())
+        except Exception as exc:
+            capture_exception(exc)
+            db.rollback()
+        m = db.query(Merchant).get(merchant_id)
+        if summary is None:
+            m.product_sync_status = "error"
+        else:
             m.product_sync_status = "success"
             m.product_last_synced = datetime.utcnow()
-        except Exception:
-            m.product_sync_status = "error"
-        finally:
-            db.commit()
-            if m.store_type == "Custom HTML" and m.store_domain:
-                sync_custom_html_products(merchant_id)
-    return jsonify({"status": "ok"})
+        db.commit()
+    catalog_changed(merchant_id)
+    return summary
 
 
 @app.route("/merchant/product-settings/<merchant_id>", methods=["GET", "POST"])
@@ -1469,6 +1535,7 @@ def merchant_product_settings(merchant_id):
                 m.store_api_key = data.get("apiKey")
                 m.product_sync_status = None
                 db.commit()
+        entitlements.invalidate(merchant_id)
         return jsonify({"status": "ok"})
     with SessionLocal() as db:
         m = db.query(Merchant).get(merchant_id)
@@ -1499,6 +1566,8 @@ def merchant_bot_settings():
                 if "suggestProducts" in data:
                     m.suggest_products = 1 if data.get("suggestProducts") else 0
                 db.commit()
+        entitlements.invalidate(merchant_id)
+        widget_config.invalidate(merchant_id)
         return jsonify({"status": "ok"})
     with SessionLocal() as db:
         m = db.query(Merchant).get(merchant_id)
@@ -1511,99 +1580,14 @@ def merchant_bot_settings():
         )
 
 
-# Scrape products from store HTML
-
-@app.route('/merchant/<merchant_id>/scrape-products', methods=['POST'])
-
-@login_required
-
-def scrape_products(merchant_id):
-
-    """Manually scrape product data from the merchant store URL."""
-
-    if merchant_id != current_mid():
-
-        return jsonify({'error': "unauthorized"}), 403
-
-    with SessionLocal() as db:
-
-        m = db.query(Merchant).get(merchant_id)
-
-        if not m or not m.store_url:
-
-            return jsonify({'error': "store-url-missing"}), 400
-
-        try:
-
-            resp = requests.get(m.store_url, timeout=10)
-
-            soup = BeautifulSoup(resp.text, 'html.parser')
-
-            items = _extract_products(soup, m.store_url)
-
-            added = 0
-
-            for item in items:
-
-                url = item.get('url')
-
-                if not url:
-
-                    continue
-
-                exists = (
-
-                    db.query(Product)
-
-                    .filter_by(merchant_id=merchant_id, url=url)
-
-                    .first()
-
-                )
-
-                if exists:
-
-                    continue
-
-                db.add(
-
-                    Product(
-
-                        merchant_id=merchant_id,
-
-                        title=item.get('title'),
-
-                        description=item.get('description'),
-
-                        price=item.get('price'),
-
-                        image_url=item.get('image'),
-
-                        url=url,
-
-                    )
-
-                )
-
-                added += 1
-
-            db.commit()
-
-            return jsonify({'status': "ok", "count": added})
-
-        except Exception:
-
-            return jsonify({'error': "scrape_failed"}), 500
-
-
 @app.route('/merchant/<merchant_id>/products', methods=['GET', 'POST'])
 @login_required
 def merchant_products(merchant_id):
     if merchant_id != current_mid():
         return jsonify({"error": "unauthorized"}), 403
-    with SessionLocal() as db:
+    prods = catalog(merchant_id).products()
+    with merchant_session(merchant_id) as db:
         m = db.query(Merchant).get(merchant_id)
-        prods = db.query(Product).filter_by(merchant_id=merchant_id).all()
         return jsonify(
             {
                 "products": [
@@ -1626,16 +1610,20 @@ def merchant_products(merchant_id):
 @app.route('/products/<merchant_id>', methods=['POST'])
 @login_required
 def sync_products_endpoint(merchant_id):
-    """Trigger product synchronization for the merchant."""
+    """Queue product synchronization for the merchant.
+
+    Returns 202 with the job (poll /jobs/<id>) and the current catalog.
+    """
     if merchant_id != current_mid():
         return jsonify({"error": "unauthorized"}), 403
-    sync_products_by_type(merchant_id)
-    with SessionLocal() as db:
+    job = enqueue_product_sync(merchant_id)
+    prods = catalog(merchant_id).products()
+    with merchant_session(merchant_id) as db:
         m = db.query(Merchant).get(merchant_id)
-        prods = db.query(Product).filter_by(merchant_id=merchant_id).all()
         return jsonify(
             {
                 "status": m.product_sync_status if m else None,
+                "job": job,
                 "count": len(prods),
                 "products": [
                     {
@@ -1648,7 +1636,7 @@ def sync_products_endpoint(merchant_id):
                     for p in prods
                 ],
             }
-        )
+        ), 202
 
 
 @app.route("/merchant/<merchant_id>/scrape-products", methods=["POST"])
@@ -1656,23 +1644,41 @@ def sync_products_endpoint(merchant_id):
 def scrape_products_route(merchant_id):
     if merchant_id != current_mid():
         return jsonify({"error": "unauthorized"}), 403
-    sync_products_for_merchant(merchant_id)
-    with SessionLocal() as db:
-        prods = db.query(Product).filter_by(merchant_id=merchant_id).all()
-        return jsonify(
-            {
-                "products": [
-                    {
-                        "title": p.title,
-                        "description": p.description,
-                        "price": p.price,
-                        "url": p.url,
-                        "image": p.image_url,
-                    }
-                    for p in prods
-                ]
-            }
-        )
+    job = enqueue_product_sync(merchant_id, "settings")
+    prods = catalog(merchant_id).products()
+    return jsonify(
+        {
+            "job": job,
+            "products": [
+                {
+                    "title": p.title,
+                    "description": p.description,
+                    "price": p.price,
+                    "url": p.url,
+                    "image": p.image_url,
+                }
+                for p in prods
+            ]
+        }
+    ), 202
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    """Status of a queued product sync, billing run or export."""
+    is_admin = session.get("admin_logged_in")
+    if not is_admin and not current_user.is_authenticated:
+        return jsonify({"error": "unauthorized"}), 401
+    job = job_queue.get(job_id)
+    if job is None or (not is_admin and job["merchantId"] != current_mid()):
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/merchant/jobs")
+@login_required
+def merchant_jobs():
+    return jsonify({"jobs": job_queue.recent(current_mid())})
 
 
 @app.route("/products")
@@ -1683,8 +1689,7 @@ def products_public():
         return jsonify({"products": []})
     if not verify_widget_access(merchant_id):
         return jsonify({"error": "unauthorized", "message": "Unauthorized use of widget"}), 403
-    with SessionLocal() as db:
-        prods = db.query(Product).filter_by(merchant_id=merchant_id).all()
+    prods = catalog(merchant_id).products()
     return jsonify(
         {
             "products": [
@@ -1713,26 +1718,68 @@ def onboarding_page():
     return send_from_directory(public_dir, "onboarding.html")
 
 
+widget_assets = WidgetAssets(watch=os.getenv("FLASK_ENV") == "development")
+bootstrap_bundles = BootstrapBundles(
+    widget_assets, max_entries=int(os.getenv("WIDGET_BOOTSTRAP_MAX_ENTRIES", "10000"))
+)
+# Stable loader URLs are revalidated this often; hashed URLs never change.
+WIDGET_LOADER_MAX_AGE = int(os.getenv("WIDGET_LOADER_MAX_AGE", "300"))
+
+
+def asset_response(asset, cache_control: str):
+    """Serve a built widget asset in the best encoding the client accepts."""
+    encoding = negotiate(request.accept_encodings, asset.variants)
+    resp = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = cache_control
+    resp.set_etag(f"{asset.etag}-{encoding}")
+    return resp.make_conditional(request)
+
+
 @app.route("/widget/seep-widget.js")
 def widget_script():
     """Serve the embeddable chat widget script."""
-    return send_from_directory(
-        os.path.join(os.path.dirname(__file__), "static"),
-        "seep-widget.js",
-        mimetype="application/javascript",
+    return asset_response(
+        widget_assets.get("seep-widget.js"),
+        f"public, max-age={WIDGET_LOADER_MAX_AGE}, stale-while-revalidate=86400",
     )
 
 
 @app.route("/widget/seep-style.css")
 def widget_style():
     """Serve the embeddable chat widget stylesheet."""
-    return send_from_directory(
-        os.path.join(os.path.dirname(__file__), "static"),
-        "seep-style.css",
-        mimetype="text/css",
+    return asset_response(
+        widget_assets.get("seep-style.css"),
+        f"public, max-age={WIDGET_LOADER_MAX_AGE}, stale-while-revalidate=86400",
     )
 
 
+@app.route("/widget/bootstrap/<merchant_id>.js")
+def widget_bootstrap(merchant_id):
+    """Widget script with the merchant's public config inlined (one request)."""
+    if not verify_widget_access(merchant_id):
+        resp = Response("console.error('SEEP: unauthorized use of widget');", 403)
+        resp.mimetype = "application/javascript"
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    bundle = bootstrap_bundles.get(merchant_id, widget_config.get(merchant_id))
+    return asset_response(
+        bundle,
+        f"public, max-age={WIDGET_CONFIG_MAX_AGE}, stale-while-revalidate={WIDGET_CONFIG_SWR}",
+    )
+
+
+@app.route("/widget/<hashed_name>")
+def widget_hashed_asset(hashed_name):
+    """Serve a fingerprinted widget asset with immutable caching."""
+    asset = widget_assets.get_hashed(hashed_name)
+    if asset is None:
+        return jsonify({"error": "not_found"}), 404
+    return asset_response(asset, "public, max-age=31536000, immutable")
+
+
 @app.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
@@ -1792,38 +1839,40 @@ def export_logs():
     """Dump logs and usage to a JSON file for backups."""
     out_dir = os.path.join(os.path.dirname(__file__), "exports")
     os.makedirs(out_dir, exist_ok=True)
-    with SessionLocal() as db:
-        logs = db.query(MerchantLog).all()
-        usage = db.query(MerchantUsage).all()
-        errors = db.query(ErrorLog).all()
-        data = {
-            "logs": [
-                {
-                    "merchant": l.merchant_id,
-                    "user": l.user,
-                    "assistant": l.assistant,
-                    "timestamp": l.timestamp.isoformat(),
-                }
-                for l in logs
-            ],
-            "usage": [
-                {
-                    "merchant": u.merchant_id,
-                    "month": u.month,
-                    "tokens": u.tokens,
-                    "requests": u.requests,
-                }
-                for u in usage
-            ],
-            "errors": [
-                {
-                    "merchant": e.merchant_id,
-                    "message": e.message,
-                    "timestamp": e.timestamp.isoformat(),
-                }
-                for e in errors
-            ],
-        }
+    logs, usage, errors = [], [], []
+    for db in shard_router.all_sessions():
+        with db:
+            logs.extend(db.query(MerchantLog).all())
+            usage.extend(db.query(MerchantUsage).all())
+            errors.extend(db.query(ErrorLog).all())
+    data = {
+        "logs": [
+            {
+                "merchant": l.merchant_id,
+                "user": l.user,
+                "assistant": l.assistant,
+                "timestamp": l.timestamp.isoformat(),
+            }
+            for l in logs
+        ],
+        "usage": [
+            {
+                "merchant": u.merchant_id,
+                "month": u.month,
+                "tokens": u.tokens,
+                "requests": u.requests,
+            }
+            for u in usage
+        ],
+        "errors": [
+            {
+                "merchant": e.merchant_id,
+                "message": e.message,
+                "timestamp": e.timestamp.isoformat(),
+            }
+            for e in errors
+        ],
+    }
     fname = os.path.join(out_dir, f"logs-{datetime.utcnow().strftime('%Y%m%d')}.json")
     with open(fname, "w") as f:
         json.dump(data, f)
@@ -1858,17 +1907,43 @@ def process_billing():
                 m = db.query(Merchant).get(sub.merchant_id)
                 if m:
                     send_email(m.email, "Upcoming Billing", "Your subscription will renew soon.")
-    try:
-        export_logs()
-    except Exception as exc:
-        capture_exception(exc)
+    entitlements.invalidate()
+    job_queue.enqueue("export_logs", dedupe_key="export_logs")
+
+
+job_queue.register("billing", lambda merchant_id, payload: process_billing())
+job_queue.register("export_logs", lambda merchant_id, payload: export_logs())
 
 
 @app.route("/admin/run-billing")
 @admin_required
 def admin_run_billing():
-    process_billing()
-    return jsonify({"status": "ok"})
+    job = job_queue.enqueue("billing", dedupe_key="billing", max_attempts=1)
+    return jsonify({"status": "queued", "job": job}), 202
+
+
+@app.route("/admin/usage")
+@admin_required
+def admin_usage():
+    """Usage across merchants per day or month, plus this month per merchant."""
+    args = history_args()
+    if args is None:
+        return jsonify({"error": "invalid period"}), 400
+    period, since = args
+    return jsonify(
+        {
+            "period": period,
+            "since": since,
+            "totals": totals_by_bucket(period, since),
+            "merchants": current_usage(current_month()),
+        }
+    )
+
+
+@app.route("/admin/jobs")
+@admin_required
+def admin_jobs():
+    return jsonify({"jobs": job_queue.recent(limit=100), "stats": job_queue.stats()})
 
 
 @app.route("/admin/broadcast", methods=["POST"])
@@ -1956,8 +2031,12 @@ def stripe_webhook():
             if sub:
                 sub.failed_attempts += 1
                 db.commit()
+    entitlements.invalidate()
     return "", 200
 
 
+job_queue.start()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
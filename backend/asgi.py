@@ -0,0 +1,139 @@
+"""ASGI entry point that streams /chat on the event loop.
+
+POST /chat is handled natively: the Flask pre-flight checks run in a
+worker thread, then the completion is streamed with the async OpenRouter
+client so an open conversation no longer pins a thread. Every other
+route is served by the Flask app through asgiref's WSGI adapter.
+
+Run from the backend folder with::
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import time
+import traceback
+
+import openai
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app,
+    MODEL,
+    ChatPlan,
+    prepare_chat,
+    complete_chat,
+    finalize_chat,
+    clean_token,
+    get_async_client,
+    llm_clients,
+    usage_meter,
+    chat_log,
+)
+
+flask_app = WsgiToAsgi(app)
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return body
+
+
+def run_prepare(scope, body: bytes):
+    """Run prepare_chat() inside a Flask request context built from ``scope``."""
+    headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+    client = scope.get("client") or ("", 0)
+    with app.test_request_context(
+        scope["path"],
+        method=scope["method"],
+        headers=headers,
+        data=body,
+        query_string=scope.get("query_string", b""),
+        environ_base={"REMOTE_ADDR": client[0]},
+    ):
+        result = prepare_chat()
+        if isinstance(result, ChatPlan):
+            resp = app.process_response(app.response_class(mimetype="text/plain"))
+            return result, resp, None
+        resp = app.process_response(app.make_response(result))
+        return None, resp, resp.get_data()
+
+
+async def astream_chat(plan: ChatPlan):
+    """Async twin of app.stream_chat using the async client."""
+    success = True
+    full = ""
+    started = time.monotonic()
+    try:
+        client = get_async_client()
+        response = await client.chat.completions.create(
+            model=MODEL,
+            messages=plan.messages,
+            stream=True,
+        )
+        async for chunk in response:
+            token = clean_token(chunk.choices[0].delta.content)
+            full += token
+            yield token
+        if plan.preview_text:
+            clean_preview = clean_token(plan.preview_text)
+            yield clean_preview
+            full += clean_preview
+        await asyncio.to_thread(complete_chat, plan, full, time.monotonic() - started)
+    except openai.AuthenticationError:
+        success = False
+        yield "[Invalid API key]"
+    except openai.RateLimitError:
+        success = False
+        yield "[Rate limit exceeded]"
+    except Exception:
+        success = False
+        traceback.print_exc()
+        yield "[Error fetching response]"
+    finally:
+        await asyncio.to_thread(finalize_chat, plan, full, success)
+
+
+async def chat_endpoint(scope, receive, send):
+    body = await read_body(receive)
+    plan, resp, data = await asyncio.to_thread(run_prepare, scope, body)
+    headers = [
+        (k.lower().encode("latin-1"), v.encode("latin-1"))
+        for k, v in resp.headers.items()
+        if plan is None or k.lower() != "content-length"
+    ]
+    await send({"type": "http.response.start", "status": resp.status_code, "headers": headers})
+    if plan is None:
+        await send({"type": "http.response.body", "body": data})
+        return
+    async for token in astream_chat(plan):
+        if token:
+            await send({"type": "http.response.body", "body": token.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await llm_clients.aprewarm()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await llm_clients.aclose()
+            await asyncio.to_thread(usage_meter.stop)
+            await asyncio.to_thread(chat_log.stop)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        await chat_endpoint(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
@@ -0,0 +1,157 @@
+"""Benchmark product extraction: the old BeautifulSoup path vs product_extract.
+
+    python bench_extract.py [corpus_dir] [--repeat N]
+
+``corpus_dir`` holds saved product/listing pages (``*.html``). Without it a
+synthetic corpus covering plain JSON-LD, @graph, ItemList, ProductGroup,
+Open Graph and microdata pages is generated. Both paths extract products
+and links, as the crawler does.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from product_extract import extract_page
+
+
+def legacy_extract(text: str, base_url: str):
+    """The extractor used before product_extract (full DOM per page)."""
+    soup = BeautifulSoup(text, "html.parser")
+    items = []
+    for script in soup.find_all("script", {"type": "application/ld+json"}):
+        try:
+            data = json.loads(script.string)
+        except Exception:
+            continue
+        entries = data if isinstance(data, list) else [data]
+        for d in entries:
+            if isinstance(d, dict) and d.get("@type") == "Product":
+                items.append({"title": d.get("name"), "url": d.get("url") or base_url})
+    if not items:
+        og_title = soup.find("meta", property="og:title")
+        if og_title:
+            items.append({"title": og_title.get("content"), "url": base_url})
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    return items, links
+
+
+def _page(head: str, body: str) -> str:
+    nav = "".join(f'<li><a href="/collections/c{i}" class="nav-link">Category {i}</a></li>' for i in range(60))
+    filler = "".join(
+        f'<div class="card"><a href="/products/related-{i}"><img src="/img/{i}.jpg" alt="x"></a>'
+        f'<span class="price">$ {i}.00</span><p>{"Lorem ipsum dolor sit amet. " * 4}</p></div>'
+        for i in range(80)
+    )
+    script = "<script>window.theme = " + json.dumps({"strings": ["x" * 40] * 200}) + ";</script>"
+    return (
+        f"<!doctype html><html><head><title>Store</title>{head}"
+        f'<link rel="stylesheet" href="/theme.css">{script}</head>'
+        f"<body><nav><ul>{nav}</ul></nav><main>{body}{filler}</main></body></html>"
+    )
+
+
+def _ld(doc) -> str:
+    return f'<script type="application/ld+json">{json.dumps(doc)}</script>'
+
+
+def synthetic_corpus(count: int = 300):
+    offer = {"@type": "Offer", "price": "19.99", "priceCurrency": "USD"}
+    product = {
+        "@context": "https://schema.org",
+        "@type": "Product",
+        "name": "Canvas Tote",
+        "description": "Sturdy &amp; washable.",
+        "image": ["/img/tote.jpg"],
+        "url": "/products/tote",
+        "offers": offer,
+    }
+    graph = {
+        "@context": "https://schema.org",
+        "@graph": [
+            {"@type": "WebPage", "@id": "/products/mug#page", "mainEntity": {"@id": "/products/mug#product"}},
+            {"@type": "Product", "@id": "/products/mug#product", "name": "Mug",
+             "offers": [{"@type": "Offer", "price": 12}], "image": {"@type": "ImageObject", "url": "/m.jpg"}},
+        ],
+    }
+    item_list = {
+        "@context": "https://schema.org",
+        "@type": "ItemList",
+        "itemListElement": [
+            {"@type": "ListItem", "position": i, "item": {"@type": "Product", "name": f"Item {i}",
+             "url": f"/products/item-{i}", "offers": {"@type": "AggregateOffer", "lowPrice": i}}}
+            for i in range(12)
+        ],
+    }
+    group = {
+        "@context": "https://schema.org",
+        "@type": "ProductGroup",
+        "name": "Running Shoe",
+        "url": "/products/shoe",
+        "hasVariant": [
+            {"@type": "Product", "name": f"Running Shoe {size}", "offers": {"price": 80 + size}}
+            for size in range(6, 12)
+        ],
+    }
+    og = (
+        '<meta property="og:type" content="product"><meta property="og:title" content="Wool Hat">'
+        '<meta property="product:price:amount" content="25.00"><meta property="og:image" content="/hat.jpg">'
+    )
+    microdata = (
+        '<div itemscope itemtype="https://schema.org/Product"><h1 itemprop="name">Scarf</h1>'
+        '<div itemprop="offers" itemscope itemtype="https://schema.org/Offer">'
+        '<meta itemprop="price" content="30.00"></div></div>'
+    )
+    kinds = [
+        _page(_ld(product), "<h1>Canvas Tote</h1>"),
+        _page(_ld(graph), "<h1>Mug</h1>"),
+        _page(_ld(item_list), "<h1>All items</h1>"),
+        _page(_ld(group), "<h1>Running Shoe</h1>"),
+        _page(og, "<h1>Wool Hat</h1>"),
+        _page("", microdata),
+    ]
+    return [(f"https://shop.example/page-{i}", kinds[i % len(kinds)]) for i in range(count)]
+
+
+def load_corpus(path: str):
+    pages = []
+    for name in sorted(glob.glob(os.path.join(path, "**", "*.htm*"), recursive=True)):
+        with open(name, encoding="utf-8", errors="replace") as f:
+            pages.append((f"https://{os.path.basename(name)}/", f.read()))
+    return pages
+
+
+def bench(extract, pages, repeat: int):
+    products = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        products = 0
+        for url, text in pages:
+            products += len(extract(text, url)[0])
+    elapsed = time.perf_counter() - started
+    return len(pages) * repeat / elapsed, products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not pages:
+        parser.error("no .html files found")
+    size = sum(len(text) for _, text in pages) / len(pages) / 1024
+    print(f"{len(pages)} pages, {size:.0f} KiB average")
+    before, found_before = bench(legacy_extract, pages, args.repeat)
+    after, found_after = bench(extract_page, pages, args.repeat)
+    fast = sum(extract_page(text, url).fast for url, text in pages)
+    print(f"before: {before:8.1f} pages/s, {found_before} products")
+    print(f"after:  {after:8.1f} pages/s, {found_after} products ({fast}/{len(pages)} pages on the fast path)")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Write-through cache for per-merchant welcome messages and FAQ sets."""
+import threading
+import time
+
+from sqlalchemy.dialects.sqlite import insert
+
+from models import SessionLocal, BotWelcome, Faq
+from search import FaqIndex
+
+# FAQs stored without a merchant apply to every merchant.
+SHARED_FAQS = ""
+
+
+class BotContentCache:
+    """Serve welcome messages and FAQs from memory; writes update both.
+
+    Entries expire after ``ttl`` seconds so writes made by other workers are
+    picked up without a restart.
+    """
+
+    def __init__(self, ttl: float = 60.0, session_factory=SessionLocal, faq_threshold: float = 0.6):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.faq_threshold = faq_threshold
+        self.welcomes = {}
+        self.faq_sets = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def welcome(self, merchant_id: str) -> str:
+        with self.lock:
+            entry = self.welcomes.get(merchant_id)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.generation
+        with self.session_factory() as db:
+            row = db.get(BotWelcome, merchant_id)
+            message = (row.welcome_message if row else None) or ""
+        with self.lock:
+            if generation == self.generation:
+                self.welcomes[merchant_id] = (message, time.monotonic())
+        return message
+
+    def save_welcome(self, merchant_id: str, message: str):
+        stmt = insert(BotWelcome).values(merchant_id=merchant_id, welcome_message=message)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BotWelcome.merchant_id],
+            set_={"welcome_message": stmt.excluded.welcome_message},
+        )
+        with self.session_factory() as db:
+            db.execute(stmt)
+            db.commit()
+        with self.lock:
+            self.generation += 1
+            self.welcomes[merchant_id] = (message, time.monotonic())
+
+    def faq_index(self, merchant_id: str) -> FaqIndex:
+        """The merchant's FaqIndex, loaded on first use or once stale."""
+        with self.lock:
+            index = self.faq_sets.get(merchant_id)
+            if index is not None and not index.stale(self.ttl):
+                self.hits += 1
+                return index
+            self.misses += 1
+            generation = self.generation
+        with self.session_factory() as db:
+            rows = db.query(Faq).filter_by(merchant_id=merchant_id).order_by(Faq.id).all()
+        index = FaqIndex(threshold=self.faq_threshold)
+        index.load({"id": f.id, "question": f.question, "answer": f.answer} for f in rows)
+        with self.lock:
+            if generation == self.generation:
+                self.faq_sets[merchant_id] = index
+        return index
+
+    def faqs(self, merchant_id: str):
+        return self.faq_index(merchant_id).rows()
+
+    def add_faq(self, merchant_id: str, question: str, answer: str) -> int:
+        """Insert or update a FAQ by question and patch the cached index."""
+        stmt = insert(Faq).values(merchant_id=merchant_id, question=question, answer=answer)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["merchant_id", "question"],
+            set_={"answer": stmt.excluded.answer},
+        )
+        with self.session_factory() as db:
+            db.execute(stmt)
+            faq_id = (
+                db.query(Faq.id)
+                .filter_by(merchant_id=merchant_id, question=question)
+                .scalar()
+            )
+            db.commit()
+        with self.lock:
+            self.generation += 1
+            index = self.faq_sets.get(merchant_id)
+        if index is not None:
+            index.add(faq_id, question, answer)
+        return faq_id
+
+    def match_faq(self, merchant_id: str, message: str):
+        """Best FAQ for ``message``: the merchant's own first, then shared ones."""
+        keys = [merchant_id, SHARED_FAQS] if merchant_id else [SHARED_FAQS]
+        for key in keys:
+            faq = self.faq_index(key).match(message)
+            if faq:
+                return faq
+        return None
+
+    def invalidate(self, merchant_id: str = None):
+        with self.lock:
+            self.generation += 1
+            if merchant_id is None:
+                self.welcomes.clear()
+                self.faq_sets.clear()
+            else:
+                self.welcomes.pop(merchant_id, None)
+                self.faq_sets.pop(merchant_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "welcomes": len(self.welcomes),
+                "faqSets": len(self.faq_sets),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
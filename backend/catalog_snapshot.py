@@ -0,0 +1,244 @@
+"""Immutable, memory-mapped per-merchant catalog snapshots.
+
+A snapshot file holds one merchant's products and their search postings as
+fixed-width arrays that point into a UTF-8 string table:
+
+    header | products: count x 6 x (offset, length) | doc lengths: count x u32
+           | terms: n x (offset, length, first posting, postings) sorted by term
+           | postings: (doc, tf) u32 pairs | strings
+
+It is written once per sync to a temporary file and renamed over the old
+one, so readers see either the old or the new catalog. Every worker process
+mmaps the same file: products are decoded on access and the page cache
+holds a single copy per catalog. A reader that still has the old file
+mapped keeps a consistent view until it reopens.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections.abc import Sequence
+
+MAGIC = b"SEEPCAT1"
+# The arrays are written in native byte order; the marker rejects foreign files.
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("<8sIIIQQQQQQII")
+FIELDS = 6
+NULL = 0xFFFFFFFF
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _Strings:
+    """Append-only UTF-8 string table."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, value):
+        if value is None:
+            return 0, NULL
+        data = str(value).encode("utf-8")
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        return offset, len(data)
+
+
+def write_snapshot(path: str, docs, lengths, postings, version):
+    """Atomically write a snapshot.
+
+    ``docs`` are (id, title, description, price, url, image_url) tuples,
+    ``lengths`` their term counts and ``postings`` maps term -> [(doc, tf)]
+    with doc indexes into ``docs``. ``version`` must be JSON-serializable.
+    """
+    strings = _Strings()
+    records = array("I")
+    for doc in docs:
+        for value in doc[:FIELDS]:
+            records.extend(strings.add(value))
+    doc_lengths = array("I", lengths)
+    terms = array("I")
+    pairs = array("I")
+    for term in sorted(postings, key=lambda t: t.encode("utf-8")):
+        offset, length = strings.add(term)
+        entries = postings[term]
+        terms.extend((offset, length, len(pairs) // 2, len(entries)))
+        for doc, tf in entries:
+            pairs.extend((doc, tf))
+    version_ref = strings.add(json.dumps(version))
+
+    products_off = HEADER.size
+    lengths_off = products_off + len(records) * records.itemsize
+    terms_off = lengths_off + len(doc_lengths) * doc_lengths.itemsize
+    postings_off = terms_off + len(terms) * terms.itemsize
+    strings_off = postings_off + len(pairs) * pairs.itemsize
+    header = HEADER.pack(
+        MAGIC, BYTE_ORDER_MARK, len(docs), len(terms) // 4, sum(lengths),
+        products_off, lengths_off, terms_off, postings_off, strings_off, *version_ref,
+    )
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".cat")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for part in (records, doc_lengths, terms, pairs):
+                part.tofile(f)
+            for chunk in strings.chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class SnapshotProducts(Sequence):
+    """Lazy, read-only view of a snapshot's products."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.snapshot.product(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.snapshot.product(i)
+
+
+class CatalogSnapshot:
+    """Read-only mapping of one snapshot file."""
+
+    # Type each product is returned as; subclasses use a namedtuple.
+    product_type = tuple
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            if self.stat.st_size < HEADER.size:
+                raise SnapshotError(f"{path}: truncated")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, mark, self.count, self.term_count, self.total_length,
+            products_off, lengths_off, terms_off, postings_off, self.strings_off,
+            version_off, version_len,
+        ) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or mark != BYTE_ORDER_MARK:
+            raise SnapshotError(f"{path}: not a catalog snapshot for this platform")
+        view = memoryview(self.map)
+        self.records = view[products_off:lengths_off].cast("I")
+        self.lengths = view[lengths_off:terms_off].cast("I")
+        self.terms = view[terms_off:postings_off].cast("I")
+        self.pairs = view[postings_off:self.strings_off].cast("I")
+        self.version = tuple(json.loads(self._string(version_off, version_len)))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        start = self.strings_off + offset
+        return self.map[start:start + length]
+
+    def _string(self, offset: int, length: int):
+        if length == NULL:
+            return None
+        return self._bytes(offset, length).decode("utf-8")
+
+    def product(self, i: int):
+        base = i * FIELDS * 2
+        r = self.records
+        return self.product_type(*(self._string(r[base + 2 * f], r[base + 2 * f + 1]) for f in range(FIELDS)))
+
+    def products(self) -> SnapshotProducts:
+        return SnapshotProducts(self)
+
+    def doc_length(self, i: int) -> int:
+        return self.lengths[i]
+
+    def postings(self, term: str):
+        """Return (docs, tfs) views for ``term`` (binary search, no copies)."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count
+        t = self.terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = self._bytes(t[4 * mid], t[4 * mid + 1])
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                start, n = t[4 * mid + 2], t[4 * mid + 3]
+                pairs = self.pairs[2 * start:2 * (start + n)]
+                return pairs[0::2], pairs[1::2]
+        return (), ()
+
+    def same_file(self, stat) -> bool:
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == (
+            self.stat.st_ino, self.stat.st_mtime_ns, self.stat.st_size,
+        )
+
+
+class SnapshotCache:
+    """Per-process cache of mapped snapshots, reopened when the file is replaced."""
+
+    def __init__(self, opener=CatalogSnapshot):
+        self.opener = opener
+        self.snapshots = {}
+        self.lock = threading.Lock()
+        self.opens = 0
+
+    def get(self, path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.snapshots.pop(path, None)
+            return None
+        with self.lock:
+            snap = self.snapshots.get(path)
+        if snap is not None and snap.same_file(stat):
+            return snap
+        try:
+            snap = self.opener(path)
+        except (OSError, ValueError, SnapshotError) as exc:
+            print(f"[catalog] ignoring snapshot {path}: {exc}", file=sys.stderr)
+            return None
+        with self.lock:
+            # Old mappings are released once no request still uses them.
+            self.snapshots[path] = snap
+            self.opens += 1
+        return snap
+
+    def forget(self, path: str):
+        with self.lock:
+            self.snapshots.pop(path, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "open": len(self.snapshots),
+                "mappedBytes": sum(s.size for s in self.snapshots.values()),
+                "opens": self.opens,
+            }
@@ -0,0 +1,116 @@
+"""Diff-based product catalog sync keyed by (merchant_id, url)."""
+import hashlib
+import json
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import and_, insert, or_, select, update
+
+from models import Product
+
+SYNC_FIELDS = ("title", "description", "price", "image_url", "url")
+SYNC_CHUNK = 1000
+# Per-connection scratch table holding the ids of products kept by a sync.
+SEEN_TABLE = "temp.catalog_sync_seen"
+
+SyncSummary = namedtuple("SyncSummary", ["inserted", "updated", "deleted", "unchanged"])
+
+
+def product_row(item: dict) -> dict:
+    """Map a scraped/API product dict onto Product columns."""
+    return {
+        "title": item.get("title"),
+        "description": item.get("description"),
+        "price": item.get("price"),
+        "image_url": item.get("image_url") or item.get("image"),
+        "url": item.get("url") or item.get("link") or None,
+    }
+
+
+def content_hash(row: dict) -> str:
+    payload = json.dumps([row[f] for f in SYNC_FIELDS], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def row_key(url, digest):
+    # Products without a URL can only be matched on their content.
+    return url if url else ("#", digest)
+
+
+def existing_rows(db, merchant_id: str, rows):
+    """{row_key: (id, content_hash)} of stored products matching ``rows``."""
+    urls = [r["url"] for r in rows if r["url"]]
+    digests = [r["content_hash"] for r in rows if not r["url"]]
+    match = []
+    if urls:
+        match.append(Product.url.in_(urls))
+    if digests:
+        match.append(and_(Product.url.is_(None), Product.content_hash.in_(digests)))
+    if not match:
+        return {}
+    found = db.execute(
+        select(Product.id, Product.url, Product.content_hash).where(Product.merchant_id == merchant_id, or_(*match))
+    )
+    return {row_key(url, digest): (pid, digest) for pid, url, digest in found}
+
+
+def sync_catalog(db, merchant_id: str, items, prune: bool = True, chunk_size: int = SYNC_CHUNK) -> SyncSummary:
+    """Apply only the inserts, updates and deletes needed to match ``items``.
+
+    ``items`` is consumed ``chunk_size`` products at a time and each chunk
+    is compared with just the stored rows it matches, so memory doesn't
+    grow with the catalog (bulk exports stream straight through). The ids
+    of kept products go to a temp table that drives the final delete.
+
+    Runs on ``db`` without committing, so the caller's status update lands
+    in the same transaction. Readers keep seeing the previous catalog until
+    then instead of an empty one. With ``prune=False`` (incremental syncs)
+    products missing from ``items`` are kept.
+    """
+    # The Product table's connection (a shard file when sharding is on).
+    conn = db.connection(bind_arguments={"mapper": Product})
+    if prune:
+        conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {SEEN_TABLE} (id VARCHAR PRIMARY KEY)")
+        conn.exec_driver_sql(f"DELETE FROM {SEEN_TABLE}")
+    now = datetime.utcnow()
+    inserted = updated = unchanged = deleted = 0
+    items = iter(items)
+    while True:
+        desired = {}
+        for item in islice(items, chunk_size):
+            row = product_row(item)
+            row["content_hash"] = content_hash(row)
+            desired[row_key(row["url"], row["content_hash"])] = row
+        if not desired:
+            break
+        current = existing_rows(db, merchant_id, desired.values())
+        inserts, updates, seen = [], [], []
+        for key, row in desired.items():
+            existing = current.get(key)
+            if existing is None:
+                pid = str(uuid.uuid4())
+                inserts.append(dict(row, id=pid, merchant_id=merchant_id, scraped_at=now))
+            else:
+                pid = existing[0]
+                if existing[1] != row["content_hash"]:
+                    updates.append(dict(row, id=pid, scraped_at=now))
+            seen.append((pid,))
+        if inserts:
+            db.execute(insert(Product), inserts)
+        if updates:
+            db.execute(update(Product), updates)
+        if prune:
+            conn.exec_driver_sql(f"INSERT OR IGNORE INTO {SEEN_TABLE} (id) VALUES (?)", seen)
+        inserted += len(inserts)
+        updated += len(updates)
+        unchanged += len(desired) - len(inserts) - len(updates)
+
+    if prune:
+        deleted = conn.exec_driver_sql(
+            f"DELETE FROM {Product.__tablename__} WHERE merchant_id = ? AND id NOT IN (SELECT id FROM {SEEN_TABLE})",
+            (merchant_id,),
+        ).rowcount
+        conn.exec_driver_sql(f"DROP TABLE {SEEN_TABLE}")
+    return SyncSummary(inserted, updated, deleted, unchanged)
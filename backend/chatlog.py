@@ -0,0 +1,120 @@
+"""Batched, append-only writer for merchant_logs conversation records."""
+import atexit
+import os
+import queue
+import threading
+import traceback
+from datetime import datetime
+
+from models import MerchantLog
+from sharding import router
+
+
+class ConversationLogWriter:
+    """Queue one record per exchange and insert them in executemany batches."""
+
+    def __init__(
+        self,
+        router=router,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        interval: float = 1.0,
+        put_timeout: float = 0.05,
+    ):
+        self.router = router
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed = 0
+
+    def _after_fork(self):
+        running = self.thread is not None
+        self._reset()
+        if running:
+            self.start()
+
+    def append(self, merchant_id: str, session_id: str, user: str, assistant: str) -> bool:
+        """Queue a record; waits briefly when full, then drops and counts it."""
+        record = {
+            "merchant_id": merchant_id,
+            "session": session_id,
+            "timestamp": datetime.utcnow(),
+            "user": user,
+            "assistant": assistant,
+        }
+        try:
+            self.queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def flush(self):
+        """Drain the queue into the database, one transaction per batch and shard."""
+        with self.flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                groups = {}
+                for record in batch:
+                    groups.setdefault(self.router.group_key(record["merchant_id"]), []).append(record)
+                ok = True
+                for key, records in groups.items():
+                    try:
+                        with self.router.session_for_key(key) as db:
+                            db.execute(MerchantLog.__table__.insert(), records)
+                            db.commit()
+                        self.written += len(records)
+                        self.batches += 1
+                    except Exception:
+                        traceback.print_exc()
+                        self.failed += len(records)
+                        ok = False
+                if not ok:
+                    return
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "capacity": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
@@ -0,0 +1,273 @@
+"""Bounded, polite, concurrent crawler for product pages on HTML stores."""
+import heapq
+import re
+import threading
+import time
+import traceback
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib import robotparser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+USER_AGENT = "SeepBot/1.0 (+https://seep.to)"
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "_pos", "_sid", "_ss", "variant"}
+SKIP_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".css", ".js",
+    ".pdf", ".zip", ".mp4", ".mp3", ".woff", ".woff2", ".xml", ".json",
+)
+SKIP_PATH_RE = re.compile(r"/(cart|checkout|account|login|logout|register|search|wp-admin|cdn-cgi)(/|$)")
+PRODUCT_PATH_RE = re.compile(r"/(products?|items?|shop|p)/|[?&](product|add-to-cart)=")
+LISTING_PATH_RE = re.compile(r"/(collections?|categor(y|ies)|product-category|catalog|shop)(/|$)|[?&]page=\d+")
+
+CrawlResult = namedtuple("CrawlResult", ["products", "pages", "errors", "elapsed", "stopped"])
+
+
+def normalize_url(url: str, base: str = None):
+    """Absolute URL without fragment, tracking params or default port; None if not http(s)."""
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+        )
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def site_key(url: str) -> str:
+    """Host without a leading www., used to keep the crawl on one store."""
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum delay between requests."""
+
+    def __init__(self, per_host: int = 2, delay: float = 0.25):
+        self.per_host = per_host
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.next_at = {}
+        self.delays = {}
+
+    def set_delay(self, host: str, delay: float):
+        """Honour a longer Crawl-delay from robots.txt."""
+        with self.lock:
+            self.delays[host] = max(delay, self.delay)
+
+    def acquire(self, host: str):
+        with self.lock:
+            slot = self.slots.setdefault(host, threading.Semaphore(self.per_host))
+        slot.acquire()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                ready = self.next_at.get(host, 0.0)
+                if now >= ready:
+                    self.next_at[host] = now + self.delays.get(host, self.delay)
+                    return
+            time.sleep(ready - now)
+
+    def release(self, host: str):
+        self.slots[host].release()
+
+
+class Crawler:
+    """Crawl one store with a thread pool, within a page and time budget.
+
+    ``extract(html, url)`` returns ``(products, links)`` for a page, e.g.
+    product_extract.extract_page (product ``url`` keys are used for dedup).
+    Product-looking links are fetched before listing pages, and sitemap.xml
+    is used as a seed when the store publishes one. Each pool thread gets
+    its own session from ``session_factory``.
+    """
+
+    def __init__(
+        self,
+        extract,
+        workers: int = 8,
+        per_host: int = 2,
+        delay: float = 0.25,
+        max_pages: int = 2000,
+        max_seconds: float = 300.0,
+        max_depth: int = 4,
+        timeout: float = 10.0,
+        session_factory=requests.Session,
+        on_progress=None,
+        progress_every: int = 25,
+    ):
+        self.extract = extract
+        self.workers = workers
+        self.limiter = HostLimiter(per_host, delay)
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.session_factory = session_factory
+        self.local = threading.local()
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+
+    def _session(self):
+        # requests.Session isn't documented as thread-safe; keep one per thread.
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.session_factory()
+            session.headers.setdefault("User-Agent", USER_AGENT)
+        return session
+
+    def _get(self, url: str):
+        host = urlsplit(url).netloc
+        self.limiter.acquire(host)
+        try:
+            return self._session().get(url, timeout=self.timeout)
+        finally:
+            self.limiter.release(host)
+
+    def _robots(self, root: str):
+        rp = robotparser.RobotFileParser()
+        try:
+            resp = self._get(root + "/robots.txt")
+            rp.parse(resp.text.splitlines() if resp.status_code == 200 else [])
+        except requests.RequestException:
+            rp.parse([])
+        delay = rp.crawl_delay(USER_AGENT) or rp.crawl_delay("*")
+        if delay:
+            self.limiter.set_delay(urlsplit(root).netloc, min(float(delay), 5.0))
+        return rp
+
+    def _sitemap_urls(self, root: str, rp, deadline: float, limit: int):
+        """Page URLs listed in the store's sitemaps (product sitemaps first)."""
+        pending = [root + "/sitemap.xml"] + [u for u in (rp.site_maps() or [])]
+        seen, urls = set(), []
+        while pending and len(urls) < limit and len(seen) < 20 and time.monotonic() < deadline:
+            sitemap = pending.pop(0)
+            if sitemap in seen:
+                continue
+            seen.add(sitemap)
+            try:
+                resp = self._get(sitemap)
+                if resp.status_code != 200:
+                    continue
+                tree = ET.fromstring(resp.content)
+            except (requests.RequestException, ET.ParseError):
+                continue
+            locs = [el.text.strip() for el in tree.iter() if el.tag.endswith("loc") and el.text]
+            if tree.tag.endswith("sitemapindex"):
+                pending.extend(sorted(locs, key=lambda u: "product" not in u))
+            else:
+                urls.extend(locs)
+        return urls[:limit]
+
+    def _priority(self, url: str, depth: int) -> int:
+        path = urlsplit(url).path.lower() + "?" + urlsplit(url).query.lower()
+        if PRODUCT_PATH_RE.search(path):
+            return depth
+        if LISTING_PATH_RE.search(path):
+            return 100 + depth
+        return 200 + depth
+
+    def _allowed(self, url: str, site: str, rp) -> bool:
+        if site_key(url) != site:
+            return False
+        path = urlsplit(url).path.lower()
+        if path.endswith(SKIP_EXTENSIONS) or SKIP_PATH_RE.search(path):
+            return False
+        return rp.can_fetch(USER_AGENT, url)
+
+    def _fetch_page(self, url: str):
+        resp = self._get(url)
+        if resp.status_code != 200 or "html" not in resp.headers.get("Content-Type", "html"):
+            return [], []
+        return self.extract(resp.text, url)[:2]
+
+    def crawl(self, start_url: str) -> CrawlResult:
+        started = time.monotonic()
+        deadline = started + self.max_seconds
+        start = normalize_url(start_url if "://" in start_url else f"https://{start_url}")
+        if not start:
+            return CrawlResult([], 0, 0, 0.0, "invalid_url")
+        parts = urlsplit(start)
+        root = f"{parts.scheme}://{parts.netloc}"
+        site = site_key(start)
+        rp = self._robots(root)
+
+        frontier = []
+        seen = set()
+        counter = 0
+
+        def push(url, depth):
+            nonlocal counter
+            if url and url not in seen and depth <= self.max_depth and self._allowed(url, site, rp):
+                seen.add(url)
+                counter += 1
+                heapq.heappush(frontier, (self._priority(url, depth), counter, url, depth))
+
+        push(start, 0)
+        # The configured URL may be a cart page; always crawl the home page too.
+        push(normalize_url(root + "/"), 0)
+        for url in self._sitemap_urls(root, rp, deadline, self.max_pages):
+            push(normalize_url(url), 1)
+
+        products = {}
+        pages = errors = 0
+        stopped = "done"
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawler")
+        running = {}
+        try:
+            while frontier or running:
+                while frontier and len(running) < self.workers and pages + len(running) < self.max_pages:
+                    _, _, url, depth = heapq.heappop(frontier)
+                    running[pool.submit(self._fetch_page, url)] = (url, depth)
+                if not running:
+                    stopped = "page_budget"
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    stopped = "time_budget"
+                    break
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = running.pop(future)
+                    pages += 1
+                    try:
+                        found, links = future.result()
+                    except Exception:
+                        errors += 1
+                        continue
+                    for item in found:
+                        key = normalize_url(item.get("url") or url, url) or url
+                        item["url"] = key
+                        products.setdefault(key, item)
+                    for href in links:
+                        push(normalize_url(href, url), depth + 1)
+                    if self.on_progress and pages % self.progress_every == 0:
+                        try:
+                            self.on_progress(pages, len(products))
+                        except Exception:
+                            traceback.print_exc()
+        finally:
+            # Don't wait for fetches still in flight once the budget is spent.
+            pool.shutdown(wait=False, cancel_futures=True)
+        if stopped == "done" and pages >= self.max_pages and frontier:
+            stopped = "page_budget"
+        return CrawlResult(list(products.values()), pages, errors, time.monotonic() - started, stopped)
@@ -0,0 +1,145 @@
+"""Per-merchant entitlement snapshots for the /chat pre-flight checks."""
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from models import Merchant, Plan, Subscription, MerchantCredit, MerchantUsage, Product
+from sharding import merchant_session, router
+
+Entitlements = namedtuple(
+    "Entitlements",
+    [
+        "merchant",
+        "allowed_domain",
+        "plan_name",
+        "token_limit",
+        "subscription_status",
+        "credit_tokens",
+        "usage_tokens",
+        "usage_requests",
+        "product_count",
+        "month",
+        "loaded_at",
+    ],
+)
+
+
+def load_entitlements(db, merchant_id: str, month: str):
+    """Load a merchant's settings, plan, credits and usage.
+
+    One query when unsharded; with sharding the merchant-scoped counters come
+    from a second query against the merchant's shard (``db`` must be a
+    merchant_session).
+    """
+    latest = aliased(Subscription)
+    latest_sub = (
+        select(latest.id)
+        .where(latest.merchant_id == Merchant.id)
+        .order_by(latest.start_date.desc())
+        .limit(1)
+        .correlate(Merchant)
+        .scalar_subquery()
+    )
+    plan_id = select(Subscription.plan_id).where(Subscription.id == latest_sub).scalar_subquery()
+    plan_name = select(Plan.name).where(Plan.id == plan_id).scalar_subquery()
+    token_limit = select(Plan.token_limit).where(Plan.id == plan_id).scalar_subquery()
+    status = select(Subscription.status).where(Subscription.id == latest_sub).scalar_subquery()
+    credits = (
+        select(func.coalesce(func.sum(MerchantCredit.tokens - MerchantCredit.used_tokens), 0))
+        .where(MerchantCredit.merchant_id == merchant_id)
+        .scalar_subquery()
+    )
+    usage_tokens = (
+        select(MerchantUsage.tokens)
+        .where(MerchantUsage.merchant_id == merchant_id, MerchantUsage.month == month)
+        .scalar_subquery()
+    )
+    usage_requests = (
+        select(MerchantUsage.requests)
+        .where(MerchantUsage.merchant_id == merchant_id, MerchantUsage.month == month)
+        .scalar_subquery()
+    )
+    product_count = (
+        select(func.count(Product.id)).where(Product.merchant_id == merchant_id).scalar_subquery()
+    )
+    scoped = [credits, usage_tokens, usage_requests, product_count]
+    if router.enabled:
+        row = (
+            db.query(Merchant, plan_name, token_limit, status)
+            .filter(Merchant.id == merchant_id)
+            .first()
+        )
+        if not row:
+            return None
+        row = tuple(row) + tuple(db.execute(select(*scoped)).one())
+    else:
+        row = (
+            db.query(Merchant, plan_name, token_limit, status, *scoped)
+            .filter(Merchant.id == merchant_id)
+            .first()
+        )
+        if not row:
+            return None
+    m = row[0]
+    return Entitlements(
+        merchant=m,
+        allowed_domain=m.store_domain or m.store_url,
+        plan_name=row[1],
+        token_limit=row[2],
+        subscription_status=row[3],
+        credit_tokens=row[4] or 0,
+        usage_tokens=row[5] or 0,
+        usage_requests=row[6] or 0,
+        product_count=row[7] or 0,
+        month=month,
+        loaded_at=time.monotonic(),
+    )
+
+
+class EntitlementCache:
+    """In-process TTL cache of Entitlements with explicit invalidation."""
+
+    def __init__(self, ttl: float = 30.0, session_factory=merchant_session):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.entries = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, merchant_id: str, month: str):
+        with self.lock:
+            ent = self.entries.get(merchant_id)
+            if ent and ent.month == month and time.monotonic() - ent.loaded_at < self.ttl:
+                self.hits += 1
+                return ent
+            self.misses += 1
+            generation = self.generation
+        with self.session_factory(merchant_id) as db:
+            ent = load_entitlements(db, merchant_id, month)
+        with self.lock:
+            if generation != self.generation:
+                # Invalidated while loading; serve it but don't cache it.
+                return ent
+            if ent is None:
+                self.entries.pop(merchant_id, None)
+            else:
+                self.entries[merchant_id] = ent
+        return ent
+
+    def invalidate(self, merchant_id: str = None):
+        """Forget one merchant's snapshot, or all of them."""
+        with self.lock:
+            self.generation += 1
+            if merchant_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(merchant_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
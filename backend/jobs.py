@@ -0,0 +1,306 @@
+"""SQLite-backed background job queue (the ``jobs`` table in bots.db).
+
+Workers claim jobs with a single ``UPDATE ... RETURNING``, so worker threads
+in several processes can share the table. A queued job with the same
+``dedupe_key`` as a new request absorbs it (the newest payload wins unless
+the caller's ``replace`` check says otherwise), and a job never starts while another job with its key is running. Failed jobs are
+retried with exponential backoff; a job whose worker died is picked up again
+once its lease expires.
+
+Run ``python jobs.py [workers]`` from the backend folder for a standalone
+worker process (set ``JOB_WORKERS=0`` on the web processes to use only it).
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from models import Job, SessionLocal
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "1800"))
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", "30"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+
+class JobError(Exception):
+    """Raised by a handler to fail (and retry) a job without a traceback."""
+
+
+def job_dict(job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "merchantId": job.merchant_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "maxAttempts": job.max_attempts,
+        "runAt": job.run_at.isoformat() if job.run_at else None,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "startedAt": job.started_at.isoformat() if job.started_at else None,
+        "finishedAt": job.finished_at.isoformat() if job.finished_at else None,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+    }
+
+
+class JobQueue:
+    """Persistent queue plus the worker threads that drain it.
+
+    Handlers are registered per kind as ``handler(merchant_id, payload)``;
+    the return value is stored as the job's JSON result. Workers only claim
+    kinds that have a handler in their process.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_SECONDS,
+        lease: float = JOB_LEASE_SECONDS,
+        retry_delay: float = JOB_RETRY_SECONDS,
+        retention_days: float = JOB_RETENTION_DAYS,
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease)
+        self.retry_delay = retry_delay
+        self.retention = timedelta(days=retention_days)
+        self.handlers = {}
+        self.counts = {"enqueued": 0, "coalesced": 0, "done": 0, "retried": 0, "failed": 0}
+        self.counts_lock = threading.Lock()
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.pruned_at = 0.0
+
+    def _after_fork(self):
+        # Worker threads don't survive fork; start fresh ones in the child.
+        running = bool(self.threads)
+        self._reset()
+        if running:
+            self.start()
+
+    def _count(self, name: str):
+        with self.counts_lock:
+            self.counts[name] += 1
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind: str, merchant_id: str = None, payload: dict = None, dedupe_key: str = None,
+                max_attempts: int = 3, delay: float = 0.0, replace=None) -> dict:
+        """Queue a job, or fold it into the queued job with ``dedupe_key``.
+
+        ``replace(queued_payload, payload)`` decides whether the new payload
+        overwrites the queued job's; by default it always does.
+        """
+        body = json.dumps(payload or {})
+        with self.session_factory() as db:
+            while True:
+                if dedupe_key:
+                    job = db.query(Job).filter_by(dedupe_key=dedupe_key, status="queued").first()
+                    if job is not None:
+                        if replace is None or replace(json.loads(job.payload or "{}"), payload or {}):
+                            job.payload = body
+                        db.commit()
+                        self._count("coalesced")
+                        return job_dict(job)
+                job = Job(
+                    kind=kind,
+                    merchant_id=merchant_id,
+                    dedupe_key=dedupe_key,
+                    payload=body,
+                    max_attempts=max_attempts,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay),
+                )
+                db.add(job)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Another process queued the same key first; coalesce into it.
+                    db.rollback()
+                    continue
+                self._count("enqueued")
+                self.wakeup.set()
+                return job_dict(job)
+
+    def get(self, job_id: int):
+        with self.session_factory() as db:
+            job = db.get(Job, job_id)
+            return job_dict(job) if job else None
+
+    def recent(self, merchant_id: str = None, limit: int = 20):
+        with self.session_factory() as db:
+            q = db.query(Job)
+            if merchant_id is not None:
+                q = q.filter(Job.merchant_id == merchant_id)
+            return [job_dict(j) for j in q.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit)]
+
+    def claim(self):
+        """Mark the next runnable job as running and return it (or None)."""
+        if not self.handlers:
+            return None
+        now = datetime.utcnow()
+        candidate = aliased(Job)
+        running = aliased(Job)
+        busy = exists().where(
+            running.dedupe_key == candidate.dedupe_key,
+            running.id != candidate.id,
+            running.status == "running",
+            running.locked_until > now,
+        )
+        next_id = (
+            select(candidate.id)
+            .where(
+                candidate.kind.in_(list(self.handlers)),
+                or_(
+                    and_(candidate.status == "queued", candidate.run_at <= now),
+                    # Lease ran out: the worker running it died.
+                    and_(candidate.status == "running", candidate.locked_until <= now),
+                ),
+                ~busy,
+            )
+            .order_by(candidate.run_at, candidate.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(Job)
+            .where(Job.id == next_id)
+            .values(status="running", attempts=Job.attempts + 1, started_at=now, locked_until=now + self.lease)
+            .returning(Job.id, Job.kind, Job.merchant_id, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        )
+        with self.session_factory() as db:
+            row = db.execute(stmt).first()
+            db.commit()
+        return row
+
+    def _finish(self, job_id: int, result):
+        with self.session_factory() as db:
+            db.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(
+                    status="done",
+                    finished_at=datetime.utcnow(),
+                    locked_until=None,
+                    error=None,
+                    result=json.dumps(result, default=str) if result is not None else None,
+                )
+            )
+            db.commit()
+        self._count("done")
+
+    def _fail(self, job, error: str):
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            if job.attempts < job.max_attempts:
+                backoff = self.retry_delay * 2 ** (job.attempts - 1)
+                db.execute(
+                    update(Job)
+                    .where(Job.id == job.id)
+                    .values(status="queued", run_at=now + timedelta(seconds=backoff), locked_until=None, error=error)
+                )
+                try:
+                    db.commit()
+                    self._count("retried")
+                    return
+                except IntegrityError:
+                    # A newer request for the same key is already queued.
+                    db.rollback()
+                    error += " (superseded by a queued job)"
+            db.execute(
+                update(Job)
+                .where(Job.id == job.id)
+                .values(status="failed", finished_at=now, locked_until=None, error=error)
+            )
+            db.commit()
+        self._count("failed")
+
+    def run_once(self) -> bool:
+        """Run one job if any is due; return False when the queue is idle."""
+        job = self.claim()
+        if job is None:
+            return False
+        if job.attempts > job.max_attempts:
+            self._fail(job, "lease expired")
+            return True
+        try:
+            result = self.handlers[job.kind](job.merchant_id, json.loads(job.payload or "{}"))
+        except JobError as exc:
+            self._fail(job, str(exc))
+        except Exception as exc:
+            traceback.print_exc()
+            self._fail(job, f"{type(exc).__name__}: {exc}")
+        else:
+            self._finish(job.id, result)
+        return True
+
+    def prune(self):
+        """Delete finished jobs older than the retention period."""
+        cutoff = datetime.utcnow() - self.retention
+        with self.session_factory() as db:
+            db.execute(delete(Job).where(Job.status.in_(("done", "failed")), Job.finished_at < cutoff))
+            db.commit()
+
+    def _work(self):
+        while not self.stopped.is_set():
+            try:
+                if self.run_once():
+                    continue
+                if time.monotonic() - self.pruned_at > 3600:
+                    self.pruned_at = time.monotonic()
+                    self.prune()
+            except Exception:
+                traceback.print_exc()
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def start(self, workers: int = None):
+        workers = self.workers if workers is None else workers
+        while len(self.threads) < workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self.threads)}", daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        """Stop claiming jobs; a job already running finishes or is re-leased."""
+        self.stopped.set()
+        self.wakeup.set()
+
+    def stats(self):
+        with self.session_factory() as db:
+            by_status = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+        with self.counts_lock:
+            return {"workers": len(self.threads), "jobs": by_status, **self.counts}
+
+
+if __name__ == "__main__":
+    os.environ["JOB_WORKERS"] = "0"
+    # Importing the app registers the handlers without starting web workers.
+    from app import job_queue
+
+    job_queue.start(int(sys.argv[1]) if len(sys.argv) > 1 else 2)
+    try:
+        while not job_queue.stopped.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        job_queue.stop()
@@ -0,0 +1,126 @@
+"""Process-wide, pooled OpenRouter clients with warm keep-alive connections."""
+import asyncio
+import importlib.util
+import os
+import threading
+
+import httpx
+import openai
+
+BASE_URL = "https://openrouter.ai/api/v1"
+POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "20"))
+KEEPALIVE_SECONDS = float(os.getenv("OPENROUTER_KEEPALIVE", "60"))
+PREWARM_CONNECTIONS = int(os.getenv("OPENROUTER_PREWARM", "2"))
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_SIZE,
+        max_keepalive_connections=POOL_SIZE,
+        keepalive_expiry=KEEPALIVE_SECONDS,
+    )
+
+
+def _pool_stats(http_client):
+    # httpx does not expose pool state publicly; read httpcore's pool if present.
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    conns = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in conns if c.is_idle())
+    return {"size": POOL_SIZE, "open": len(conns), "idle": idle, "active": len(conns) - idle}
+
+
+class ClientManager:
+    """Hands out shared OpenAI clients, rebuilding them after a fork."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.lock = threading.Lock()
+        self.started = False
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        # Connections inherited from the parent must never be reused.
+        self.pid = os.getpid()
+        self.client = None
+        self.http = None
+        self.async_clients = {}
+        self.lock = threading.Lock()
+
+    def _after_fork(self):
+        # Preforked workers warm their own pool instead of waiting for a chat.
+        self._reset()
+        if self.started:
+            self.get_client()
+
+    def start(self):
+        """Create and prewarm the sync client now rather than on the first chat."""
+        self.started = True
+        self.get_client()
+
+    def get_client(self) -> openai.OpenAI:
+        if self.client is None or self.pid != os.getpid():
+            with self.lock:
+                if self.client is None or self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self.http = httpx.Client(limits=_limits(), http2=HTTP2)
+                    self.client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=BASE_URL,
+                        http_client=self.http,
+                    )
+                    threading.Thread(target=self.prewarm, daemon=True).start()
+        return self.client
+
+    def get_async_client(self) -> openai.AsyncOpenAI:
+        """Return the async client bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        entry = self.async_clients.get(id(loop))
+        if entry is None:
+            http = httpx.AsyncClient(limits=_limits(), http2=HTTP2)
+            client = openai.AsyncOpenAI(api_key=self.api_key, base_url=BASE_URL, http_client=http)
+            entry = self.async_clients[id(loop)] = (client, http)
+        return entry[0]
+
+    def prewarm(self, connections: int = PREWARM_CONNECTIONS):
+        """Open keep-alive connections so the first chat skips the handshake."""
+        self.get_client()
+        http = self.http
+
+        def ping():
+            try:
+                http.get(f"{BASE_URL}/models", timeout=5)
+            except Exception:
+                pass
+
+        threads = [threading.Thread(target=ping) for _ in range(connections)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    async def aprewarm(self, connections: int = PREWARM_CONNECTIONS):
+        self.get_async_client()
+        http = self.async_clients[id(asyncio.get_running_loop())][1]
+
+        async def ping():
+            try:
+                await http.get(f"{BASE_URL}/models", timeout=5)
+            except Exception:
+                pass
+
+        await asyncio.gather(*(ping() for _ in range(connections)))
+
+    async def aclose(self):
+        entry = self.async_clients.pop(id(asyncio.get_running_loop()), None)
+        if entry is not None:
+            await entry[0].close()
+
+    def stats(self):
+        data = {"pid": self.pid, "http2": HTTP2, "keepalive": KEEPALIVE_SECONDS}
+        if self.http is not None:
+            data["sync"] = _pool_stats(self.http)
+        data["async"] = [_pool_stats(http) for _, http in self.async_clients.values()]
+        return data
@@ -0,0 +1,189 @@
+"""Write-behind usage metering: buffer per-merchant deltas and flush in bulk.
+
+Each flush also adds the deltas to the daily and monthly rows of
+merchant_usage_rollups, which back the usage reports (usage_report.py).
+"""
+import atexit
+import os
+import threading
+import traceback
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+
+from models import MerchantUsage, MerchantCredit, UsageRollup
+from sharding import router
+
+ROLLUP_FIELDS = ("tokens", "requests", "faq_hits", "llm_calls")
+
+
+def consume_credits(db, merchant_id: str, tokens: int):
+    """Draw ``tokens`` from the merchant's oldest credits first (no commit)."""
+    credits = (
+        db.query(MerchantCredit)
+        .filter_by(merchant_id=merchant_id)
+        .order_by(MerchantCredit.id)
+        .all()
+    )
+    remaining = tokens
+    for c in credits:
+        available = c.tokens - c.used_tokens
+        if available <= 0:
+            continue
+        take = min(available, remaining)
+        c.used_tokens += take
+        remaining -= take
+        if remaining <= 0:
+            break
+
+
+class UsageMeter:
+    """Accumulates token/request deltas in memory and upserts them periodically."""
+
+    def __init__(self, router=router, interval: float = 2.0, on_flush=None):
+        self.router = router
+        self.interval = interval
+        self.on_flush = on_flush
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.usage = defaultdict(lambda: [0, 0])
+        self.credits = defaultdict(int)
+        self.rollups = defaultdict(lambda: [0, 0, 0, 0])
+        # Deltas taken by an in-progress flush still count until it finishes.
+        self.flushing = {}
+        self.flushing_credits = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _after_fork(self):
+        # Deltas buffered in the parent belong to the parent; start clean.
+        running = self.thread is not None
+        self._reset()
+        if running:
+            self.start()
+
+    def record(
+        self, merchant_id: str, month: str, tokens: int = 0, requests: int = 0, faq_hits: int = 0, llm_calls: int = 0
+    ):
+        """Queue a usage delta; tokens are also drawn from credits on flush."""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        with self.lock:
+            delta = self.usage[(merchant_id, month)]
+            delta[0] += tokens
+            delta[1] += requests
+            if tokens:
+                self.credits[merchant_id] += tokens
+            rollup = self.rollups[(merchant_id, day)]
+            rollup[0] += tokens
+            rollup[1] += requests
+            rollup[2] += faq_hits
+            rollup[3] += llm_calls
+
+    def pending(self, merchant_id: str, month: str):
+        """Return (tokens, requests) recorded but not yet flushed."""
+        with self.lock:
+            delta = self.usage.get((merchant_id, month)) or (0, 0)
+            inflight = self.flushing.get((merchant_id, month)) or (0, 0)
+            return (delta[0] + inflight[0], delta[1] + inflight[1])
+
+    def pending_credits(self, merchant_id: str) -> int:
+        with self.lock:
+            return self.credits.get(merchant_id, 0) + self.flushing_credits.get(merchant_id, 0)
+
+    def flush(self):
+        """Write buffered deltas, one transaction per shard; re-queue failures."""
+        with self.flush_lock:
+            with self.lock:
+                usage, self.usage = self.usage, defaultdict(lambda: [0, 0])
+                credits, self.credits = self.credits, defaultdict(int)
+                rollups, self.rollups = self.rollups, defaultdict(lambda: [0, 0, 0, 0])
+                self.flushing, self.flushing_credits = usage, credits
+            if not usage and not credits and not rollups:
+                return
+            failed = set()
+            merchants = {mid for mid, _ in usage} | set(credits) | {mid for mid, _ in rollups}
+            for key, mids in self.router.partition(merchants).items():
+                mids = set(mids)
+                try:
+                    self._write(key, mids, usage, credits, rollups)
+                except Exception:
+                    traceback.print_exc()
+                    failed |= mids
+            if self.on_flush and merchants - failed:
+                self.on_flush(merchants - failed)
+            with self.lock:
+                self.flushing, self.flushing_credits = {}, {}
+                for key, (t, r) in usage.items():
+                    if key[0] in failed:
+                        self.usage[key][0] += t
+                        self.usage[key][1] += r
+                for mid, tokens in credits.items():
+                    if mid in failed:
+                        self.credits[mid] += tokens
+                for key, delta in rollups.items():
+                    if key[0] in failed:
+                        pending = self.rollups[key]
+                        for i, n in enumerate(delta):
+                            pending[i] += n
+
+    def _write(self, shard_key, merchant_ids, usage, credits, rollups):
+        rows = [
+            {"merchant_id": mid, "month": month, "tokens": t, "requests": r}
+            for (mid, month), (t, r) in usage.items()
+            if mid in merchant_ids and (t or r)
+        ]
+        buckets = defaultdict(lambda: [0, 0, 0, 0])
+        for (mid, day), delta in rollups.items():
+            if mid not in merchant_ids or not any(delta):
+                continue
+            for key in ((mid, "day", day), (mid, "month", day[:7])):
+                total = buckets[key]
+                for i, n in enumerate(delta):
+                    total[i] += n
+        rollup_rows = [
+            dict(zip(("merchant_id", "period", "bucket") + ROLLUP_FIELDS, key + tuple(delta)))
+            for key, delta in buckets.items()
+        ]
+        with self.router.session_for_key(shard_key) as db:
+            if rows:
+                stmt = insert(MerchantUsage)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["merchant_id", "month"],
+                    set_={
+                        "tokens": MerchantUsage.tokens + stmt.excluded.tokens,
+                        "requests": MerchantUsage.requests + stmt.excluded.requests,
+                    },
+                )
+                db.execute(stmt, rows)
+            if rollup_rows:
+                stmt = insert(UsageRollup)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["merchant_id", "period", "bucket"],
+                    set_={f: getattr(UsageRollup, f) + getattr(stmt.excluded, f) for f in ROLLUP_FIELDS},
+                )
+                db.execute(stmt, rollup_rows)
+            for mid, tokens in credits.items():
+                if mid in merchant_ids:
+                    consume_credits(db, mid, tokens)
+            db.commit()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="usage-meter", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop the flusher and write out whatever is still buffered."""
+        self.stopped.set()
+        self.flush()
@@ -0,0 +1,196 @@
+"""Versioned schema migrations for bots.db, tracked with PRAGMA user_version.
+
+Run ``python migrations.py`` from the backend folder to upgrade an existing
+database and check that the hot queries are served by indexes.
+"""
+import sys
+
+from models import engine, init_db
+
+
+def find_index(conn, table: str, columns, unique: bool = False):
+    """Return the name of an index on exactly ``columns`` or None."""
+    for row in conn.exec_driver_sql(f"PRAGMA index_list({table})").fetchall():
+        name, is_unique = row[1], row[2]
+        if unique and not is_unique:
+            continue
+        cols = [r[2] for r in conn.exec_driver_sql(f"PRAGMA index_info('{name}')")]
+        if cols == list(columns):
+            return name
+    return None
+
+
+def table_exists(conn, table: str) -> bool:
+    row = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).first()
+    return row is not None
+
+
+def ensure_index(conn, name: str, table: str, columns, unique: bool = False):
+    # Shard files and the central file each hold only part of the schema.
+    if not table_exists(conn, table) or find_index(conn, table, columns, unique):
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.exec_driver_sql(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+
+
+def dedupe(conn, table: str, columns, sums=(), newest: str = "rowid"):
+    """Collapse duplicate rows on ``columns`` into the most recently written one.
+
+    The kept row is the one with the latest ``newest`` value, ties (and NULLs)
+    going to the highest rowid, i.e. the last inserted; ids are not compared
+    since they may be random UUIDs. Rows with a NULL in any of ``columns``
+    are left alone: a unique index treats NULLs as distinct, so they never
+    conflict.
+    """
+    if not table_exists(conn, table):
+        return
+    key = ", ".join(columns)
+    keyed = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+    match = " AND ".join(f"d.{c} = {table}.{c}" for c in columns)
+    order = "rowid DESC" if newest == "rowid" else f"{newest} DESC, rowid DESC"
+    keep = (
+        f"SELECT rid FROM (SELECT rowid AS rid, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY {order}) AS n"
+        f" FROM {table} WHERE {keyed}) WHERE n = 1"
+    )
+    for col in sums:
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET {col} = (SELECT SUM(COALESCE(d.{col}, 0)) FROM {table} d WHERE {match})"
+            f" WHERE rowid IN ({keep})"
+        )
+    conn.exec_driver_sql(f"DELETE FROM {table} WHERE {keyed} AND rowid NOT IN ({keep})")
+
+
+def m001_usage_unique(conn):
+    dedupe(conn, "merchant_usage", ["merchant_id", "month"], sums=["tokens", "requests"])
+    ensure_index(conn, "uq_usage_month", "merchant_usage", ["merchant_id", "month"], unique=True)
+
+
+def m002_hot_query_indexes(conn):
+    dedupe(conn, "merchant_products", ["merchant_id", "url"], newest="scraped_at")
+    ensure_index(conn, "uq_merchant_url", "merchant_products", ["merchant_id", "url"], unique=True)
+    ensure_index(conn, "ix_merchant_logs_merchant_ts", "merchant_logs", ["merchant_id", "timestamp"])
+    ensure_index(conn, "ix_error_logs_merchant_ts", "error_logs", ["merchant_id", "timestamp"])
+    ensure_index(conn, "ix_subscriptions_merchant_start", "subscriptions", ["merchant_id", "start_date"])
+    ensure_index(conn, "ix_subscriptions_stripe_id", "subscriptions", ["stripe_subscription_id"])
+    ensure_index(conn, "ix_merchant_credits_merchant", "merchant_credits", ["merchant_id"])
+
+
+def m003_merchant_faqs(conn):
+    """Scope FAQs by merchant; existing rows become the shared set ("")."""
+    if not table_exists(conn, "faqs"):
+        return
+    columns = [r[1] for r in conn.exec_driver_sql("PRAGMA table_info(faqs)")]
+    if "merchant_id" in columns:
+        return
+    # The old table has an inline UNIQUE(question), which SQLite cannot drop.
+    conn.exec_driver_sql("ALTER TABLE faqs RENAME TO faqs_old")
+    conn.exec_driver_sql(
+        "CREATE TABLE faqs (id INTEGER PRIMARY KEY, merchant_id VARCHAR DEFAULT '' NOT NULL,"
+        " question TEXT NOT NULL, answer TEXT,"
+        " CONSTRAINT uq_faq_question UNIQUE (merchant_id, question))"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO faqs (id, merchant_id, question, answer)"
+        " SELECT id, '', question, answer FROM faqs_old WHERE question IS NOT NULL"
+    )
+    conn.exec_driver_sql("DROP TABLE faqs_old")
+
+
+def m004_product_content_hash(conn):
+    if not table_exists(conn, "merchant_products"):
+        return
+    columns = [r[1] for r in conn.exec_driver_sql("PRAGMA table_info(merchant_products)")]
+    if "content_hash" not in columns:
+        conn.exec_driver_sql("ALTER TABLE merchant_products ADD COLUMN content_hash VARCHAR")
+
+
+def m005_analytics_events_index(conn):
+    ensure_index(conn, "ix_analytics_events_merchant_ts", "analytics_events", ["merchant_id", "timestamp"])
+
+
+def m006_usage_rollups(conn):
+    """Seed the monthly rollups from merchant_usage."""
+    if not table_exists(conn, "merchant_usage") or not table_exists(conn, "merchant_usage_rollups"):
+        return
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO merchant_usage_rollups"
+        " (merchant_id, period, bucket, tokens, requests, faq_hits, llm_calls)"
+        " SELECT merchant_id, 'month', month, COALESCE(tokens, 0), COALESCE(requests, 0), 0, 0"
+        " FROM merchant_usage WHERE merchant_id IS NOT NULL AND month IS NOT NULL"
+    )
+
+
+MIGRATIONS = [
+    m001_usage_unique,
+    m002_hot_query_indexes,
+    m003_merchant_faqs,
+    m004_product_content_hash,
+    m005_analytics_events_index,
+    m006_usage_rollups,
+]
+
+
+def schema_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(bind=engine):
+    """Apply every migration newer than the database's user_version."""
+    with bind.begin() as conn:
+        version = schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+        return schema_version(conn)
+
+
+HOT_QUERIES = {
+    "usage by merchant/month": "SELECT tokens FROM merchant_usage WHERE merchant_id = ? AND month = ?",
+    "products by merchant": "SELECT * FROM merchant_products WHERE merchant_id = ?",
+    "recent logs": "SELECT * FROM merchant_logs WHERE merchant_id = ? ORDER BY timestamp DESC LIMIT 50",
+    "latest subscription": "SELECT * FROM subscriptions WHERE merchant_id = ? ORDER BY start_date DESC LIMIT 1",
+    "recent errors": "SELECT * FROM error_logs WHERE merchant_id = ? ORDER BY timestamp DESC",
+    "stripe subscription": "SELECT * FROM subscriptions WHERE stripe_subscription_id = ?",
+    "merchant faqs": "SELECT * FROM faqs WHERE merchant_id = ?",
+    "recent analytics events": "SELECT * FROM analytics_events WHERE merchant_id = ? ORDER BY timestamp DESC LIMIT 50",
+    "usage rollups by bucket": "SELECT * FROM merchant_usage_rollups WHERE period = ? AND bucket >= ?",
+    "merchant usage history": "SELECT * FROM merchant_usage_rollups"
+    " WHERE merchant_id = ? AND period = ? AND bucket >= ?",
+    "hourly analytics": "SELECT * FROM analytics_hourly WHERE merchant_id = ? AND hour >= ?",
+}
+
+
+def check_query_plans(bind=engine):
+    """Return {name: (ok, plan)} for HOT_QUERIES using EXPLAIN QUERY PLAN."""
+    results = {}
+    with bind.connect() as conn:
+        for name, sql in HOT_QUERIES.items():
+            table = sql.split(" FROM ")[1].split()[0]
+            if not table_exists(conn, table):
+                continue
+            params = tuple("x" for _ in range(sql.count("?")))
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plan = [r[-1] for r in rows]
+            ok = all("INDEX" in step for step in plan if step.startswith(("SCAN", "SEARCH")))
+            ok = ok and not any("TEMP B-TREE" in step for step in plan)
+            results[name] = (ok, plan)
+    return results
+
+
+if __name__ == "__main__":
+    init_db()
+    with engine.connect() as conn:
+        print(f"schema version {schema_version(conn)}")
+    from sharding import router
+
+    binds = [("", engine)]
+    if router.enabled:
+        binds += [(f"[{key}] ", router.engine_for_key(key)) for key in router.keys()]
+    failed = False
+    for label, bind in binds:
+        for name, (ok, plan) in check_query_plans(bind).items():
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {label}{name}: {'; '.join(plan)}")
+    sys.exit(1 if failed else 0)
@@ -20,7 +20,14 @@ from sqlalchemy import (
 
     UniqueConstraint,
 
+    Index,
+
+    event,
+
+    text,
+
 )
+from sqlalchemy.pool import QueuePool
 
 from sqlalchemy.orm import declarative_base, sessionmaker
 from flask_login import UserMixin
@@ -28,7 +35,60 @@ from sqlalchemy.orm import relationship
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'bots.db')
 
-engine = create_engine(f'sqlite:///{DB_PATH}', connect_args={"check_same_thread": False})
+# Applied to every pooled connection. WAL lets readers proceed while a
+# writer commits; NORMAL sync is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "20000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+# "0" keeps every table in bots.db. A number N routes merchant-scoped
+# tables to N hash-bucketed shard files; "merchant" uses one file per merchant.
+STORAGE_SHARDS = os.getenv("STORAGE_SHARDS", "0")
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(os.path.dirname(__file__), "shards"))
+# Memory-mapped catalog snapshots written after each product sync (see search.py).
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "snapshots"))
+MERCHANT_SCOPED_TABLES = (
+    "merchant_products",
+    "merchant_logs",
+    "merchant_usage",
+    "merchant_usage_rollups",
+    "merchant_credits",
+    "error_logs",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def make_engine(path: str, pool_size: int, max_overflow: int):
+    """Create a pooled SQLite engine with the production pragmas applied."""
+    eng = create_engine(
+        f'sqlite:///{path}',
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+    )
+    event.listen(eng, "connect", _apply_sqlite_pragmas)
+    return eng
+
+
+engine = make_engine(
+    DB_PATH,
+    pool_size=int(os.getenv("SQLITE_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("SQLITE_POOL_OVERFLOW", "20")),
+)
+
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 Base = declarative_base()
 
@@ -91,6 +151,11 @@ class Subscription(Base):
     stripe_subscription_id = Column(String)
     grace_end = Column(DateTime)
 
+    __table_args__ = (
+        Index("ix_subscriptions_merchant_start", "merchant_id", "start_date"),
+        Index("ix_subscriptions_stripe_id", "stripe_subscription_id"),
+    )
+
 
 class Payment(Base):
     __tablename__ = 'payments'
@@ -119,6 +184,10 @@ class MerchantCredit(Base):
     used_tokens = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_merchant_credits_merchant", "merchant_id"),
+    )
+
 
 class Product(Base):
 
@@ -140,6 +209,9 @@ class Product(Base):
 
     scraped_at = Column(DateTime, default=datetime.utcnow)
 
+    # sha1 of the synced fields; lets catalog_sync skip unchanged rows.
+    content_hash = Column(String)
+
     __table_args__ = (
         UniqueConstraint("merchant_id", "url", name="uq_merchant_url"),
     )
@@ -152,6 +224,27 @@ class MerchantUsage(Base):
     tokens = Column(Integer, default=0)
     requests = Column(Integer, default=0)
 
+    __table_args__ = (
+        UniqueConstraint("merchant_id", "month", name="uq_usage_month"),
+    )
+
+class UsageRollup(Base):
+    """Daily and monthly usage per merchant, maintained by metering.UsageMeter."""
+
+    __tablename__ = 'merchant_usage_rollups'
+    merchant_id = Column(String, primary_key=True)
+    # "day" buckets are "YYYY-MM-DD", "month" buckets "YYYY-MM".
+    period = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    tokens = Column(Integer, default=0, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    faq_hits = Column(Integer, default=0, nullable=False)
+    llm_calls = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_usage_rollups_period_bucket", "period", "bucket"),
+    )
+
 class MerchantLog(Base):
     __tablename__ = 'merchant_logs'
     id = Column(Integer, primary_key=True)
@@ -161,6 +254,10 @@ class MerchantLog(Base):
     user = Column(Text)
     assistant = Column(Text)
 
+    __table_args__ = (
+        Index("ix_merchant_logs_merchant_ts", "merchant_id", "timestamp"),
+    )
+
 class AnalyticsEvent(Base):
     __tablename__ = 'analytics_events'
     id = Column(Integer, primary_key=True)
@@ -169,6 +266,18 @@ class AnalyticsEvent(Base):
     type = Column(String)
     details = Column(Text)
 
+    __table_args__ = (Index("ix_analytics_events_merchant_ts", "merchant_id", "timestamp"),)
+
+
+class AnalyticsHourly(Base):
+    """Per-merchant event counts per hour, maintained by analytics.py."""
+
+    __tablename__ = 'analytics_hourly'
+    merchant_id = Column(String, primary_key=True)
+    type = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
 
 class ErrorLog(Base):
     __tablename__ = 'error_logs'
@@ -178,6 +287,10 @@ class ErrorLog(Base):
     stack_trace = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_error_logs_merchant_ts", "merchant_id", "timestamp"),
+    )
+
 
 class Broadcast(Base):
     """Admin broadcast messages."""
@@ -186,8 +299,63 @@ class Broadcast(Base):
     message = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+
+class BotWelcome(Base):
+    """Widget welcome message for a merchant's bot."""
+    __tablename__ = "bots"
+    # The legacy column is called "name"; it has always held the merchant id.
+    merchant_id = Column("name", String, primary_key=True)
+    welcome_message = Column(Text)
+
+
+class Faq(Base):
+    """Stored question/answer pair; merchant_id "" holds the shared FAQs."""
+    __tablename__ = "faqs"
+    id = Column(Integer, primary_key=True)
+    merchant_id = Column(String, nullable=False, default="", server_default="")
+    question = Column(Text, nullable=False)
+    answer = Column(Text)
+
+    __table_args__ = (
+        UniqueConstraint("merchant_id", "question", name="uq_faq_question"),
+    )
+
+class Job(Base):
+    """Background job (product sync, billing run, export); see jobs.py."""
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    merchant_id = Column(String, ForeignKey("merchants.id"))
+    # Queued jobs with the same key are coalesced and never run concurrently.
+    dedupe_key = Column(String)
+    payload = Column(Text)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(Text)
+    result = Column(Text)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+        Index("ix_jobs_merchant_created", "merchant_id", "created_at"),
+        Index("uq_jobs_queued_key", "dedupe_key", unique=True, sqlite_where=text("status = 'queued'")),
+    )
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from migrations import run_migrations
+
+    tables = None
+    if STORAGE_SHARDS != "0":
+        # Merchant-scoped tables live in the shard files (see sharding.py).
+        tables = [t for t in Base.metadata.sorted_tables if t.name not in MERCHANT_SCOPED_TABLES]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    run_migrations(engine)
     with SessionLocal() as db:
         if not db.query(Plan).count():
             db.add_all([
@@ -0,0 +1,309 @@
+"""Extract product data from store pages (JSON-LD, Open Graph, microdata).
+
+The fast path scans the raw HTML with a few regular expressions for
+``application/ld+json`` scripts, ``og:``/``product:`` meta tags and links,
+without building a DOM. BeautifulSoup is only used when the scan can't be
+trusted (a JSON-LD tag it could not match), and for the part of a page
+holding schema.org microdata when that is the only product data.
+"""
+import html
+import json
+import re
+from collections import namedtuple
+from urllib.parse import urldefrag, urljoin
+
+from bs4 import BeautifulSoup
+
+PRODUCT_TYPES = {"Product", "IndividualProduct", "ProductModel", "SomeProducts"}
+
+LD_JSON_RE = re.compile(
+    r"<script\b[^>]*?type\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>(.*?)</script\s*>", re.I | re.S
+)
+LD_JSON_MARK_RE = re.compile(r"application/ld\+json", re.I)
+META_RE = re.compile(r"<meta\b([^>]*)>", re.I)
+ANCHOR_RE = re.compile(r"<a\b[^>]*?\shref\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+))", re.I)
+ATTR_RE = re.compile(r"([a-zA-Z_:.-]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+))")
+MICRODATA_RE = re.compile(r"itemtype\s*=\s*[\"']?https?://schema\.org/Product\b", re.I)
+MICRODATA_TYPE_RE = re.compile(r"schema\.org/Product$", re.I)
+WRAPPER_RE = re.compile(r"^\s*(?:<!--|<!\[CDATA\[)|(?:-->|\]\]>)\s*$")
+TAG_RE = re.compile(r"<[^>]+>")
+
+PageExtract = namedtuple("PageExtract", ["products", "links", "fast"])
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _text(value):
+    if isinstance(value, list):
+        value = next((v for v in value if isinstance(v, str)), None)
+    if not isinstance(value, str):
+        return value
+    return html.unescape(TAG_RE.sub(" ", value)).strip() or None
+
+
+def _types(node: dict):
+    """Bare type names: "schema:Product" and "http://schema.org/Product" -> "Product"."""
+    return {re.split(r"[/:#]", str(t))[-1] for t in _as_list(node.get("@type")) if t}
+
+
+def _index_ids(node, ids: dict, depth: int = 0):
+    """Map "@id" -> node for every node that carries more than a reference."""
+    if depth > 32:
+        return
+    if isinstance(node, list):
+        for item in node:
+            _index_ids(item, ids, depth + 1)
+    elif isinstance(node, dict):
+        if isinstance(node.get("@id"), str) and len(node) > 1:
+            ids.setdefault(node["@id"], node)
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                _index_ids(value, ids, depth + 1)
+
+
+def _resolve(node, ids: dict):
+    if isinstance(node, dict) and set(node) == {"@id"}:
+        return ids.get(node["@id"], node)
+    return node
+
+
+def _image(value, ids: dict, base_url: str):
+    for item in _as_list(value):
+        item = _resolve(item, ids)
+        if isinstance(item, dict):
+            item = item.get("url") or item.get("contentUrl")
+            if isinstance(item, list):
+                item = item[0] if item else None
+        if isinstance(item, str) and item.strip():
+            return urljoin(base_url, item.strip())
+    return None
+
+
+def _offer_price(offers, ids: dict, depth: int = 0):
+    """First price in an Offer, list of offers or AggregateOffer."""
+    for offer in _as_list(offers):
+        offer = _resolve(offer, ids)
+        if not isinstance(offer, dict):
+            continue
+        for key in ("price", "lowPrice"):
+            if offer.get(key) not in (None, ""):
+                return str(offer[key])
+        for spec in _as_list(offer.get("priceSpecification")):
+            spec = _resolve(spec, ids)
+            if isinstance(spec, dict) and spec.get("price") not in (None, ""):
+                return str(spec["price"])
+        if depth < 3 and offer.get("offers"):
+            price = _offer_price(offer["offers"], ids, depth + 1)
+            if price is not None:
+                return price
+    return None
+
+
+def _offer_url(offers, ids: dict):
+    for offer in _as_list(offers):
+        offer = _resolve(offer, ids)
+        if isinstance(offer, dict) and isinstance(offer.get("url"), str):
+            return offer["url"]
+    return None
+
+
+def _product(node: dict, ids: dict, base_url: str) -> dict:
+    url = node.get("url") if isinstance(node.get("url"), str) else _offer_url(node.get("offers"), ids)
+    if not url and isinstance(node.get("@id"), str):
+        # "@id" is usually the page URL plus a "#product" fragment.
+        url = urldefrag(node["@id"])[0] or None
+    return {
+        "title": _text(node.get("name")),
+        "description": _text(node.get("description")),
+        "price": _offer_price(node.get("offers"), ids),
+        "url": urljoin(base_url, url) if url else base_url,
+        "image": _image(node.get("image"), ids, base_url),
+    }
+
+
+def _price_key(price):
+    try:
+        return float(str(price).replace(",", ""))
+    except ValueError:
+        return float("inf")
+
+
+def _product_group(node: dict, ids: dict, base_url: str) -> dict:
+    """One product for a ProductGroup: group fields, lowest variant price."""
+    group = _product(node, ids, base_url)
+    variants = [
+        _product(v, ids, base_url)
+        for v in (_resolve(v, ids) for v in _as_list(node.get("hasVariant")))
+        if isinstance(v, dict)
+    ]
+    prices = [v["price"] for v in variants if v["price"] is not None]
+    if group["price"] is None and prices:
+        group["price"] = min(prices, key=_price_key)
+    if variants:
+        first = variants[0]
+        group["title"] = group["title"] or first["title"]
+        group["description"] = group["description"] or first["description"]
+        group["image"] = group["image"] or first["image"]
+        if not isinstance(node.get("url"), str):
+            group["url"] = first["url"]
+    return group
+
+
+def _walk(node, ids: dict, base_url: str, out: list, seen: set, depth: int = 0):
+    """Collect products anywhere in a JSON-LD document (@graph, ItemList, mainEntity...)."""
+    if depth > 32:
+        return
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, ids, base_url, out, seen, depth + 1)
+        return
+    node = _resolve(node, ids)
+    # A node can be reached both in @graph and through an @id reference.
+    if not isinstance(node, dict) or id(node) in seen:
+        return
+    seen.add(id(node))
+    types = _types(node)
+    if "ProductGroup" in types:
+        out.append(_product_group(node, ids, base_url))
+        return
+    if types & PRODUCT_TYPES:
+        out.append(_product(node, ids, base_url))
+        return
+    for key, value in node.items():
+        if key != "@context" and isinstance(value, (dict, list)):
+            _walk(value, ids, base_url, out, seen, depth + 1)
+
+
+def _load_json(text: str):
+    text = WRAPPER_RE.sub("", text.strip())
+    if not text:
+        return None
+    try:
+        # strict=False accepts raw newlines inside strings, which stores emit.
+        return json.loads(text, strict=False)
+    except ValueError:
+        return None
+
+
+def products_from_jsonld(blocks, base_url: str):
+    """Products from the text of each ld+json script on a page."""
+    documents = [doc for doc in (_load_json(b) for b in blocks) if doc is not None]
+    ids = {}
+    _index_ids(documents, ids)
+    out = []
+    _walk(documents, ids, base_url, out, set())
+    return [p for p in out if p["title"]]
+
+
+def product_from_meta(meta: dict, base_url: str):
+    """Open Graph product, only for pages that describe a product."""
+    title = meta.get("og:title")
+    price = meta.get("product:price:amount") or meta.get("og:price:amount")
+    if not title or ("product" not in (meta.get("og:type") or "") and price is None):
+        return None
+    image = meta.get("og:image")
+    return {
+        "title": _text(title),
+        "description": _text(meta.get("og:description")),
+        "price": price,
+        "url": urljoin(base_url, meta.get("og:url") or base_url),
+        "image": urljoin(base_url, image) if image else None,
+    }
+
+
+def _attrs(fragment: str) -> dict:
+    attrs = {}
+    for m in ATTR_RE.finditer(fragment):
+        value = next(g for g in m.groups()[1:] if g is not None)
+        attrs[m.group(1).lower()] = html.unescape(value)
+    return attrs
+
+
+def _scan_meta(text: str) -> dict:
+    meta = {}
+    for match in META_RE.finditer(text):
+        fragment = match.group(1)
+        if "og:" not in fragment and "product:" not in fragment:
+            continue
+        attrs = _attrs(fragment)
+        key = (attrs.get("property") or attrs.get("name") or "").lower()
+        if key and "content" in attrs:
+            meta.setdefault(key, attrs["content"])
+    return meta
+
+
+def _scan_links(text: str):
+    return [html.unescape(next(g for g in m.groups() if g is not None)) for m in ANCHOR_RE.finditer(text)]
+
+
+def _microdata_products(soup: BeautifulSoup, base_url: str):
+    products = []
+    for scope in soup.find_all(itemscope=True, itemtype=MICRODATA_TYPE_RE):
+        def prop(name):
+            el = scope.find(itemprop=name)
+            if el is None:
+                return None
+            value = el.get("content") or el.get("href") or el.get("src") or el.get_text(" ", strip=True)
+            return value or None
+
+        title = _text(prop("name"))
+        if not title:
+            continue
+        url, image = prop("url"), prop("image")
+        products.append(
+            {
+                "title": title,
+                "description": _text(prop("description")),
+                "price": prop("price") or prop("lowPrice"),
+                "url": urljoin(base_url, url) if url else base_url,
+                "image": urljoin(base_url, image) if image else None,
+            }
+        )
+    return products
+
+
+def _extract_with_soup(text: str, base_url: str) -> PageExtract:
+    """Full-parser fallback for pages the fast scan can't handle."""
+    soup = BeautifulSoup(text, "html.parser")
+    blocks = [s.string or "" for s in soup.find_all("script", type=re.compile(r"application/ld\+json", re.I))]
+    products = products_from_jsonld(blocks, base_url)
+    if not products:
+        products = _microdata_products(soup, base_url)
+    if not products:
+        meta = {}
+        for tag in soup.find_all("meta"):
+            key = (tag.get("property") or tag.get("name") or "").lower()
+            if key and tag.get("content") is not None:
+                meta.setdefault(key, tag["content"])
+        product = product_from_meta(meta, base_url)
+        products = [product] if product else []
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    return PageExtract(products, links, False)
+
+
+def extract_page(text: str, base_url: str) -> PageExtract:
+    """Products and outgoing links of one HTML page."""
+    blocks = LD_JSON_RE.findall(text)
+    if len(blocks) != len(LD_JSON_MARK_RE.findall(text)):
+        # A JSON-LD tag the scan couldn't match (odd markup); parse properly.
+        return _extract_with_soup(text, base_url)
+    products = products_from_jsonld(blocks, base_url)
+    fast = True
+    microdata = None if products else MICRODATA_RE.search(text)
+    if microdata:
+        # Only the markup from the first Product scope on needs a DOM.
+        start = max(text.rfind("<", 0, microdata.start()), 0)
+        products = _microdata_products(BeautifulSoup(text[start:], "html.parser"), base_url)
+        fast = False
+    if not products:
+        product = product_from_meta(_scan_meta(text), base_url)
+        products = [product] if product else []
+    return PageExtract(products, _scan_links(text), fast)
+
+
+def extract_products(text: str, base_url: str):
+    return extract_page(text, base_url).products
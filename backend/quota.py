@@ -0,0 +1,99 @@
+"""Reservation-based token quota enforcement for /chat."""
+import threading
+from collections import namedtuple
+
+Reservation = namedtuple("Reservation", ["merchant_id", "month", "tokens"])
+
+
+class QuotaEngine:
+    """Reserve estimated tokens before an LLM call and reconcile afterwards.
+
+    Committed usage comes from the entitlement snapshot (the durable
+    merchant_usage row) plus the usage meter's unflushed deltas; tokens
+    reserved by in-flight streams are tracked here under a lock so
+    concurrent chats cannot all pass the check against the same headroom.
+
+    Reservations, like the meter's unflushed deltas, live in this process
+    only: each worker enforces the limit against its own in-flight chats,
+    so with N workers a merchant can overshoot by up to N reservations
+    before the flushed usage catches up.
+    """
+
+    def __init__(self, meter, default_estimate: int = 300, headroom_factor: float = 1.5):
+        self.meter = meter
+        self.default_estimate = default_estimate
+        self.headroom_factor = headroom_factor
+        self.reserved = {}
+        self.averages = {}
+        self.lock = threading.Lock()
+        self.denied = 0
+
+    def limit(self, ent) -> float:
+        """Plan limit plus unspent credits for an Entitlements snapshot."""
+        limit = float("inf")
+        if ent.token_limit is not None and ent.token_limit >= 0:
+            limit = ent.token_limit
+        credits = ent.credit_tokens - self.meter.pending_credits(ent.merchant.id)
+        return limit + max(credits, 0)
+
+    def used(self, ent) -> int:
+        return ent.usage_tokens + self.meter.pending(ent.merchant.id, ent.month)[0]
+
+    def estimate(self, merchant_id: str) -> int:
+        avg = self.averages.get(merchant_id)
+        if avg is None:
+            return self.default_estimate
+        return max(int(avg * self.headroom_factor), 1)
+
+    def has_headroom(self, ent) -> bool:
+        """Cheap admission check used before any answer path runs."""
+        key = (ent.merchant.id, ent.month)
+        with self.lock:
+            ok = self.used(ent) + self.reserved.get(key, 0) < self.limit(ent)
+            if not ok:
+                self.denied += 1
+            return ok
+
+    def reserve(self, ent):
+        """Atomically reserve an estimated answer size, or return None.
+
+        A lone request is admitted whenever any headroom is left (as before);
+        concurrent requests must each fit their estimate.
+        """
+        merchant_id = ent.merchant.id
+        key = (merchant_id, ent.month)
+        tokens = self.estimate(merchant_id)
+        with self.lock:
+            reserved = self.reserved.get(key, 0)
+            committed = self.used(ent) + reserved
+            limit = self.limit(ent)
+            if committed >= limit or (reserved and committed + tokens > limit):
+                self.denied += 1
+                return None
+            self.reserved[key] = reserved + tokens
+        return Reservation(merchant_id, ent.month, tokens)
+
+    def release(self, reservation, actual_tokens: int = None):
+        """Return a reservation once its actual usage has been metered."""
+        if reservation is None:
+            return
+        key = (reservation.merchant_id, reservation.month)
+        with self.lock:
+            left = self.reserved.get(key, 0) - reservation.tokens
+            if left > 0:
+                self.reserved[key] = left
+            else:
+                self.reserved.pop(key, None)
+            if actual_tokens is not None:
+                avg = self.averages.get(reservation.merchant_id)
+                self.averages[reservation.merchant_id] = (
+                    actual_tokens if avg is None else avg * 0.8 + actual_tokens * 0.2
+                )
+
+    def stats(self):
+        with self.lock:
+            return {
+                "reservedTokens": sum(self.reserved.values()),
+                "openReservations": len(self.reserved),
+                "denied": self.denied,
+            }
@@ -0,0 +1,332 @@
+"""Indexes used on the /chat hot path (products and FAQs).
+
+Product search reads the merchant's memory-mapped catalog snapshot, which
+is rebuilt from the database after every sync (see catalog_snapshot.py).
+"""
+import difflib
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+
+from catalog_snapshot import CatalogSnapshot, SnapshotCache, write_snapshot
+from models import Merchant, Product, SNAPSHOT_DIR
+from sharding import merchant_session, safe_name
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Long HTML descriptions add little signal but a lot of postings.
+DESCRIPTION_CHARS = 1000
+TITLE_BOOST = 2
+STOPWORDS = {
+    "a", "an", "and", "are", "any", "at", "be", "do", "does", "for", "have",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "this",
+    "to", "what", "with", "you", "your",
+}
+
+IndexedProduct = namedtuple(
+    "IndexedProduct", ["id", "title", "description", "price", "url", "image_url"]
+)
+
+
+def tokenize(text: str):
+    """Case-fold and split text into index terms."""
+    return [t for t in TOKEN_RE.findall((text or "").casefold()) if t not in STOPWORDS]
+
+
+class ProductIndex:
+    """BM25 inverted index over a single merchant's catalog."""
+
+    def __init__(self, version=None, k1: float = 1.2, b: float = 0.75):
+        self.version = version
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, product):
+        """Insert or replace a product (ORM row or IndexedProduct)."""
+        doc = IndexedProduct(
+            str(product.id),
+            product.title,
+            product.description,
+            product.price,
+            product.url,
+            product.image_url,
+        )
+        terms = tokenize(doc.title) * TITLE_BOOST
+        terms += tokenize((doc.description or "")[:DESCRIPTION_CHARS])
+        counts = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        with self.lock:
+            self._remove(doc.id)
+            self.docs[doc.id] = doc
+            self.lengths[doc.id] = len(terms)
+            self.total_length += len(terms)
+            for term, tf in counts.items():
+                self.postings[term][doc.id] = tf
+
+    def remove(self, product_id: str):
+        with self.lock:
+            self._remove(str(product_id))
+
+    def _remove(self, product_id: str):
+        if product_id not in self.docs:
+            return
+        self.total_length -= self.lengths.pop(product_id)
+        old = self.docs.pop(product_id)
+        terms = set(tokenize(old.title))
+        terms.update(tokenize((old.description or "")[:DESCRIPTION_CHARS]))
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def products(self):
+        with self.lock:
+            return list(self.docs.values())
+
+    def _posting(self, term: str):
+        posting = self.postings.get(term, {})
+        return posting.keys(), posting.values()
+
+    def search(self, query: str, k: int = 3):
+        """Return up to ``k`` products sharing at least one term with ``query``."""
+        terms = set(tokenize(query))
+        with self.lock:
+            best = bm25(
+                terms,
+                len(self.docs),
+                self.total_length,
+                self._posting,
+                self.lengths,
+                k,
+                self.k1,
+                self.b,
+            )
+            return [self.docs[pid] for pid in best]
+
+    def snapshot_arrays(self):
+        """(docs, lengths, postings) with postings keyed by position in docs."""
+        with self.lock:
+            ids = list(self.docs)
+            position = {pid: i for i, pid in enumerate(ids)}
+            postings = {
+                term: sorted((position[pid], tf) for pid, tf in posting.items())
+                for term, posting in self.postings.items()
+            }
+            return [self.docs[pid] for pid in ids], [self.lengths[pid] for pid in ids], postings
+
+
+def bm25(terms, n: int, total_length: int, postings, lengths, k: int, k1: float, b: float):
+    """Return the ids of the ``k`` best BM25 matches.
+
+    ``postings(term)`` returns parallel (doc ids, term frequencies)
+    sequences and ``lengths[doc]`` the document's term count.
+    """
+    if not terms or not n:
+        return []
+    avg_len = (total_length / n) or 1
+    scores = defaultdict(float)
+    for term in terms:
+        docs, tfs = postings(term)
+        df = len(docs)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for doc, tf in zip(docs, tfs):
+            norm = tf + k1 * (1 - b + b * lengths[doc] / avg_len)
+            scores[doc] += idf * tf * (k1 + 1) / norm
+    return [doc for doc, _ in heapq.nlargest(k, scores.items(), key=lambda x: x[1])]
+
+
+class SnapshotIndex(CatalogSnapshot):
+    """Mapped catalog snapshot with the same search API as ProductIndex."""
+
+    product_type = IndexedProduct
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        super().__init__(path)
+        self.k1 = k1
+        self.b = b
+
+    def search(self, query: str, k: int = 3):
+        best = bm25(
+            set(tokenize(query)), self.count, self.total_length, self.postings, self.lengths, k, self.k1, self.b
+        )
+        return [self.product(i) for i in best]
+
+
+_snapshots = SnapshotCache(SnapshotIndex)
+
+
+def snapshot_path(merchant_id: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{safe_name(merchant_id)}.cat")
+
+
+def catalog_version(merchant, product_count: int):
+    """Version key used to detect snapshots built by an older sync."""
+    synced = merchant.product_last_synced if merchant else None
+    return (synced.isoformat() if synced else None, product_count)
+
+
+def get_index(merchant_id: str, version=None):
+    """Return the merchant's mapped snapshot, or None if missing or not ``version``."""
+    snap = _snapshots.get(snapshot_path(merchant_id))
+    if snap is None or (version is not None and snap.version != tuple(version)):
+        return None
+    return snap
+
+
+def refresh_index(merchant_id: str):
+    """Rebuild the merchant's catalog snapshot from the database after a sync.
+
+    Returns the mapped snapshot, or the in-memory index it was written from
+    if the new file can't be opened.
+    """
+    with merchant_session(merchant_id) as db:
+        m = db.query(Merchant).get(merchant_id)
+        rows = db.execute(
+            select(
+                Product.id, Product.title, Product.description, Product.price, Product.url, Product.image_url
+            )
+            .where(Product.merchant_id == merchant_id)
+        ).all()
+    idx = ProductIndex()
+    for row in rows:
+        idx.add(row)
+    path = snapshot_path(merchant_id)
+    write_snapshot(path, *idx.snapshot_arrays(), catalog_version(m, len(rows)))
+    snap = _snapshots.get(path)
+    return snap if snap is not None else idx
+
+
+def catalog(merchant_id: str):
+    """The merchant's current snapshot, built from the database if missing."""
+    # An empty catalog is a valid (falsy) snapshot; only rebuild when missing.
+    snap = get_index(merchant_id)
+    return snap if snap is not None else refresh_index(merchant_id)
+
+
+def snapshot_stats():
+    return _snapshots.stats()
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(TOKEN_RE.findall((text or "").casefold()))
+
+
+def shingles(text: str, size: int = 3):
+    padded = f" {text} "
+    return {padded[i:i + size] for i in range(max(len(padded) - size + 1, 1))}
+
+
+class FaqIndex:
+    """Trigram candidate index with exact SequenceMatcher re-scoring."""
+
+    def __init__(self, threshold: float = 0.6, shortlist: int = 20):
+        self.threshold = threshold
+        self.shortlist = shortlist
+        self.faqs = {}
+        self.by_question = {}
+        self.postings = defaultdict(set)
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.faqs)
+
+    def stale(self, max_age: float) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age
+
+    def load(self, rows):
+        """Replace the index contents with ``rows`` from ``get_faqs()``."""
+        with self.lock:
+            self.faqs = {}
+            self.by_question = {}
+            self.postings = defaultdict(set)
+            for r in rows:
+                self._add(r["id"], r["question"], r["answer"])
+            self.loaded_at = time.monotonic()
+
+    def rows(self):
+        """Indexed FAQs in the ``get_faqs()`` shape, oldest first."""
+        with self.lock:
+            return [
+                {"id": f["id"], "question": f["question"], "answer": f["answer"]}
+                for _, f in sorted(self.faqs.items())
+            ]
+
+    def add(self, faq_id: int, question: str, answer: str):
+        with self.lock:
+            self._add(faq_id, question, answer)
+
+    def _add(self, faq_id, question, answer):
+        previous = self.by_question.get(question)
+        if previous is not None:
+            self._remove(previous)
+        norm = normalize_question(question)
+        self.faqs[faq_id] = {
+            "id": faq_id,
+            "question": question,
+            "answer": answer,
+            "lower": question.lower(),
+            "shingles": shingles(norm),
+        }
+        self.by_question[question] = faq_id
+        for sh in self.faqs[faq_id]["shingles"]:
+            self.postings[sh].add(faq_id)
+
+    def _remove(self, faq_id):
+        faq = self.faqs.pop(faq_id, None)
+        if not faq:
+            return
+        self.by_question.pop(faq["question"], None)
+        for sh in faq["shingles"]:
+            ids = self.postings.get(sh)
+            if ids is not None:
+                ids.discard(faq_id)
+                if not ids:
+                    del self.postings[sh]
+
+    def match(self, text: str):
+        """Return the best FAQ whose question ratio exceeds the threshold."""
+        lower = (text or "").lower()
+        query = shingles(normalize_question(text))
+        with self.lock:
+            counts = defaultdict(int)
+            for sh in query:
+                for faq_id in self.postings.get(sh, ()):
+                    counts[faq_id] += 1
+            candidates = heapq.nlargest(self.shortlist, counts.items(), key=lambda x: x[1])
+            best, best_ratio = None, self.threshold
+            matcher = difflib.SequenceMatcher(None, lower, "")
+            for faq_id, _ in candidates:
+                faq = self.faqs[faq_id]
+                la, lb = len(lower), len(faq["lower"])
+                # ratio() can never exceed 2*min/(la+lb); skip hopeless lengths.
+                if la + lb == 0 or 2 * min(la, lb) / (la + lb) <= best_ratio:
+                    continue
+                matcher.set_seq2(faq["lower"])
+                if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+                    continue
+                ratio = matcher.ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = faq, ratio
+            if best is None:
+                return None
+            return {"id": best["id"], "question": best["question"], "answer": best["answer"]}
@@ -0,0 +1,207 @@
+"""Route merchant-scoped tables to shard files when STORAGE_SHARDS is set.
+
+Global tables (merchants, plans, subscriptions, payments, ...) always stay in
+bots.db. With sharding enabled, merchant_products, merchant_logs,
+merchant_usage, merchant_usage_rollups, merchant_credits and error_logs
+live in ``SHARD_DIR``: either ``bucket-NNN.db`` files chosen by a hash of
+the merchant id, or one ``merchant-<id>.db`` file per merchant. Each file
+has its own write lock, so a large catalog resync no longer blocks chat
+writes for other merchants.
+
+Run ``python sharding.py migrate`` from the backend folder to move rows from
+an existing bots.db into shard files.
+"""
+import os
+import re
+import sys
+import threading
+import zlib
+from collections import defaultdict
+
+from sqlalchemy.orm import Session
+
+from models import (
+    Base,
+    SessionLocal,
+    engine,
+    make_engine,
+    init_db,
+    STORAGE_SHARDS,
+    SHARD_DIR,
+    MERCHANT_SCOPED_TABLES,
+)
+
+SCOPED_TABLES = [Base.metadata.tables[name] for name in MERCHANT_SCOPED_TABLES]
+SAFE_ID_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def safe_name(merchant_id: str) -> str:
+    """File-name-safe form of a merchant id."""
+    safe = SAFE_ID_RE.sub("_", merchant_id)
+    if safe != merchant_id:
+        # Keep ids that only differ in unsafe characters apart.
+        safe = f"{safe}-{zlib.crc32(merchant_id.encode()):08x}"
+    return safe
+
+
+class ShardRouter:
+    """Map merchant ids to shard engines and build sessions bound to them."""
+
+    def __init__(self, mode: str = STORAGE_SHARDS, shard_dir: str = SHARD_DIR, central=engine):
+        self.mode = str(mode).strip().lower()
+        self.buckets = int(self.mode) if self.mode.isdigit() else 0
+        self.shard_dir = shard_dir
+        self.central = central
+        self.pool_size = int(os.getenv("SHARD_POOL_SIZE", "2"))
+        self.max_overflow = int(os.getenv("SHARD_POOL_OVERFLOW", "8"))
+        self.engines = {}
+        self.lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode not in ("", "0")
+
+    def _after_fork(self):
+        # Pooled sqlite connections must not be shared with the parent.
+        for eng in self.engines.values():
+            eng.dispose(close=False)
+
+    def shard_key(self, merchant_id: str) -> str:
+        """Return the shard file stem that stores ``merchant_id``."""
+        merchant_id = merchant_id or ""
+        if self.buckets:
+            return f"bucket-{zlib.crc32(merchant_id.encode()) % self.buckets:03d}"
+        return f"merchant-{safe_name(merchant_id)}"
+
+    def shard_path(self, key: str) -> str:
+        return os.path.join(self.shard_dir, f"{key}.db")
+
+    def engine_for_key(self, key: str):
+        """Open (and on first use create and migrate) a shard file."""
+        eng = self.engines.get(key)
+        if eng is not None:
+            return eng
+        from migrations import run_migrations
+
+        with self.lock:
+            eng = self.engines.get(key)
+            if eng is None:
+                os.makedirs(self.shard_dir, exist_ok=True)
+                eng = make_engine(self.shard_path(key), self.pool_size, self.max_overflow)
+                Base.metadata.create_all(bind=eng, tables=SCOPED_TABLES)
+                run_migrations(eng)
+                self.engines[key] = eng
+        return eng
+
+    def session_for_key(self, key: str) -> Session:
+        if key is None:
+            return SessionLocal()
+        shard = self.engine_for_key(key)
+        return Session(
+            bind=self.central,
+            binds={table: shard for table in SCOPED_TABLES},
+            expire_on_commit=False,
+        )
+
+    def session(self, merchant_id: str) -> Session:
+        """Session whose merchant-scoped tables point at the merchant's shard."""
+        if not self.enabled:
+            return SessionLocal()
+        return self.session_for_key(self.shard_key(merchant_id))
+
+    def keys(self):
+        """Every shard key that currently exists on disk or is open."""
+        if self.buckets:
+            return [f"bucket-{i:03d}" for i in range(self.buckets)]
+        keys = set(self.engines)
+        if os.path.isdir(self.shard_dir):
+            keys.update(
+                name[:-3]
+                for name in os.listdir(self.shard_dir)
+                if name.startswith("merchant-") and name.endswith(".db")
+            )
+        return sorted(keys)
+
+    def all_sessions(self):
+        """Yield one session per shard for cross-shard admin queries."""
+        if not self.enabled:
+            yield SessionLocal()
+            return
+        for key in self.keys():
+            yield self.session_for_key(key)
+
+    def group_key(self, merchant_id: str):
+        """Shard key for session_for_key(); None means the central database."""
+        return self.shard_key(merchant_id) if self.enabled else None
+
+    def partition(self, merchant_ids):
+        """Group merchant ids by shard key so writes batch per file."""
+        groups = defaultdict(list)
+        for mid in merchant_ids:
+            groups[self.group_key(mid)].append(mid)
+        return groups
+
+    def stats(self):
+        return {"mode": self.mode, "open": len(self.engines)}
+
+
+router = ShardRouter()
+
+
+def merchant_session(merchant_id: str) -> Session:
+    return router.session(merchant_id)
+
+
+def migrate_to_shards(batch_size: int = 1000):
+    """Copy merchant-scoped rows from bots.db into shard files.
+
+    Rows are inserted with OR IGNORE so an interrupted run can be restarted;
+    the central tables are renamed to ``<table>_unsharded`` once copied.
+    Returns {table: rows copied}.
+    """
+    if not router.enabled:
+        raise RuntimeError("set STORAGE_SHARDS before migrating")
+    copied = {}
+    with engine.connect() as central:
+        present = {
+            row[0]
+            for row in central.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        for table in SCOPED_TABLES:
+            if table.name not in present:
+                continue
+            merchants = [
+                row[0]
+                for row in central.exec_driver_sql(
+                    f"SELECT DISTINCT merchant_id FROM {table.name} WHERE merchant_id IS NOT NULL"
+                )
+            ]
+            count = 0
+            for key, mids in router.partition(merchants).items():
+                with router.engine_for_key(key).begin() as shard:
+                    for mid in mids:
+                        result = central.execute(table.select().where(table.c.merchant_id == mid))
+                        while True:
+                            rows = [dict(r._mapping) for r in result.fetchmany(batch_size)]
+                            if not rows:
+                                break
+                            shard.execute(table.insert().prefix_with("OR IGNORE"), rows)
+                            count += len(rows)
+            copied[table.name] = count
+        central.rollback()
+        for table in SCOPED_TABLES:
+            if table.name in present:
+                central.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}_unsharded")
+        central.commit()
+    return copied
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("usage: STORAGE_SHARDS=<n|merchant> python sharding.py migrate")
+        sys.exit(2)
+    init_db()
+    for name, count in migrate_to_shards().items():
+        print(f"{name}: {count} rows")
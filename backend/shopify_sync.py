@@ -0,0 +1,213 @@
+"""Full-catalog Shopify product sync over the GraphQL APIs.
+
+Storefront tokens page through ``products`` with cursors. Admin API tokens
+(``shpat_...``) are throttled from the ``extensions.cost`` data Shopify
+returns, and large catalogs are exported with a bulk operation whose JSONL
+result is streamed line by line, so memory does not grow with the download.
+"""
+import json
+import os
+import time
+
+import requests
+
+API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2024-04")
+PAGE_SIZE = 250
+BULK_THRESHOLD = int(os.getenv("SHOPIFY_BULK_THRESHOLD", "2000"))
+BULK_TIMEOUT = float(os.getenv("SHOPIFY_BULK_TIMEOUT", "1800"))
+ADMIN_TOKEN_PREFIXES = ("shpat_", "shpca_", "shppa_")
+
+STOREFRONT_FIELDS = "handle title description onlineStoreUrl featuredImage { url } priceRange { minVariantPrice { amount } }"
+ADMIN_FIELDS = "handle title description onlineStoreUrl featuredImage { url } priceRangeV2 { minVariantPrice { amount } }"
+
+PAGE_QUERY = """
+query($first: Int!, $after: String%(args)s) {
+  products(first: $first, after: $after%(filter)s) {
+    pageInfo { hasNextPage endCursor }
+    edges { node { %(fields)s } }
+  }
+}
+"""
+COUNT_QUERY = '{ productsCount(query: "status:active") { count } }'
+BULK_QUERY = '{ products(query: "status:active") { edges { node { %s } } } }' % ADMIN_FIELDS
+BULK_RUN = """
+mutation($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+BULK_POLL = "{ currentBulkOperation { id status errorCode objectCount url } }"
+
+
+class ShopifyError(Exception):
+    pass
+
+
+def base_url(domain: str) -> str:
+    """``shop.myshopify.com`` or a full URL (e.g. a local stand-in server)."""
+    domain = domain.strip().rstrip("/")
+    return domain if "://" in domain else f"https://{domain}"
+
+
+def product_from_node(node: dict, base: str) -> dict:
+    price_range = node.get("priceRangeV2") or node.get("priceRange") or {}
+    price = (price_range.get("minVariantPrice") or {}).get("amount")
+    image = node.get("featuredImage") or {}
+    url = node.get("onlineStoreUrl")
+    if not url and node.get("handle"):
+        url = f"{base}/products/{node['handle']}"
+    return {
+        "title": node.get("title"),
+        "description": node.get("description"),
+        "price": price,
+        "link": url,
+        "image_url": image.get("url"),
+    }
+
+
+class ShopifyClient:
+    """GraphQL client for one shop that waits out Shopify's rate limits."""
+
+    def __init__(
+        self,
+        domain: str,
+        token: str,
+        api_version: str = API_VERSION,
+        bulk_threshold: int = BULK_THRESHOLD,
+        bulk_timeout: float = BULK_TIMEOUT,
+        timeout: float = 30.0,
+        max_retries: int = 5,
+        session=None,
+        sleep=time.sleep,
+    ):
+        self.base = base_url(domain)
+        self.admin = token.startswith(ADMIN_TOKEN_PREFIXES)
+        if self.admin:
+            self.endpoint = f"{self.base}/admin/api/{api_version}/graphql.json"
+            header = "X-Shopify-Access-Token"
+        else:
+            self.endpoint = f"{self.base}/api/{api_version}/graphql.json"
+            header = "X-Shopify-Storefront-Access-Token"
+        self.session = session or requests.Session()
+        self.session.headers.update({header: token, "Content-Type": "application/json"})
+        self.bulk_threshold = bulk_threshold
+        self.bulk_timeout = bulk_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self.requests = 0
+        self.throttled = 0
+
+    def _wait_for_budget(self, cost):
+        """Sleep until the bucket can pay for another query of the same cost."""
+        status = (cost or {}).get("throttleStatus")
+        if not status:
+            return
+        needed = cost.get("requestedQueryCost") or 0
+        available = status.get("currentlyAvailable", needed)
+        rate = status.get("restoreRate") or 50
+        if available < needed:
+            self.throttled += 1
+            self.sleep((needed - available) / rate)
+
+    def execute(self, query: str, variables: dict = None) -> dict:
+        """Run a query and return its ``data``, retrying throttled requests."""
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            resp = self.session.post(
+                self.endpoint, json={"query": query, "variables": variables or {}}, timeout=self.timeout
+            )
+            if resp.status_code in (429, 430) or resp.status_code >= 500:
+                self.throttled += 1
+                self.sleep(float(resp.headers.get("Retry-After") or 2 ** attempt))
+                continue
+            resp.raise_for_status()
+            payload = resp.json()
+            cost = (payload.get("extensions") or {}).get("cost")
+            errors = payload.get("errors") or []
+            if any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in errors):
+                self.throttled += 1
+                if cost and cost.get("throttleStatus"):
+                    self._wait_for_budget(cost)
+                else:
+                    self.sleep(2 ** attempt)
+                continue
+            if errors:
+                raise ShopifyError("; ".join(e.get("message", "error") for e in errors))
+            self._wait_for_budget(cost)
+            return payload.get("data") or {}
+        raise ShopifyError("rate limited after %d attempts" % (self.max_retries + 1))
+
+    def iter_pages(self):
+        """Yield product dicts page by page, following ``endCursor``."""
+        if self.admin:
+            query = PAGE_QUERY % {"args": ", $query: String", "filter": ", query: $query", "fields": ADMIN_FIELDS}
+        else:
+            query = PAGE_QUERY % {"args": "", "filter": "", "fields": STOREFRONT_FIELDS}
+        variables = {"first": PAGE_SIZE, "after": None}
+        if self.admin:
+            variables["query"] = "status:active"
+        while True:
+            products = self.execute(query, variables).get("products") or {}
+            for edge in products.get("edges") or []:
+                yield product_from_node(edge.get("node") or {}, self.base)
+            page = products.get("pageInfo") or {}
+            if not page.get("hasNextPage") or not page.get("endCursor"):
+                return
+            variables["after"] = page["endCursor"]
+
+    def product_count(self):
+        """Active product count (Admin API only); None when unavailable."""
+        try:
+            return (self.execute(COUNT_QUERY).get("productsCount") or {}).get("count")
+        except (ShopifyError, requests.RequestException, ValueError):
+            return None
+
+    def run_bulk_export(self):
+        """Start a bulk product export and wait for it; return the JSONL URL."""
+        result = self.execute(BULK_RUN, {"query": BULK_QUERY}).get("bulkOperationRunQuery") or {}
+        if result.get("userErrors"):
+            raise ShopifyError("; ".join(e.get("message", "error") for e in result["userErrors"]))
+        operation_id = (result.get("bulkOperation") or {}).get("id")
+        deadline = time.monotonic() + self.bulk_timeout
+        interval = 1.0
+        while time.monotonic() < deadline:
+            self.sleep(interval)
+            interval = min(interval * 1.5, 10.0)
+            op = self.execute(BULK_POLL).get("currentBulkOperation") or {}
+            if operation_id and op.get("id") != operation_id:
+                raise ShopifyError("bulk operation was replaced")
+            status = op.get("status")
+            if status == "COMPLETED":
+                # No url means the export matched no products.
+                return op.get("url")
+            if status in ("FAILED", "CANCELED", "EXPIRED"):
+                raise ShopifyError(f"bulk operation {status.lower()}: {op.get('errorCode')}")
+        raise ShopifyError("bulk operation timed out")
+
+    def iter_bulk(self, url: str):
+        """Stream the bulk JSONL result, one product per line."""
+        if not url:
+            return
+        # A plain request: the signed download URL must not get the shop token.
+        with requests.get(url, stream=True, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                node = json.loads(line)
+                # Nested connections come back as child lines; only products are wanted.
+                if "__parentId" in node:
+                    continue
+                yield product_from_node(node, self.base)
+
+    def iter_products(self):
+        """Every active product: bulk export for large Admin catalogs, else pages."""
+        if self.admin:
+            count = self.product_count()
+            if count is not None and count >= self.bulk_threshold:
+                yield from self.iter_bulk(self.run_bulk_export())
+                return
+        yield from self.iter_pages()
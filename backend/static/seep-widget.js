@@ -1,6 +1,9 @@
 (function(){
   var s = document.currentScript;
-  var mid = s.getAttribute('data-merchant-id');
+  // Set by /widget/bootstrap/<id>.js, which inlines the merchant config.
+  var boot = window.__seepBootstrap || null;
+  window.__seepBootstrap = null;
+  var mid = s.getAttribute('data-merchant-id') || (boot && boot.merchantId);
   if(!mid){
     console.error('SEEP widget requires data-merchant-id');
     return;
@@ -15,10 +18,25 @@
   document.head.appendChild(link);
 
   function btn(text,url){var a=document.createElement('a');a.textContent=text;a.href=url;a.target='_blank';a.className='seep-btn';return a;}
-  function logEvent(ev,method){var u=host+'/log?event='+encodeURIComponent(ev);try{fetch(u,{method:method||'GET'});}catch(e){}}
+  // Telemetry is buffered and posted to /events in batches: every 10s, at
+  // 20 events, and when the page is hidden. Beacons are sent as text/plain
+  // so they need no CORS preflight.
+  var events=[];var flushTimer=null;
+  function flushEvents(){
+    if(flushTimer){clearTimeout(flushTimer);flushTimer=null;}
+    while(events.length){
+      var body=JSON.stringify({merchantId:mid,events:events.splice(0,100)});var sent=false;
+      try{sent=!!(navigator.sendBeacon&&navigator.sendBeacon(host+'/events',body));}catch(e){}
+      if(!sent){try{fetch(host+'/events',{method:'POST',body:body,keepalive:true});}catch(e){}}
+    }
+  }
   function track(ev,details){
-    try{fetch(host+'/analytics',{method:'POST',headers:{"Content-Type":"application/json"},body:JSON.stringify({merchantId:mid,event:ev,details:details})});}catch(e){}
+    events.push({event:ev,details:details,t:Date.now()});
+    if(events.length>=20)flushEvents();
+    else if(!flushTimer)flushTimer=setTimeout(flushEvents,10000);
   }
+  document.addEventListener('visibilitychange',function(){if(document.visibilityState==='hidden')flushEvents();});
+  window.addEventListener('pagehide',flushEvents);
   function stripMd(t){return t.replace(/\*\*|\*|_/g,'');}
   function linkify(t){return t.replace(/(https?:\/\/[^\s]+)/g,'<a href="$1" target="_blank">$1</a>');}
   function smartLinks(t){var l=t.toLowerCase();var b=[];
@@ -72,7 +90,7 @@
     b.onclick=function(){
       var open=f.style.display!=='flex';
       f.style.display=open?'flex':'none';
-      if(open){track('widget_opened');logEvent('open');}
+      if(open)track('widget_opened');
     };
     document.body.appendChild(b);document.body.appendChild(f);
     m=f.querySelector('#seep-messages');ta=f.querySelector('textarea');var btnEl=f.querySelector('button');hint=f.querySelector('#seep-hint');var actions=f.querySelector('#seep-actions');
@@ -81,12 +99,17 @@
     if(c.contactUrl){var ct=btn('\ud83d\udcac Contact Us',c.contactUrl);ct.onclick=function(){track('button_clicked','contact');};actions.appendChild(ct);} 
     var greet=timeGreeting();var g=c.greeting||c.welcomeMessage;addMsg(greet+(g?'! '+g:'!'),'bot');
     if(Array.isArray(c.quickReplies)) showQuickReplies(c.quickReplies);
-    send=function(){var text=ta.value.trim();if(!text)return;track('message_sent');logEvent('message','POST');addMsg(text,'user');m.scrollTop=m.scrollHeight;ta.value='';if(handleCommand(text)) return;pending=smartLinks(text);showTyping();
+    send=function(){var text=ta.value.trim();if(!text)return;track('message_sent');addMsg(text,'user');m.scrollTop=m.scrollHeight;ta.value='';if(handleCommand(text)) return;pending=smartLinks(text);showTyping();
         fetch(host+'/chat',{method:'POST',headers:{"Content-Type":"application/json","x-merchant-id":mid},body:JSON.stringify({message:text})}).then(function(r){if(!r.ok)throw new Error();return r.body.getReader();}).then(function(reader){var dec=new TextDecoder();var bot='';botDiv=null;function read(){reader.read().then(function(res){if(res.done){hideTyping();track('response_received');if(botDiv)handleBot(bot);return;}hideTyping();bot+=dec.decode(res.value,{stream:true});if(botDiv)botDiv.innerHTML=linkify(stripMd(bot));else{botDiv=addMsg(bot,'bot');}m.scrollTop=m.scrollHeight;read();});}read();}).catch(function(){hideTyping();addMsg('Error','bot');});}
     btnEl.onclick=send;
     ta.addEventListener('keydown',function(e){if(e.key==='Enter'&&!e.shiftKey){e.preventDefault();send();}});
     ta.addEventListener('input',function(){hint.style.display=ta.value.length<5?'block':'none';});
   }
 
+  if(boot && boot.config){
+    if(document.body) init(boot.config);
+    else document.addEventListener('DOMContentLoaded',function(){init(boot.config);});
+    return;
+  }
   fetch(host+'/merchant/config/'+encodeURIComponent(mid)).then(function(r){return r.json();}).then(init).catch(function(){init({});});
 })();
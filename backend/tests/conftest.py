@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy.orm import Session
+
+# The backend modules import each other by their flat names.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, Merchant, make_engine  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Session on a fresh, fully created database with merchant "m1"."""
+    engine = make_engine(str(tmp_path / "bots.db"), pool_size=1, max_overflow=0)
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine, expire_on_commit=False) as session:
+        session.add(Merchant(id="m1", email="m1@example.com", password_hash="x", api_key="k1", api_secret="s1"))
+        session.commit()
+        yield session
+    engine.dispose()
@@ -0,0 +1,129 @@
+"""Local stand-in for the Shopify GraphQL APIs used by shopify_sync.
+
+Serves cursor-paginated ``products`` for Storefront and Admin tokens,
+``productsCount``, a bulk operation whose result is a JSONL download with
+child (``__parentId``) lines, and scripted 429/THROTTLED responses.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def product_node(i: int, admin: bool) -> dict:
+    node = {
+        "handle": f"p{i}",
+        "title": f"Product {i}",
+        "description": f"Description {i}",
+        # Some products aren't on the online store; the client builds a link.
+        "onlineStoreUrl": None if i % 7 == 0 else f"https://shop.test/products/p{i}",
+        "featuredImage": {"url": f"https://cdn.test/{i}.jpg"},
+    }
+    node["priceRangeV2" if admin else "priceRange"] = {"minVariantPrice": {"amount": f"{i}.00"}}
+    return node
+
+
+class ShopifyStub:
+    """Threaded HTTP server; tweak the attributes to script failures."""
+
+    def __init__(self, products: int = 600):
+        self.products = products
+        # Status codes (429, 503...) returned before answering normally.
+        self.failures = []
+        self.retry_after = "3"
+        self.throttled = 0
+        self.bulk_polls_until_done = 2
+        self.bulk_status = "COMPLETED"
+        self.posts = []
+        self.bulk_downloads = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, payload, status: int = 200, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != "/bulk.jsonl":
+                    return self.send({}, 404)
+                stub.bulk_downloads.append(dict(self.headers))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.end_headers()
+                for i in range(stub.products):
+                    line = dict(product_node(i, True), id=f"gid://shopify/Product/{i}")
+                    self.wfile.write((json.dumps(line) + "\n").encode())
+                    child = {"id": f"gid://shopify/ProductVariant/{i}", "__parentId": line["id"]}
+                    self.wfile.write((json.dumps(child) + "\n").encode())
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                query, variables = body["query"], body.get("variables") or {}
+                admin = self.path.startswith("/admin/")
+                header = "X-Shopify-Access-Token" if admin else "X-Shopify-Storefront-Access-Token"
+                with stub.lock:
+                    stub.posts.append(query)
+                    failure = stub.failures.pop(0) if stub.failures else None
+                    throttled = stub.throttled > 0
+                    stub.throttled -= throttled
+                if not self.headers.get(header):
+                    return self.send({"errors": [{"message": "Unauthorized"}]}, 401)
+                if failure:
+                    return self.send({"errors": "busy"}, failure, {"Retry-After": stub.retry_after})
+                cost = {
+                    "requestedQueryCost": 252,
+                    "throttleStatus": {"maximumAvailable": 1000, "currentlyAvailable": 100, "restoreRate": 50},
+                }
+                extensions = {"cost": cost} if admin else {}
+                if throttled:
+                    error = {"message": "Throttled", "extensions": {"code": "THROTTLED"}}
+                    return self.send({"errors": [error], "extensions": extensions})
+                if "productsCount" in query:
+                    return self.send({"data": {"productsCount": {"count": stub.products}}, "extensions": extensions})
+                if "bulkOperationRunQuery" in query:
+                    op = {"id": "gid://shopify/BulkOperation/1", "status": "CREATED"}
+                    return self.send({"data": {"bulkOperationRunQuery": {"bulkOperation": op, "userErrors": []}}})
+                if "currentBulkOperation" in query:
+                    with stub.lock:
+                        stub.bulk_polls_until_done -= 1
+                        done = stub.bulk_polls_until_done <= 0
+                    op = {"id": "gid://shopify/BulkOperation/1", "status": "RUNNING", "url": None}
+                    if done:
+                        op.update(status=stub.bulk_status, objectCount=str(stub.products * 2))
+                        if stub.bulk_status == "COMPLETED":
+                            op["url"] = f"{stub.url}/bulk.jsonl"
+                    return self.send({"data": {"currentBulkOperation": op}})
+                start = int(variables.get("after") or 0)
+                end = min(start + variables["first"], stub.products)
+                page = {
+                    "pageInfo": {"hasNextPage": end < stub.products, "endCursor": str(end)},
+                    "edges": [{"node": product_node(i, admin)} for i in range(start, end)],
+                }
+                self.send({"data": {"products": page}, "extensions": extensions})
+
+        return Handler
@@ -0,0 +1,46 @@
+from catalog_sync import sync_catalog
+from models import Product
+
+
+def item(i, price="1.00", url=True):
+    return {"title": f"Item {i}", "price": price, "link": f"https://s.test/p/{i}" if url else None}
+
+
+def catalog(db):
+    return {(p.title, p.price) for p in db.query(Product).filter_by(merchant_id="m1")}
+
+
+def test_diff_across_chunks(db):
+    first = [item(i) for i in range(7)] + [item("a", url=False), item("b", url=False)]
+    assert sync_catalog(db, "m1", first, chunk_size=2) == (9, 0, 0, 0)
+    db.commit()
+
+    second = [item(i, "2.00" if i == 3 else "1.00") for i in range(1, 7)] + [item("a", url=False)]
+    assert sync_catalog(db, "m1", iter(second), chunk_size=2) == (0, 1, 2, 6)
+    db.commit()
+    assert ("Item 0", "1.00") not in catalog(db)
+    assert ("Item b", "1.00") not in catalog(db)
+    assert ("Item 3", "2.00") in catalog(db)
+    assert len(catalog(db)) == 7
+
+
+def test_incremental_sync_keeps_missing_products(db):
+    sync_catalog(db, "m1", [item(i) for i in range(5)], chunk_size=2)
+    assert sync_catalog(db, "m1", [item(9)], prune=False) == (1, 0, 0, 0)
+    db.commit()
+    assert len(catalog(db)) == 6
+
+
+def test_items_are_applied_chunk_by_chunk(db):
+    lag = []
+
+    def items():
+        for i in range(50):
+            stored = db.query(Product).filter_by(merchant_id="m1").count()
+            lag.append(i - stored)
+            yield item(i)
+
+    sync_catalog(db, "m1", items(), chunk_size=10)
+    # Each chunk is written before the next product is read.
+    assert max(lag) == 9
+    assert len(catalog(db)) == 50
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from jobs import JobQueue
+from models import Base, Job, make_engine
+
+
+@pytest.fixture
+def queue(tmp_path):
+    engine = make_engine(str(tmp_path / "bots.db"), pool_size=1, max_overflow=0)
+    Base.metadata.create_all(engine)
+    yield JobQueue(sessionmaker(bind=engine, expire_on_commit=False), workers=0)
+    engine.dispose()
+
+
+def payloads(queue):
+    with queue.session_factory() as db:
+        return [json.loads(j.payload) for j in db.query(Job).order_by(Job.id)]
+
+
+def test_newest_payload_wins_by_default(queue):
+    first = queue.enqueue("sync", "m1", {"source": "crawl"}, dedupe_key="sync:m1")
+    second = queue.enqueue("sync", "m1", {"source": "store"}, dedupe_key="sync:m1")
+    assert first["id"] == second["id"]
+    assert payloads(queue) == [{"source": "store"}]
+
+
+def test_replace_keeps_queued_payload(queue):
+    def bigger(queued, requested):
+        return requested["n"] >= queued["n"]
+
+    queue.enqueue("sync", "m1", {"n": 2}, dedupe_key="sync:m1", replace=bigger)
+    queue.enqueue("sync", "m1", {"n": 1}, dedupe_key="sync:m1", replace=bigger)
+    assert payloads(queue) == [{"n": 2}]
+    queue.enqueue("sync", "m1", {"n": 3}, dedupe_key="sync:m1", replace=bigger)
+    assert payloads(queue) == [{"n": 3}]
+    assert queue.counts["coalesced"] == 2
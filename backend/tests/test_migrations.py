@@ -0,0 +1,70 @@
+import pytest
+
+from migrations import HOT_QUERIES, MIGRATIONS, check_query_plans, run_migrations, schema_version
+from models import Base, make_engine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = make_engine(str(tmp_path / "bots.db"), pool_size=1, max_overflow=0)
+    yield eng
+    eng.dispose()
+
+
+def baseline(engine, version: int, *statements):
+    with engine.begin() as conn:
+        for sql in statements:
+            conn.exec_driver_sql(sql)
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+
+
+def test_fresh_db_reaches_latest_version(engine):
+    Base.metadata.create_all(bind=engine)
+    assert run_migrations(engine) == len(MIGRATIONS)
+    with engine.connect() as conn:
+        assert schema_version(conn) == len(MIGRATIONS)
+
+
+def test_hot_queries_use_indexes(engine):
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    results = check_query_plans(engine)
+    assert set(results) == set(HOT_QUERIES)
+    for name, (ok, plan) in results.items():
+        assert ok, f"{name}: {'; '.join(plan)}"
+        assert not any("TEMP B-TREE" in step for step in plan), name
+
+
+def test_product_dedupe_keeps_latest_and_rows_without_url(engine):
+    baseline(
+        engine,
+        1,
+        "CREATE TABLE merchant_products (id VARCHAR PRIMARY KEY, merchant_id VARCHAR, title VARCHAR,"
+        " description TEXT, price VARCHAR, image_url VARCHAR, url VARCHAR, scraped_at DATETIME)",
+        "INSERT INTO merchant_products (id, merchant_id, title, url, scraped_at) VALUES"
+        " ('1', 'm1', 'a', NULL, NULL), ('2', 'm1', 'b', NULL, NULL),"
+        " ('4', 'm1', 'c', 'https://s/c', '2024-02-01 00:00:00'),"
+        " ('3', 'm1', 'c again', 'https://s/c', '2024-01-01 00:00:00'),"
+        " ('5', 'm2', 'c', 'https://s/c', NULL), ('6', 'm1', 'd', 'https://s/d', NULL),"
+        " ('7', 'm1', 'd again', 'https://s/d', NULL)",
+    )
+    run_migrations(engine)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT id FROM merchant_products ORDER BY id").fetchall()
+    # The latest scrape wins; without one, the last inserted row.
+    assert [r[0] for r in rows] == ["1", "2", "4", "5", "7"]
+
+
+def test_usage_dedupe_sums_duplicates(engine):
+    baseline(
+        engine,
+        0,
+        "CREATE TABLE merchant_usage (id INTEGER PRIMARY KEY, merchant_id VARCHAR, month VARCHAR,"
+        " tokens INTEGER, requests INTEGER)",
+        "INSERT INTO merchant_usage (merchant_id, month, tokens, requests) VALUES"
+        " ('m1', '2024-01', 10, 1), ('m1', '2024-01', 5, NULL), ('m1', NULL, 7, 1), ('m1', NULL, 8, 1)",
+    )
+    run_migrations(engine)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT month, tokens, requests FROM merchant_usage ORDER BY id").fetchall()
+    assert [tuple(r) for r in rows] == [("2024-01", 15, 1), (None, 7, 1), (None, 8, 1)]
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from quota import QuotaEngine
+
+
+class Meter:
+    def pending(self, merchant_id, month):
+        return (0,)
+
+    def pending_credits(self, merchant_id):
+        return 0
+
+
+def entitlements(merchant_id, used=0, limit=1000):
+    return SimpleNamespace(
+        merchant=SimpleNamespace(id=merchant_id),
+        month="2024-01",
+        token_limit=limit,
+        credit_tokens=0,
+        usage_tokens=used,
+    )
+
+
+def test_admission_checks_leave_no_reservations():
+    quota = QuotaEngine(Meter())
+    for i in range(5):
+        assert quota.has_headroom(entitlements(f"m{i}"))
+    assert quota.stats()["openReservations"] == 0
+
+
+def test_concurrent_reservations_must_fit():
+    quota = QuotaEngine(Meter(), default_estimate=300)
+    ent = entitlements("m1", used=500)
+    first = quota.reserve(ent)
+    assert first is not None
+    assert quota.reserve(ent) is None
+    quota.release(first, 120)
+    assert quota.stats() == {"reservedTokens": 0, "openReservations": 0, "denied": 1}
+    # A lone request is admitted whenever any headroom is left.
+    assert quota.reserve(entitlements("m1", used=999)) is not None
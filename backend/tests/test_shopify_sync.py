@@ -0,0 +1,95 @@
+import pytest
+
+from catalog_sync import sync_catalog
+from models import Product
+from shopify_sync import ShopifyClient, ShopifyError
+from shopify_stub import ShopifyStub
+
+
+@pytest.fixture
+def stub():
+    server = ShopifyStub(products=600).start()
+    yield server
+    server.stop()
+
+
+def client(stub, token="storefront-token", **kwargs):
+    sleeps = []
+    return ShopifyClient(stub.url, token, sleep=sleeps.append, **kwargs), sleeps
+
+
+def test_storefront_follows_cursors(stub):
+    shop, sleeps = client(stub)
+    products = list(shop.iter_products())
+    assert len(products) == 600
+    assert len({p["link"] for p in products}) == 600
+    # 250 per page: three requests, no count or bulk queries.
+    assert len(stub.posts) == 3
+    assert products[0] == {
+        "title": "Product 0",
+        "description": "Description 0",
+        "price": "0.00",
+        "link": f"{stub.url}/products/p0",
+        "image_url": "https://cdn.test/0.jpg",
+    }
+    assert products[1]["link"] == "https://shop.test/products/p1"
+    assert sleeps == []
+
+
+def test_retries_429_and_5xx_after_retry_after(stub):
+    stub.failures = [429, 503]
+    shop, sleeps = client(stub)
+    assert len(list(shop.iter_products())) == 600
+    assert sleeps == [3.0, 3.0]
+    assert shop.throttled == 2
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.failures = [429] * 10
+    shop, sleeps = client(stub, max_retries=2)
+    with pytest.raises(ShopifyError):
+        list(shop.iter_products())
+    assert len(sleeps) == 3
+
+
+def test_admin_pages_wait_for_query_cost(stub):
+    stub.throttled = 1
+    shop, sleeps = client(stub, token="shpat_test", bulk_threshold=1000)
+    assert len(list(shop.iter_products())) == 600
+    assert not any("bulkOperationRunQuery" in q for q in stub.posts)
+    # Only 100 of the 252 points a page costs are available: wait (252 - 100) / 50.
+    assert sleeps and all(s == pytest.approx(3.04) for s in sleeps)
+
+
+def test_admin_bulk_export_streams_products(stub):
+    shop, sleeps = client(stub, token="shpat_test", bulk_threshold=500)
+    products = list(shop.iter_products())
+    assert len(products) == 600
+    assert all(p["title"] for p in products)
+    assert any("bulkOperationRunQuery" in q for q in stub.posts)
+    assert not any("products(first" in q for q in stub.posts)
+    # The signed download URL is fetched without the shop's token.
+    assert len(stub.bulk_downloads) == 1
+    assert "X-Shopify-Access-Token" not in stub.bulk_downloads[0]
+
+
+def test_failed_bulk_export_raises(stub):
+    stub.bulk_status = "FAILED"
+    shop, _ = client(stub, token="shpat_test", bulk_threshold=500)
+    with pytest.raises(ShopifyError, match="failed"):
+        list(shop.iter_products())
+
+
+def test_sync_catalog_from_bulk_export(stub, db):
+    shop, _ = client(stub, token="shpat_test", bulk_threshold=500)
+    summary = sync_catalog(db, "m1", shop.iter_products(), chunk_size=100)
+    db.commit()
+    assert summary == (600, 0, 0, 0)
+    assert db.query(Product).filter_by(merchant_id="m1").count() == 600
+
+    stub.products = 550
+    stub.bulk_polls_until_done = 1
+    summary = sync_catalog(db, "m1", shop.iter_products(), chunk_size=100)
+    db.commit()
+    assert summary == (0, 0, 50, 550)
+    assert db.query(Product).filter_by(merchant_id="m1").count() == 550
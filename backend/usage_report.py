@@ -0,0 +1,122 @@
+"""Usage reports read from merchant_usage_rollups.
+
+Every query filters the rollups on an indexed (period, bucket) range, so a
+report costs the same however many months of history a merchant has. Plans
+come from a single join over each merchant's latest subscription.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, select
+
+from models import Plan, SessionLocal, Subscription, UsageRollup
+from sharding import merchant_session, router
+
+PERIODS = ("day", "month")
+
+
+def bucket_for(period: str, when: datetime) -> str:
+    return when.strftime("%Y-%m-%d" if period == "day" else "%Y-%m")
+
+
+def since_bucket(period: str, count: int, now: datetime = None) -> str:
+    """Bucket ``count - 1`` days or months before ``now``'s bucket."""
+    now = now or datetime.utcnow()
+    if period == "day":
+        return bucket_for(period, now - timedelta(days=count - 1))
+    months = now.year * 12 + now.month - 1 - (count - 1)
+    return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+
+def rollup_dict(r) -> dict:
+    return {
+        "bucket": r.bucket,
+        "tokens": r.tokens,
+        "requests": r.requests,
+        "faqHits": r.faq_hits,
+        "llmCalls": r.llm_calls,
+    }
+
+
+def plans_by_merchant():
+    """{merchant_id: (plan name, token limit)} from each latest subscription."""
+    latest = (
+        select(Subscription.merchant_id, func.max(Subscription.start_date).label("start_date"))
+        .group_by(Subscription.merchant_id)
+        .subquery()
+    )
+    stmt = (
+        select(Subscription.merchant_id, Plan.name, Plan.token_limit)
+        .join(
+            latest,
+            and_(
+                Subscription.merchant_id == latest.c.merchant_id,
+                Subscription.start_date == latest.c.start_date,
+            ),
+        )
+        .outerjoin(Plan, Plan.id == Subscription.plan_id)
+    )
+    with SessionLocal() as db:
+        return {mid: (name, limit) for mid, name, limit in db.execute(stmt)}
+
+
+def rollups_for_bucket(period: str, since: str, until: str = None):
+    """Rollup rows of every merchant with ``since <= bucket <= until``."""
+    rows = []
+    for db in router.all_sessions():
+        with db:
+            q = db.query(UsageRollup).filter(UsageRollup.period == period, UsageRollup.bucket >= since)
+            if until is not None:
+                q = q.filter(UsageRollup.bucket <= until)
+            rows.extend(q.all())
+    return rows
+
+
+def current_usage(month: str):
+    """This month's usage and plan per merchant, for /usage."""
+    plans = plans_by_merchant()
+    merchants = {}
+    for r in rollups_for_bucket("month", month, month):
+        name, limit = plans.get(r.merchant_id, (None, None))
+        merchants[r.merchant_id] = {
+            "plan": name or "start",
+            "tokensUsed": r.tokens,
+            "tokenLimit": limit if limit is not None and limit >= 0 else None,
+            "month": r.bucket,
+            "requests": r.requests,
+            "faqHits": r.faq_hits,
+            "llmCalls": r.llm_calls,
+        }
+    return merchants
+
+
+def merchant_history(merchant_id: str, period: str, since: str):
+    """One merchant's rollups from ``since`` on, oldest first."""
+    with merchant_session(merchant_id) as db:
+        rows = (
+            db.query(UsageRollup)
+            .filter(
+                UsageRollup.merchant_id == merchant_id,
+                UsageRollup.period == period,
+                UsageRollup.bucket >= since,
+            )
+            .order_by(UsageRollup.bucket)
+            .all()
+        )
+    return [rollup_dict(r) for r in rows]
+
+
+def totals_by_bucket(period: str, since: str):
+    """Usage summed over all merchants per bucket, oldest first."""
+    totals = {}
+    for r in rollups_for_bucket(period, since):
+        t = totals.get(r.bucket)
+        if t is None:
+            t = totals[r.bucket] = {
+                "bucket": r.bucket, "tokens": 0, "requests": 0, "faqHits": 0, "llmCalls": 0, "merchants": 0,
+            }
+        t["tokens"] += r.tokens
+        t["requests"] += r.requests
+        t["faqHits"] += r.faq_hits
+        t["llmCalls"] += r.llm_calls
+        t["merchants"] += 1
+    return [totals[b] for b in sorted(totals)]
@@ -0,0 +1,188 @@
+"""Minified, fingerprinted and precompressed widget assets.
+
+Assets are built once at startup: each file is minified, named after a
+hash of its contents and compressed to gzip (and brotli when the Brotli
+package is installed). Hashed URLs are cached forever by browsers and
+CDNs; the stable ``/widget/seep-widget.js`` loader URL serves the current
+build with a short max-age so existing embeds pick up new releases.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+WIDGET_FILES = {
+    "seep-widget.js": "application/javascript",
+    "seep-style.css": "text/css",
+}
+
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+CSS_SPACE_RE = re.compile(r"\s+")
+CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+
+BuiltAsset = namedtuple("BuiltAsset", ["name", "hashed_name", "mimetype", "etag", "variants"])
+
+
+def minify_css(text: str) -> str:
+    text = CSS_COMMENT_RE.sub("", text)
+    text = CSS_SPACE_RE.sub(" ", text)
+    text = CSS_PUNCT_RE.sub(r"\1", text)
+    return text.replace(": ", ":").replace(";}", "}").strip()
+
+
+def minify_js(text: str) -> str:
+    """Drop indentation, blank lines and whole-line comments.
+
+    Line breaks are kept so automatic semicolon insertion still behaves.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def compress(body: bytes):
+    """Return {encoding: bytes} for identity, gzip and (if available) br."""
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+def negotiate(accept_encodings, variants) -> str:
+    """Pick the smallest variant the client accepts (a werkzeug Accept)."""
+    for encoding in ("br", "gzip"):
+        if encoding in variants and accept_encodings[encoding]:
+            return encoding
+    return "identity"
+
+
+def hashed_filename(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+class WidgetAssets:
+    """Build the widget files and look them up by stable or hashed name."""
+
+    def __init__(self, static_dir: str = STATIC_DIR, watch: bool = False):
+        self.static_dir = static_dir
+        # Rebuild when the source files change (development only).
+        self.watch = watch
+        self.lock = threading.Lock()
+        self.assets = {}
+        self.by_hash = {}
+        self.mtimes = {}
+        self.build()
+
+    def _source_mtimes(self):
+        return {name: os.path.getmtime(os.path.join(self.static_dir, name)) for name in WIDGET_FILES}
+
+    def _build_one(self, name: str, text: str) -> BuiltAsset:
+        mimetype = WIDGET_FILES[name]
+        text = minify_css(text) if mimetype == "text/css" else minify_js(text)
+        body = text.encode()
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        return BuiltAsset(name, hashed_filename(name, digest), mimetype, digest, compress(body))
+
+    def build(self):
+        """Minify, fingerprint and compress every widget file."""
+        sources = {}
+        for name in WIDGET_FILES:
+            with open(os.path.join(self.static_dir, name), encoding="utf-8") as f:
+                sources[name] = f.read()
+        style = self._build_one("seep-style.css", sources["seep-style.css"])
+        # Point the script at the fingerprinted stylesheet before hashing it.
+        script_src = sources["seep-widget.js"].replace(
+            "'/widget/seep-style.css'", f"'/widget/{style.hashed_name}'"
+        )
+        script = self._build_one("seep-widget.js", script_src)
+        with self.lock:
+            self.assets = {style.name: style, script.name: script}
+            self.by_hash = {a.hashed_name: a for a in self.assets.values()}
+            self.mtimes = self._source_mtimes()
+
+    def _maybe_rebuild(self):
+        if self.watch and self._source_mtimes() != self.mtimes:
+            self.build()
+
+    def get(self, name: str):
+        """Look up an asset by stable name ('seep-widget.js')."""
+        self._maybe_rebuild()
+        with self.lock:
+            return self.assets.get(name)
+
+    def get_hashed(self, hashed_name: str):
+        """Look up an asset by fingerprinted name ('seep-widget.<hash>.js')."""
+        self._maybe_rebuild()
+        with self.lock:
+            return self.by_hash.get(hashed_name)
+
+    def url(self, name: str) -> str:
+        return f"/widget/{self.get(name).hashed_name}"
+
+    def stats(self):
+        with self.lock:
+            return {
+                a.name: {enc: len(body) for enc, body in a.variants.items()}
+                for a in self.assets.values()
+            }
+
+
+class BootstrapBundles:
+    """Per-merchant widget script with the public config inlined.
+
+    Bundles are keyed by the script hash plus the config payload's ETag, so
+    a settings change (which rebuilds the config payload) or a new widget
+    build produces a new bundle without explicit invalidation.
+    """
+
+    def __init__(self, assets: WidgetAssets, max_entries: int = 10000):
+        self.assets = assets
+        self.max_entries = max_entries
+        self.bundles = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, merchant_id: str, config) -> BuiltAsset:
+        """Return the bundle for ``config`` (a widget_config ConfigPayload)."""
+        script = self.assets.get("seep-widget.js")
+        etag = f"{script.etag}.{config.etag[:12]}"
+        with self.lock:
+            bundle = self.bundles.get(merchant_id)
+            if bundle is not None and bundle.etag == etag:
+                self.bundles.move_to_end(merchant_id)
+                self.hits += 1
+                return bundle
+            self.misses += 1
+        boot = b'window.__seepBootstrap={"merchantId":%s,"config":%s};\n' % (
+            json.dumps(merchant_id).encode(),
+            config.body,
+        )
+        body = boot + script.variants["identity"]
+        bundle = BuiltAsset("bootstrap.js", None, script.mimetype, etag, compress(body))
+        with self.lock:
+            self.bundles[merchant_id] = bundle
+            self.bundles.move_to_end(merchant_id)
+            while len(self.bundles) > self.max_entries:
+                self.bundles.popitem(last=False)
+        return bundle
+
+    def invalidate(self, merchant_id: str = None):
+        with self.lock:
+            if merchant_id is None:
+                self.bundles.clear()
+            else:
+                self.bundles.pop(merchant_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.bundles), "hits": self.hits, "misses": self.misses}
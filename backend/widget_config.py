@@ -0,0 +1,70 @@
+"""Precomputed public widget config payloads served with strong ETags."""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+# Only what the storefront widget renders; credentials never leave the dashboard.
+PUBLIC_CONFIG_FIELDS = (
+    "welcomeMessage",
+    "greeting",
+    "color",
+    "cartUrl",
+    "checkoutUrl",
+    "contactUrl",
+    "trackLink",
+    "returnsLink",
+    "supportLink",
+    "suggestProducts",
+)
+
+ConfigPayload = namedtuple("ConfigPayload", ["body", "etag", "built_at"])
+
+
+class WidgetConfigCache:
+    """Serialize each merchant's public config once and reuse the bytes.
+
+    ``build(merchant_id)`` returns the full config dict; it is filtered to
+    PUBLIC_CONFIG_FIELDS and rebuilt only after invalidate() or ``ttl``
+    seconds (so settings saved on another worker show up). The ETag is a
+    hash of the body, so every worker and CDN agrees on it.
+    """
+
+    def __init__(self, build, ttl: float = 60.0):
+        self.build = build
+        self.ttl = ttl
+        self.payloads = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, merchant_id: str) -> ConfigPayload:
+        with self.lock:
+            payload = self.payloads.get(merchant_id)
+            if payload and time.monotonic() - payload.built_at < self.ttl:
+                self.hits += 1
+                return payload
+            self.misses += 1
+            generation = self.generation
+        data = self.build(merchant_id)
+        public = {k: data[k] for k in PUBLIC_CONFIG_FIELDS if k in data}
+        body = json.dumps(public, sort_keys=True, separators=(",", ":")).encode()
+        payload = ConfigPayload(body, hashlib.sha1(body).hexdigest(), time.monotonic())
+        with self.lock:
+            if generation == self.generation:
+                self.payloads[merchant_id] = payload
+        return payload
+
+    def invalidate(self, merchant_id: str = None):
+        with self.lock:
+            self.generation += 1
+            if merchant_id is None:
+                self.payloads.clear()
+            else:
+                self.payloads.pop(merchant_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.payloads), "hits": self.hits, "misses": self.misses}
@@ -155,6 +155,16 @@ export default function Dashboard() {
     try {
       const res = await fetch(`${API_BASE}/products/${merchantId}`, { method: 'POST' });
       if (!res.ok) throw new Error('sync');
+      const { job } = await res.json();
+      // The sync runs in the background job queue; wait for it to finish.
+      let status = job ? job.status : 'done';
+      while (job && (status === 'queued' || status === 'running')) {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobRes = await fetch(`${API_BASE}/jobs/${job.id}`);
+        if (!jobRes.ok) throw new Error('sync');
+        status = (await jobRes.json()).status;
+      }
+      if (status === 'failed') throw new Error('sync');
       await fetchProductList();
     } catch (err) {
       console.error('Sync products error:', err);
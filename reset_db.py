@@ -1,6 +1,6 @@
 import os
+import shutil
 import sys
-import sqlite3
 import uuid
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
@@ -10,19 +10,7 @@ BASE_DIR = os.path.dirname(__file__)
 BACKEND_DIR = os.path.join(BASE_DIR, "backend")
 sys.path.append(BACKEND_DIR)
 
-from models import DB_PATH, init_db, SessionLocal, Merchant, Plan, Subscription
-
-
-def init_sqlite_tables():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "CREATE TABLE IF NOT EXISTS bots (name TEXT PRIMARY KEY, welcome_message TEXT)"
-    )
-    conn.execute(
-        "CREATE TABLE IF NOT EXISTS faqs (id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT UNIQUE, answer TEXT)"
-    )
-    conn.commit()
-    conn.close()
+from models import DB_PATH, SHARD_DIR, SNAPSHOT_DIR, init_db, SessionLocal, Merchant, Plan, Subscription
 
 
 def add_default_merchant():
@@ -59,10 +47,12 @@ def add_default_merchant():
 
 
 def main():
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
     init_db()
-    init_sqlite_tables()
     add_default_merchant()
     print(f"Database reset complete. New database at {DB_PATH}")
 